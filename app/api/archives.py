@@ -0,0 +1,70 @@
+import os
+import tarfile
+import zipfile
+import threading
+
+# Archives whose members can be read without unpacking anything else: ZIPs
+# through their central directory, plain TARs at their data offsets
+SERVABLE_SUFFIXES = ('.zip', '.tar')
+# Compressed TARs can only be read front to back, so a member deep in one
+# cannot be served without decompressing everything before it
+COMPRESSED_TAR_SUFFIXES = ('.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+# archive path -> (size and mtime, {member: (data offset, size)})
+_tar_indexes = {}
+_lock = threading.Lock()
+
+
+class UnservableArchive(ValueError):
+    """The archive's members cannot be read at random (a compressed TAR)"""
+
+
+def resolve_archive(pdf_directory, archive_name):
+    """
+    Path of an archive under pdf_directory, or None if archive_name leaves the
+    directory or does not name an archive.
+    """
+    if not archive_name.lower().endswith(SERVABLE_SUFFIXES + COMPRESSED_TAR_SUFFIXES):
+        return None
+    root = os.path.realpath(pdf_directory)
+    path = os.path.realpath(os.path.join(root, archive_name))
+    if not path.startswith(root + os.sep):
+        return None
+    return path
+
+
+def _member_offsets(tar_path):
+    """Data offset and size of every file in a plain TAR; only the headers are read"""
+    with tarfile.open(tar_path, mode='r:') as archive:
+        return {member.name: (member.offset_data, member.size) for member in archive if member.isfile()}
+
+
+def read_archive_member(archive_path, member_name):
+    """
+    Read one PDF out of a ZIP or uncompressed TAR without unpacking the rest.
+
+    ZIPs are read through their central directory. TARs are indexed once
+    per archive version (size and mtime) and members are then read at their
+    offsets. Raises KeyError for members the archive does not hold and
+    UnservableArchive for compressed TARs.
+    """
+    lower = archive_path.lower()
+    if lower.endswith('.zip'):
+        with zipfile.ZipFile(archive_path) as archive:
+            return archive.read(member_name)
+    if not lower.endswith('.tar'):
+        raise UnservableArchive(f"Members of compressed TARs cannot be served: {os.path.basename(archive_path)}")
+
+    stat = os.stat(archive_path)
+    stamp = (stat.st_size, stat.st_mtime_ns)
+    with _lock:
+        entry = _tar_indexes.get(archive_path)
+    if entry is None or entry[0] != stamp:
+        # Built outside the lock so one large archive does not hold up requests for others
+        entry = (stamp, _member_offsets(archive_path))
+        with _lock:
+            _tar_indexes[archive_path] = entry
+    offset, size = entry[1][member_name]
+    with open(archive_path, 'rb') as f:
+        f.seek(offset)
+        return f.read(size)
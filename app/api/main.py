@@ -1,14 +1,17 @@
 from fastapi import FastAPI, HTTPException, Request, Depends, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, FileResponse, Response
 from elasticsearch import Elasticsearch, helpers
 from pydantic import BaseModel
 import os
 from urllib.parse import unquote
 from typing import List, Optional
 import time
+from functools import wraps
 from fastapi.security import OAuth2PasswordRequestForm
 import auth
+import semantic
+import archives
 from datetime import timedelta
 
 # Create the FastAPI app
@@ -74,7 +77,21 @@ def init_elasticsearch():
                             "title": { "type": "text" },
                             "content": { "type": "text" },
                             "file_path": { "type": "keyword" },
-                            "uploaded_at": { "type": "date" }
+                            "uploaded_at": { "type": "date" },
+                            "doc_type": { "type": "keyword" },
+                            "parent_id": { "type": "keyword" },
+                            "page_number": { "type": "integer" },
+                            "page_start": { "type": "integer" },
+                            "page_end": { "type": "integer" },
+                            "chunk_index": { "type": "integer" },
+                            "page_count": { "type": "integer" },
+                            "dup_cluster": { "type": "keyword" },
+                            "dup_count": { "type": "integer" },
+                            "aliases": { "type": "keyword" },
+                            "email_from": { "type": "keyword" },
+                            "email_to": { "type": "keyword" },
+                            "email_subject": { "type": "text" },
+                            "message_count": { "type": "integer" }
                         }
                     },
                     "settings": {
@@ -105,6 +122,13 @@ class SearchQuery(BaseModel):
     query: str
     page: int = 1
     size: int = 50  # We'll keep this but ignore it from the request
+    collapse: bool = True  # Group page/chunk hits by their parent document
+    collapse_duplicates: bool = False  # Show one result per near-duplicate cluster
+
+class SemanticSearchQuery(BaseModel):
+    query: str
+    page: int = 1
+    hybrid: bool = True  # Fuse the nearest neighbours with the BM25 ranking
 
 class BulkIndexRequest(BaseModel):
     documents: List[dict]
@@ -135,6 +159,160 @@ async def list_routes():
         })
     return {"routes": routes}
 
+# Index checks change only when the index is re-ingested, so their results are
+# kept for this many seconds instead of costing two extra requests per search
+INDEX_CHECK_TTL = float(os.environ.get('INDEX_CHECK_TTL', 60))
+# (check, index name) -> (checked at, result)
+_index_checks = {}
+
+def cached_index_check(check):
+    """Cache a check's result per index for INDEX_CHECK_TTL seconds"""
+    @wraps(check)
+    def wrapper(index_name):
+        key = (check.__name__, index_name)
+        entry = _index_checks.get(key)
+        if entry is None or time.monotonic() - entry[0] >= INDEX_CHECK_TTL:
+            entry = _index_checks[key] = (time.monotonic(), check(index_name))
+        return entry[1]
+    return wrapper
+
+@cached_index_check
+def is_parent_linked(index_name):
+    """Check whether the index holds page/chunk documents linked by parent_id"""
+    mapping = es.indices.get_mapping(index=index_name)
+    properties = mapping.get(index_name, {}).get("mappings", {}).get("properties", {})
+    if "parent_id" not in properties:
+        return False
+    chunked = es.count(
+        index=index_name,
+        body={"query": {"terms": {"doc_type": ["page", "chunk"]}}}
+    )
+    return chunked["count"] > 0
+
+@cached_index_check
+def has_dup_clusters(index_name):
+    """Check whether the ingester assigned near-duplicate clusters in this index"""
+    mapping = es.indices.get_mapping(index=index_name)
+    properties = mapping.get(index_name, {}).get("mappings", {}).get("properties", {})
+    if "dup_cluster" not in properties:
+        return False
+    clustered = es.count(
+        index=index_name,
+        body={"query": {"exists": {"field": "dup_cluster"}}}
+    )
+    return clustered["count"] > 0
+
+def matching_pages(hit):
+    """Collect the page numbers of the page/chunk hits grouped under a parent"""
+    pages = set()
+    parent_id = hit["_source"].get("parent_id")
+    for page_hit in hit.get("inner_hits", {}).get("pages", {}).get("hits", {}).get("hits", []):
+        source = page_hit["_source"]
+        # A duplicate cluster groups several PDFs; only report pages of the one shown
+        if source.get("parent_id", parent_id) != parent_id:
+            continue
+        start = source.get("page_start", source.get("page_number"))
+        end = source.get("page_end", start)
+        if start is not None:
+            pages.update(range(start, (end or start) + 1))
+    return sorted(pages)
+
+def search_collapsed(search_query: SearchQuery, page_size: int, collapse_field: str = "parent_id"):
+    """Search page/chunk documents and return one result per parent document.
+
+    With collapse_field="dup_cluster" there is one result per near-duplicate
+    cluster instead, showing the best-scoring PDF of the cluster.
+    """
+    query = {
+        "bool": {
+            "must": {
+                "multi_match": {
+                    "query": search_query.query,
+                    "fields": ["title", "content"],
+                    "operator": "or",
+                    "minimum_should_match": "75%"
+                }
+            },
+            "must_not": {"term": {"doc_type": "parent"}}
+        }
+    }
+
+    # Hit counts are per page/chunk, so count distinct parents (or clusters) instead
+    count_result = es.search(
+        index="pdf_documents",
+        body={
+            "query": query,
+            "size": 0,
+            "aggs": {"parents": {"cardinality": {"field": collapse_field}}}
+        }
+    )
+    total_docs = count_result["aggregations"]["parents"]["value"]
+    if total_docs == 0:
+        return {
+            "pagination": {
+                "current_page": 1,
+                "total_pages": 1,
+                "page_size": page_size,
+                "total_documents": 0,
+                "returned_documents": 0
+            },
+            "results": []
+        }
+
+    total_pages = (total_docs + page_size - 1) // page_size
+    current_page = min(max(1, search_query.page), total_pages)
+    from_idx = (current_page - 1) * page_size
+
+    result = es.search(
+        index="pdf_documents",
+        body={
+            "query": query,
+            "collapse": {
+                "field": collapse_field,
+                "inner_hits": {
+                    "name": "pages",
+                    "size": 10,
+                    "_source": ["parent_id", "page_number", "page_start", "page_end"],
+                    "sort": [{"_score": "desc"}]
+                }
+            },
+            "highlight": {
+                "fields": {
+                    "title": {"number_of_fragments": 0},
+                    "content": {
+                        "number_of_fragments": 3,
+                        "fragment_size": 150
+                    }
+                }
+            },
+            "from": from_idx,
+            "size": page_size
+        }
+    )
+
+    hits = result['hits']['hits']
+    return {
+        "pagination": {
+            "current_page": current_page,
+            "total_pages": total_pages,
+            "page_size": len(hits),
+            "total_documents": total_docs,
+            "returned_documents": len(hits)
+        },
+        "results": [{
+            "title": hit["_source"].get("title", ""),
+            "content": hit["_source"].get("content", ""),
+            "file_name": os.path.basename(hit["_source"].get("file_path", "")),
+            "file_url": hit["_source"].get("file_path", ""),
+            "highlights": hit.get("highlight", {}),
+            "score": hit["_score"],
+            "parent_id": hit["_source"].get("parent_id"),
+            "pages": matching_pages(hit),
+            "dup_cluster": hit["_source"].get("dup_cluster"),
+            "duplicate_count": hit["_source"].get("dup_count", 1) - 1
+        } for hit in hits]
+    }
+
 @app.post("/api/search")
 async def search_pdfs(search_query: SearchQuery, current_user: Optional[str] = Depends(auth.get_current_user)):
     # No authentication required for search
@@ -170,6 +348,11 @@ async def search_pdfs(search_query: SearchQuery, current_user: Optional[str] = D
         current_page = max(1, search_query.page)
         
         try:
+            if search_query.collapse_duplicates and has_dup_clusters("pdf_documents"):
+                return search_collapsed(search_query, page_size, collapse_field="dup_cluster")
+            if search_query.collapse and is_parent_linked("pdf_documents"):
+                return search_collapsed(search_query, page_size)
+
             # First get total count with same query as search
             count_result = es.count(
                 index="pdf_documents",
@@ -260,7 +443,8 @@ async def search_pdfs(search_query: SearchQuery, current_user: Optional[str] = D
                     "file_name": os.path.basename(hit["_source"].get("file_path", "")),
                     "file_url": hit["_source"].get("file_path", ""),
                     "highlights": hit.get("highlight", {}),
-                    "score": hit["_score"]
+                    "score": hit["_score"],
+                    "duplicate_count": hit["_source"].get("dup_count", 1) - 1
                 } for hit in hits]
             }
         except Exception as es_error:
@@ -288,6 +472,113 @@ async def search_pdfs(search_query: SearchQuery, current_user: Optional[str] = D
             detail=f"Search error: {str(e)}"
         )
 
+def bm25_ranking(query: str, size: int):
+    """PDF ids of the best BM25 matches, best first, with the highlights of each PDF's best hit"""
+    result = es.search(
+        index="pdf_documents",
+        body={
+            "query": {
+                "bool": {
+                    "must": {
+                        "multi_match": {
+                            "query": query,
+                            "fields": ["title", "content"],
+                            "operator": "or",
+                            "minimum_should_match": "75%"
+                        }
+                    },
+                    "must_not": {"term": {"doc_type": "parent"}}
+                }
+            },
+            "_source": ["parent_id"],
+            "highlight": {
+                "fields": {
+                    "title": {"number_of_fragments": 0},
+                    "content": {"number_of_fragments": 3, "fragment_size": 150}
+                }
+            },
+            "size": size
+        }
+    )
+    ranking = []
+    highlights = {}
+    for hit in result["hits"]["hits"]:
+        # Page and chunk hits stand for their PDF, whose id the vector index uses
+        doc_id = hit["_source"].get("parent_id", hit["_id"])
+        if doc_id not in highlights:
+            ranking.append(doc_id)
+            highlights[doc_id] = hit.get("highlight", {})
+    return ranking, highlights
+
+@app.post("/api/semantic-search")
+async def semantic_search_pdfs(search_query: SemanticSearchQuery, current_user: Optional[str] = Depends(auth.get_current_user)):
+    """Nearest documents to the query's embedding, optionally fused with BM25 by reciprocal rank fusion"""
+    if not es:
+        raise HTTPException(
+            status_code=503,
+            detail="Elasticsearch connection not available"
+        )
+    index = semantic.get_index()
+    if index is None:
+        raise HTTPException(
+            status_code=503,
+            detail="No vector index found; build it with make vector-index"
+        )
+    if not semantic.can_encode(index):
+        raise HTTPException(
+            status_code=503,
+            detail="Semantic search requires sentence-transformers" if index.backend == 'torch'
+            else "Semantic search requires onnxruntime and tokenizers"
+        )
+
+    page_size = 50
+    try:
+        neighbours = index.search(semantic.encode_query(search_query.query, index), semantic.CANDIDATES)
+        similarity = dict(neighbours)
+        highlights = {}
+        if search_query.hybrid:
+            bm25_ids, highlights = bm25_ranking(search_query.query, semantic.CANDIDATES)
+            ranked = semantic.reciprocal_rank_fusion([[doc_id for doc_id, _ in neighbours], bm25_ids])
+        else:
+            ranked = neighbours
+
+        total_docs = len(ranked)
+        total_pages = max(1, (total_docs + page_size - 1) // page_size)
+        current_page = min(max(1, search_query.page), total_pages)
+        from_idx = (current_page - 1) * page_size
+        page = ranked[from_idx:from_idx + page_size]
+
+        docs = es.mget(index="pdf_documents", body={"ids": [doc_id for doc_id, _ in page]})["docs"] if page else []
+        results = [{
+            "title": doc["_source"].get("title", ""),
+            "content": doc["_source"].get("content", ""),
+            "file_name": os.path.basename(doc["_source"].get("file_path", "")),
+            "file_url": doc["_source"].get("file_path", ""),
+            "highlights": highlights.get(doc_id, {}),
+            "score": score,
+            "similarity": similarity.get(doc_id),
+            "parent_id": doc["_source"].get("parent_id"),
+            "dup_cluster": doc["_source"].get("dup_cluster"),
+            "duplicate_count": doc["_source"].get("dup_count", 1) - 1
+        } for doc, (doc_id, score) in zip(docs, page) if doc.get("found")]
+
+        return {
+            "pagination": {
+                "current_page": current_page,
+                "total_pages": total_pages,
+                "page_size": len(results),
+                "total_documents": total_docs,
+                "returned_documents": len(results)
+            },
+            "results": results
+        }
+    except Exception as e:
+        print(f"Semantic search error details: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Semantic search error: {str(e)}"
+        )
+
 @app.get("/api/health")
 async def health_check():
     if not es:
@@ -307,11 +598,30 @@ async def health_check():
             detail=f"Elasticsearch health check failed: {str(e)}"
         )
 
+# A plain def: FastAPI runs it in its thread pool, so reading an archive never blocks the event loop
 @app.get("/api/pdf/{file_path:path}")
-async def get_pdf(file_path: str):
+def get_pdf(file_path: str):
     # Decode the URL-encoded file path
     decoded_path = unquote(file_path)
     
+    # PDFs ingested from archives are recorded as <archive>!<member>
+    if '!' in decoded_path:
+        archive_name, _, member_name = decoded_path.partition('!')
+        archive_path = archives.resolve_archive(PDF_DIRECTORY, archive_name)
+        if archive_path and os.path.isfile(archive_path) and member_name.lower().endswith('.pdf'):
+            try:
+                content = archives.read_archive_member(archive_path, member_name)
+            except KeyError:
+                raise HTTPException(status_code=404, detail=f"PDF file not found: {decoded_path}")
+            except archives.UnservableArchive as e:
+                raise HTTPException(status_code=415, detail=f"{e}; recompress it as ZIP or plain TAR")
+            return Response(
+                content=content,
+                media_type="application/pdf",
+                headers={"Content-Disposition": f'inline; filename="{os.path.basename(member_name)}"'}
+            )
+        raise HTTPException(status_code=404, detail=f"PDF file not found: {decoded_path}")
+    
     # Construct the full path within the PDF_DIRECTORY
     full_path = os.path.join(PDF_DIRECTORY, decoded_path)
     
@@ -359,7 +669,14 @@ async def bulk_index(request: Request):
         docs = await request.json()
         print(f"Received bulk request with {len(docs)} documents")
         
-        actions = [{"_index": "pdf_documents", "_source": doc} for doc in docs]
+        # An optional "_id" lets callers such as the reindexer overwrite instead of duplicating
+        actions = []
+        for doc in docs:
+            action = {"_index": "pdf_documents"}
+            if "_id" in doc:
+                action["_id"] = doc.pop("_id")
+            action["_source"] = doc
+            actions.append(action)
         success, failed = helpers.bulk(es, actions, stats_only=True)
         
         print(f"Bulk indexed {success} documents, {failed} failed")
@@ -0,0 +1,156 @@
+import os
+import json
+from collections import defaultdict
+
+import numpy as np
+
+try:
+    import hnswlib
+    HNSWLIB_AVAILABLE = True
+except ImportError:
+    HNSWLIB_AVAILABLE = False
+
+try:
+    from sentence_transformers import SentenceTransformer
+    SENTENCE_TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    SENTENCE_TRANSFORMERS_AVAILABLE = False
+
+try:
+    import onnxruntime as ort
+    from tokenizers import Tokenizer
+    ONNXRUNTIME_AVAILABLE = True
+except ImportError:
+    ONNXRUNTIME_AVAILABLE = False
+
+# Written by pre-processing/build_vector_index.py
+VECTOR_INDEX_PATH = os.environ.get('VECTOR_INDEX_PATH', '/app/vector_index')
+
+# Nearest neighbours (and BM25 hits) fetched per query before fusing and paging
+CANDIDATES = 200
+
+# Search-time HNSW candidate list; recall rises with it, latency too
+HNSW_EF_SEARCH = 256
+
+# Rank offset of reciprocal rank fusion; 60 is the value from Cormack et al.
+RRF_K = 60
+
+
+class VectorIndex:
+    """Document embeddings with their Elasticsearch ids, searched through HNSW or exhaustively"""
+
+    def __init__(self, path):
+        meta_path = os.path.join(path, 'meta.json')
+        self.mtime = os.path.getmtime(meta_path)
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        with open(os.path.join(path, 'ids.json'), 'r', encoding='utf-8') as f:
+            self.ids = json.load(f)
+        self.model_name = self.meta['model']
+        # Indexes built with an ONNX backend carry their query encoder
+        self.backend = self.meta.get('backend', 'torch')
+        self.encoder_path = os.path.join(path, 'encoder')
+        self.encoder = None
+        count, dim = self.meta['count'], self.meta['dim']
+        self.vectors = None
+        if count:
+            self.vectors = np.memmap(os.path.join(path, 'vectors.f32'), dtype=np.float32, mode='r', shape=(count, dim))
+        self.hnsw = None
+        if self.meta.get('hnsw') and HNSWLIB_AVAILABLE:
+            self.hnsw = hnswlib.Index(space='ip', dim=dim)
+            self.hnsw.load_index(os.path.join(path, 'hnsw.bin'), max_elements=count)
+            self.hnsw.set_ef(HNSW_EF_SEARCH)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, vector, k):
+        """The k nearest documents to a unit-length query vector as (id, cosine similarity), closest first"""
+        k = min(k, len(self.ids))
+        if k == 0:
+            return []
+        if self.hnsw is not None:
+            labels, distances = self.hnsw.knn_query(vector, k=k)
+            # hnswlib's inner product distance is 1 - dot product
+            return [(self.ids[label], float(1 - distance)) for label, distance in zip(labels[0], distances[0])]
+        scores = self.vectors @ vector
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top]
+
+
+class OnnxEncoder:
+    """Query encoder exported by build_vector_index.py with an ONNX backend; runs without torch"""
+
+    def __init__(self, path, quantized):
+        with open(os.path.join(path, 'encoder.json'), 'r', encoding='utf-8') as f:
+            self.config = json.load(f)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        model_file = os.path.join(path, 'model.int8.onnx' if quantized else 'model.onnx')
+        self.session = ort.InferenceSession(model_file, options, providers=['CPUExecutionProvider'])
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, 'tokenizer.json'))
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(max_length=self.config['max_seq_length'])
+
+    def encode(self, text):
+        encoding = self.tokenizer.encode(text)
+        inputs = {
+            'input_ids': np.array([encoding.ids], dtype=np.int64),
+            'attention_mask': np.ones((1, len(encoding.ids)), dtype=np.int64),
+            'token_type_ids': np.array([encoding.type_ids], dtype=np.int64)
+        }
+        hidden = self.session.run(None, {name: inputs[name] for name in self.config['inputs']})[0][0]
+        # One unpadded query, so pooling needs no mask
+        pooling = self.config['pooling']
+        vector = hidden[0] if pooling == 'cls' else hidden.max(axis=0) if pooling == 'max' else hidden.mean(axis=0)
+        return vector / (np.linalg.norm(vector) or 1)
+
+
+_index = None
+_encoders = {}
+
+
+def get_index(path=VECTOR_INDEX_PATH):
+    """The vector index, reloaded after build_vector_index.py replaces it; None if none was built"""
+    global _index
+    try:
+        mtime = os.path.getmtime(os.path.join(path, 'meta.json'))
+    except OSError:
+        return None
+    if _index is None or _index.mtime != mtime:
+        _index = VectorIndex(path)
+    return _index
+
+
+def can_encode(index):
+    """Whether the libraries to encode queries for this index are installed"""
+    if index.backend == 'torch':
+        return SENTENCE_TRANSFORMERS_AVAILABLE
+    return ONNXRUNTIME_AVAILABLE
+
+
+def encode_query(query, index):
+    """Unit-length embedding of a query, from the model and backend the index was built with"""
+    if index.backend != 'torch':
+        if index.encoder is None:
+            index.encoder = OnnxEncoder(index.encoder_path, quantized=index.backend == 'onnx')
+        return np.asarray(index.encoder.encode(query), dtype=np.float32)
+    if index.model_name not in _encoders:
+        _encoders[index.model_name] = SentenceTransformer(index.model_name, device='cpu')
+    vector = _encoders[index.model_name].encode([query], normalize_embeddings=True)[0]
+    return np.asarray(vector, dtype=np.float32)
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Fuse ranked id lists: each id scores the sum of 1 / (k + rank) over the lists it is in.
+
+    Returns:
+        list: (id, fused score), best first.
+    """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
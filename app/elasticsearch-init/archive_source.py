@@ -0,0 +1,67 @@
+import os
+import tarfile
+import zipfile
+from contextlib import contextmanager
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+# Separates the archive from the member in recorded file paths: release.zip!emails/a.pdf
+MEMBER_SEPARATOR = '!'
+
+def is_archive(path):
+    return path.lower().endswith(ARCHIVE_SUFFIXES)
+
+def is_zip(path):
+    return path.lower().endswith('.zip')
+
+def member_path(archive_name, member_name):
+    return f"{archive_name}{MEMBER_SEPARATOR}{member_name}"
+
+def split_member_path(path):
+    archive_name, _, member_name = path.partition(MEMBER_SEPARATOR)
+    return archive_name, member_name
+
+@contextmanager
+def open_archive(path, s3_client=None):
+    """Open a local or s3:// archive as a binary file object.
+
+    ZIPs need random access, so on S3 they are read through ranged GETs;
+    TARs are read front to back straight from the response body.
+    """
+    if path.startswith('s3://'):
+        import s3_source
+        bucket, key = s3_source.parse_s3_path(path)
+        client = s3_client or s3_source.get_client()
+        if is_zip(path):
+            with s3_source.open_s3_ranged(bucket, key, client) as fileobj:
+                yield fileobj
+        else:
+            body = client.get_object(Bucket=bucket, Key=key)['Body']
+            try:
+                yield body
+            finally:
+                body.close()
+    else:
+        with open(path, 'rb') as fileobj:
+            yield fileobj
+
+def iter_archive_pdfs(path, archive_name=None, s3_client=None):
+    """Yield (member path, PDF bytes) for every PDF in a ZIP or TAR archive.
+
+    Members are read one at a time, so nothing is unpacked to disk and only
+    the members currently queued for extraction are held in memory.
+    """
+    archive_name = archive_name or os.path.basename(path)
+
+    with open_archive(path, s3_client) as fileobj:
+        if is_zip(path):
+            with zipfile.ZipFile(fileobj) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir() and info.filename.lower().endswith('.pdf'):
+                        yield member_path(archive_name, info.filename), archive.read(info)
+        else:
+            # Stream mode ('r|*') never seeks, which also works for S3 bodies and compressed TARs
+            with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+                for member in archive:
+                    if member.isfile() and member.name.lower().endswith('.pdf'):
+                        yield member_path(archive_name, member.name), archive.extractfile(member).read()
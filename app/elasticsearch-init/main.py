@@ -5,29 +5,96 @@ import logging
 from elasticsearch import Elasticsearch, helpers
 from pdfminer.high_level import extract_text
 from tqdm import tqdm
-from multiprocessing import Pool, cpu_count
+from multiprocessing import Pool, Semaphore, cpu_count
+import io
 import time
+import hashlib
+import threading
 from functools import partial
+from collections import Counter
+
+# Pipeline helpers shared with the pre-processing scripts
+PRE_PROCESSING_DIR = os.environ.get(
+    'PRE_PROCESSING_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'pre-processing')
+)
+sys.path.append(PRE_PROCESSING_DIR)
+import extraction_watchdog
+from extraction_watchdog import Quarantine
+import dedup
+import text_cache
+import ocr_sidecar
+import email_headers
+from catalog import open_catalog
+
+import archive_source
 
 try:
-    import boto3
-    from urllib.parse import urlparse
-    import tempfile
+    import s3_source
     S3_AVAILABLE = True
 except ImportError:
     S3_AVAILABLE = False
 
+try:
+    import near_dup
+    NEAR_DUP_AVAILABLE = True
+except ImportError:
+    NEAR_DUP_AVAILABLE = False
+
 def extract_text_from_pdf(pdf_path):
     try:
-        text = extract_text(pdf_path)
+        # Read through the text cache shared with the pre-processing scripts
+        if isinstance(pdf_path, str):
+            # Text from run-ocr.py --sidecar_only replaces extraction; pages that
+            # were not OCR'd come from the PDF's own text layer
+            sidecar_text = ocr_sidecar.read_sidecar(pdf_path)
+            if sidecar_text is not None:
+                return ocr_sidecar.merge_text_layer(
+                    sidecar_text, lambda: text_cache.cached_file_text(pdf_path, extract_text))
+            text = text_cache.cached_file_text(pdf_path, extract_text)
+        else:
+            text = text_cache.cached_stream_text(pdf_path, extract_text)
         return text
+    except MemoryError:
+        # Let the watchdog record the file as failed
+        raise
     except Exception as e:
         logging.error(f"Error extracting text from {pdf_path}: {e}")
         return ""
 
+# Fields linking page/chunk documents to their parent record
+PARENT_FIELDS = {
+    "doc_type": { "type": "keyword" },
+    "parent_id": { "type": "keyword" },
+    "page_number": { "type": "integer" },
+    "page_start": { "type": "integer" },
+    "page_end": { "type": "integer" },
+    "chunk_index": { "type": "integer" },
+    "page_count": { "type": "integer" }
+}
+
+# Near-duplicate cluster of the source PDF, the number of PDFs in it,
+# and the paths of byte-identical copies that were not extracted separately
+DUP_FIELDS = {
+    "dup_cluster": { "type": "keyword" },
+    "dup_count": { "type": "integer" },
+    "aliases": { "type": "keyword" }
+}
+
+# Senders, recipients (To and Cc) and subjects of the email messages in a PDF,
+# parsed from the headers by email_headers.parse_messages
+EMAIL_FIELDS = {
+    "email_from": { "type": "keyword" },
+    "email_to": { "type": "keyword" },
+    "email_subject": { "type": "text" },
+    "message_count": { "type": "integer" }
+}
+
 def create_elasticsearch_index(es, index_name):
     if es.indices.exists(index=index_name):
         logging.info(f"Index '{index_name}' already exists.")
+        # New fields can be added to an existing mapping in place
+        es.indices.put_mapping(index=index_name, body={"properties": {**PARENT_FIELDS, **DUP_FIELDS, **EMAIL_FIELDS}})
         return
     mapping = {
         "mappings": {
@@ -35,125 +102,392 @@ def create_elasticsearch_index(es, index_name):
                 "title": { "type": "text" },
                 "content": { "type": "text" },
                 "file_path": { "type": "keyword" },
-                "uploaded_at": { "type": "date" }
+                "uploaded_at": { "type": "date" },
+                **PARENT_FIELDS,
+                **DUP_FIELDS,
+                **EMAIL_FIELDS
             }
         }
     }
     es.indices.create(index=index_name, body=mapping)
     logging.info(f"Created index '{index_name}'.")
 
-def process_pdf_local(args):
+def split_pages(text):
+    """Split pdfminer output into pages; pdfminer ends every page with a form feed."""
+    pages = text.split('\f')
+    if pages and not pages[-1].strip():
+        pages.pop()
+    return pages
+
+def positive_int(value):
+    """argparse type for counts and sizes that must be at least 1"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, got {value}")
+    return number
+
+def chunk_pages(pages, chunk_size):
+    """Cut the page texts into chunks of roughly chunk_size characters.
+
+    Chunks may span pages; each is returned as (text, page_start, page_end).
+    Cuts are moved back to the last whitespace so words are not split.
+    """
+    chunks = []
+    buf = []
+    buf_len = 0
+    start_page = 1
+    for page_number, page_text in enumerate(pages, 1):
+        page_text = page_text + '\n'
+        pos = 0
+        while pos < len(page_text):
+            if buf_len == 0:
+                start_page = page_number
+            end = pos + chunk_size - buf_len
+            if end < len(page_text):
+                space = page_text.rfind(' ', pos, end)
+                if space > pos:
+                    end = space + 1
+            piece = page_text[pos:end]
+            buf.append(piece)
+            buf_len += len(piece)
+            pos += len(piece)
+            if pos < len(page_text) or buf_len >= chunk_size:
+                chunks.append((''.join(buf), start_page, page_number))
+                buf = []
+                buf_len = 0
+    if buf_len and ''.join(buf).strip():
+        chunks.append((''.join(buf), start_page, len(pages)))
+    return chunks
+
+def build_documents(text, title, file_path, granularity='document', chunk_size=5000):
+    """Turn extracted text into the Elasticsearch documents for one PDF.
+
+    In 'document' mode a single document holds the whole text. In 'page' and
+    'chunk' mode a parent record carries the file metadata and every page or
+    chunk becomes its own document pointing back to it through parent_id.
+    Documents carry a deterministic '_id' so re-ingesting a file overwrites it.
+    The email header fields go on the document or parent record.
+    """
+    if not text.strip():
+        return []
+    headers = email_headers.header_fields(email_headers.parse_messages(text))
+
+    parent_id = hashlib.sha1(file_path.encode('utf-8')).hexdigest()
+    base = {
+        'title': title,
+        'file_path': file_path,
+        'uploaded_at': "2024-04-27",
+        'parent_id': parent_id
+    }
+
+    if granularity == 'document':
+        return [{**base, '_id': parent_id, 'doc_type': 'document', 'content': text,
+                 'page_count': len(split_pages(text)), **headers}]
+
+    pages = split_pages(text)
+    docs = []
+    if granularity == 'page':
+        for page_number, page_text in enumerate(pages, 1):
+            if not page_text.strip():
+                continue
+            docs.append({
+                **base,
+                '_id': f"{parent_id}-p{page_number}",
+                'doc_type': 'page',
+                'content': page_text,
+                'page_number': page_number,
+                'page_start': page_number,
+                'page_end': page_number
+            })
+    else:
+        for chunk_index, (chunk_text, page_start, page_end) in enumerate(chunk_pages(pages, chunk_size)):
+            if not chunk_text.strip():
+                continue
+            docs.append({
+                **base,
+                '_id': f"{parent_id}-c{chunk_index}",
+                'doc_type': 'chunk',
+                'content': chunk_text,
+                'chunk_index': chunk_index,
+                'page_start': page_start,
+                'page_end': page_end
+            })
+
+    docs.append({**base, '_id': parent_id, 'doc_type': 'parent', 'page_count': len(pages), **headers})
+    return docs
+
+def attach_signature(docs, text):
+    """Store the text's MinHash signature on the document that stands for the whole PDF.
+
+    The signature travels back from the worker under '_minhash' and is
+    dropped before indexing.
+    """
+    for doc in docs:
+        if doc['doc_type'] in ('document', 'parent'):
+            doc['_minhash'] = near_dup.minhash(text)
+    return docs
+
+def process_pdf_local(args, granularity='document', chunk_size=5000, signatures=False):
     file_path, base_pdf_dir = args
     relative_path = os.path.relpath(file_path, base_pdf_dir)
     
     text = extract_text_from_pdf(file_path)
-    if not text.strip():
-        return None
-    
-    doc = {
-        'title': os.path.splitext(relative_path)[0],
-        'content': text,
-        'file_path': relative_path,
-        'uploaded_at': "2024-04-27"
-    }
-    return doc
+    docs = build_documents(text, os.path.splitext(relative_path)[0], relative_path,
+                           granularity, chunk_size)
+    return attach_signature(docs, text) if signatures else docs
 
-def process_pdf_s3(file_path):
+def process_pdf_s3(file_path, granularity='document', chunk_size=5000, signatures=False):
     if not S3_AVAILABLE:
         raise ImportError("boto3 is required for S3 support")
         
-    parsed = urlparse(file_path)
-    bucket = parsed.netloc
-    key = parsed.path.lstrip('/')
+    _, key = s3_source.parse_s3_path(file_path)
     
-    s3 = boto3.client('s3')
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp:
-        try:
-            s3.download_file(bucket, key, tmp.name)
-            text = extract_text_from_pdf(tmp.name)
-        finally:
-            os.unlink(tmp.name)
+    try:
+        # Uses this worker's client; small objects never touch the disk
+        with s3_source.open_s3_object(file_path) as pdf_file:
+            text = extract_text_from_pdf(pdf_file)
+    except Exception as e:
+        logging.error(f"Error downloading {file_path}: {e}")
+        return []
     
-    if not text.strip():
-        return None
-        
-    doc = {
-        'title': os.path.splitext(os.path.basename(key))[0],
-        'content': text,
-        'file_path': file_path,
-        'uploaded_at': "2024-04-27"
-    }
-    return doc
+    docs = build_documents(text, os.path.splitext(os.path.basename(key))[0], file_path,
+                           granularity, chunk_size)
+    return attach_signature(docs, text) if signatures else docs
 
-def list_s3_pdfs(s3_path):
-    if not S3_AVAILABLE:
-        raise ImportError("boto3 is required for S3 support")
-        
-    parsed = urlparse(s3_path)
-    bucket = parsed.netloc
-    prefix = parsed.path.lstrip('/')
-    
-    s3 = boto3.client('s3')
-    paginator = s3.get_paginator('list_objects_v2')
-    pdf_files = []
+def process_pdf_bytes(item, granularity='document', chunk_size=5000, signatures=False):
+    """Extract a PDF streamed out of an archive; item is (archive!member path, bytes)"""
+    file_path, data = item
+    _, member_name = archive_source.split_member_path(file_path)
     
-    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
-        if 'Contents' in page:
-            for obj in page['Contents']:
-                if obj['Key'].lower().endswith('.pdf'):
-                    pdf_files.append(f"s3://{bucket}/{obj['Key']}")
-    
-    return pdf_files
+    text = extract_text_from_pdf(io.BytesIO(data))
+    docs = build_documents(text, os.path.splitext(os.path.basename(member_name))[0], file_path,
+                           granularity, chunk_size)
+    return attach_signature(docs, text) if signatures else docs
+
+def assign_dup_clusters(documents, threshold=0.8):
+    """Cluster near-duplicate PDFs and tag every document with its PDF's cluster.
+
+    PDFs without a signature (no words) form a cluster of their own.
+    """
+    signatures = {}
+    for doc in documents:
+        signature = doc.pop('_minhash', None)
+        if signature is not None:
+            signatures[doc['parent_id']] = signature
+
+    clusters = near_dup.cluster_signatures(signatures, threshold)
+    sizes = Counter(clusters.values())
+    for doc in documents:
+        cluster = clusters.get(doc['parent_id'], doc['parent_id'])
+        doc['dup_cluster'] = cluster
+        doc['dup_count'] = sizes.get(cluster, 1)
+
+    duplicated = [size for size in sizes.values() if size > 1]
+    logging.info(f"Found {len(duplicated)} near-duplicate clusters covering {sum(duplicated)} of {len(signatures)} PDFs.")
+
+def unique_members(members, aliases):
+    """Drop archive members whose bytes were already seen, recording them as aliases"""
+    seen = {}
+    for file_path, data in members:
+        digest = dedup.bytes_digest(data)
+        if digest in seen:
+            aliases.setdefault(seen[digest], []).append(file_path)
+            continue
+        seen[digest] = file_path
+        yield file_path, data
 
-def ingest_pdfs(es, index_name, base_path):
+def mark_indexed(catalog, base_path, processed, aliases, failed_files):
+    """Record the page counts and indexed status of the local PDFs whose documents all made it in"""
+    for file_path, docs in processed.items():
+        relative_path = os.path.relpath(file_path, base_path)
+        # A PDF without text (a scan before OCR) produced no documents; it is picked up again once it has some
+        if not docs or relative_path in failed_files:
+            continue
+        page_count = next((doc['page_count'] for doc in docs if 'page_count' in doc), None)
+        paths = [file_path] + [os.path.join(base_path, alias) for alias in aliases.get(file_path, [])]
+        if page_count is None:
+            catalog.mark(paths, indexed=True)
+        else:
+            catalog.mark(paths, indexed=True, page_count=page_count)
+
+def archive_relative_path(base_path, data_dir=None):
+    """Path an archive's members are recorded under: its S3 key, or its path relative to data_dir"""
+    if base_path.startswith('s3://'):
+        return base_path[len('s3://'):].partition('/')[2]
+    data_dir = os.path.abspath(data_dir or os.path.dirname(base_path))
+    relative_path = os.path.relpath(os.path.abspath(base_path), data_dir)
+    if relative_path.startswith(os.pardir):
+        raise ValueError(f"Archive {base_path} is not inside the data directory {data_dir}")
+    return relative_path
+
+def bounded(items, slots):
+    """Hold back items until a slot is free, so Pool.imap cannot read ahead without limit"""
+    for item in items:
+        slots.acquire()
+        yield item
+
+def ingest_pdfs(es, index_name, base_path, granularity='document', chunk_size=5000,
+                max_concurrent_gets=8, spool_threshold_mb=64, quarantine_file=None,
+                time_limit=extraction_watchdog.DEFAULT_TIME_LIMIT,
+                memory_limit_mb=extraction_watchdog.DEFAULT_MEMORY_LIMIT_MB,
+                max_tasks_per_child=extraction_watchdog.DEFAULT_MAX_TASKS_PER_CHILD,
+                near_dup_threshold=None, dedup_file=None, only_new=False, data_dir=None):
     is_s3 = base_path.startswith('s3://')
+    is_archive = archive_source.is_archive(base_path)
+    worker_init = None
+    worker_initargs = ()
+    slots = None
+    catalog = None
+    num_processes = max(1, cpu_count()-2)  # Ensure at least 1 process
+    # Files that failed on earlier runs are skipped
+    quarantine = Quarantine(quarantine_file)
+    # Byte-identical copies are extracted once; their paths are stored on the
+    # indexed copy's documents as 'aliases'
+    aliases = {}
+    
+    if is_s3 and not S3_AVAILABLE:
+        raise ImportError("boto3 is required for S3 support")
+    if near_dup_threshold and not NEAR_DUP_AVAILABLE:
+        raise ImportError("numpy is required for near-duplicate detection")
+    signatures = bool(near_dup_threshold)
     
-    if is_s3:
-        if not S3_AVAILABLE:
-            raise ImportError("boto3 is required for S3 support")
-        pdf_files = list_s3_pdfs(base_path)
-        process_func = process_pdf_s3
-        process_args = pdf_files
+    if is_archive:
+        # PDFs are streamed out of the archive into the workers; nothing is unpacked to disk.
+        # Members are recorded as <archive>!<member>, with the archive's path relative to the
+        # data directory the API serves (PDF_DIRECTORY). An S3 archive is recorded by its key,
+        # so it is served once the archive is copied to the same path under the data directory.
+        archive_name = archive_relative_path(base_path, data_dir)
+        if not base_path.lower().endswith(('.zip', '.tar')):
+            logging.warning(f"Members of compressed TARs are searchable but /api/pdf cannot serve them; "
+                            f"recompress {os.path.basename(base_path)} as ZIP or plain TAR to open its PDFs")
+        s3_client = s3_source.create_client(s3_source.client_kwargs_from_env()) if is_s3 else None
+        members = archive_source.iter_archive_pdfs(base_path, archive_name, s3_client)
+        process_func = partial(process_pdf_bytes, granularity=granularity, chunk_size=chunk_size,
+                               signatures=signatures)
+        slots = threading.BoundedSemaphore(num_processes * 4)
+        process_args = bounded(quarantine.iter_filter(unique_members(members, aliases)), slots)
+    elif is_s3:
+        # Keys are listed lazily, so downloads and extraction start with the first listing page
+        client_kwargs = s3_source.client_kwargs_from_env()
+        pdf_files = s3_source.iter_s3_pdfs(base_path, client=s3_source.create_client(client_kwargs))
+        process_func = partial(process_pdf_s3, granularity=granularity, chunk_size=chunk_size,
+                               signatures=signatures)
+        process_args = quarantine.iter_filter(pdf_files)
+        worker_init = s3_source.init_worker
+        worker_initargs = (Semaphore(max_concurrent_gets), spool_threshold_mb * 1024 * 1024, client_kwargs)
     else:
-        pdf_files = []
-        for root, _, files in os.walk(base_path):
-            pdf_files.extend([os.path.join(root, f) for f in files if f.lower().endswith('.pdf')])
-        process_func = process_pdf_local
+        # The corpus catalog lists the PDFs and which of them are already indexed
+        catalog = open_catalog(base_path)
+        pdf_files = catalog.pdfs(indexed=False) if only_new else catalog.pdfs()
+        duplicates = dedup.DuplicateIndex(dedup_file)
+        pdf_files = duplicates.dedupe(pdf_files)
+        duplicates.save()
+        aliases = {path: [os.path.relpath(alias, base_path) for alias in duplicates.aliases_of(path)]
+                   for path in pdf_files if duplicates.aliases_of(path)}
+        pdf_files = quarantine.filter(pdf_files)
+        process_func = partial(process_pdf_local, granularity=granularity, chunk_size=chunk_size,
+                               signatures=signatures)
         process_args = [(f, base_path) for f in pdf_files]
     
-    total_files = len(pdf_files)
-    logging.info(f"Found {total_files} PDF files to process.")
+    total_files = None if is_s3 or is_archive else len(pdf_files)
+    if total_files is not None:
+        logging.info(f"Found {total_files} PDF files to process.")
     
-    # Process PDFs in parallel
-    num_processes = max(1, cpu_count()-2)  # Ensure at least 1 process
-    with Pool(processes=num_processes) as pool:
-        if is_s3:
-            results = list(tqdm(pool.imap(process_func, process_args), total=total_files, desc="Processing PDFs"))
-        else:
-            results = list(tqdm(pool.imap(process_func, process_args), total=total_files, desc="Processing PDFs"))
+    # Process PDFs in parallel, each file under the watchdog's time and memory limits
+    results = []
+    errors = set()
+    with Pool(processes=num_processes,
+              maxtasksperchild=max_tasks_per_child or None,
+              initializer=extraction_watchdog.init_worker,
+              initargs=(time_limit, memory_limit_mb, worker_init, worker_initargs)) as pool:
+        guarded = pool.imap(partial(extraction_watchdog.guarded_call, process_func), process_args)
+        for file_key, docs, error in tqdm(guarded, total=total_files, desc="Processing PDFs"):
+            if slots is not None:
+                slots.release()
+            if error:
+                quarantine.record_failure(file_key, error, stage='ingest')
+                errors.add(file_key)
+                docs = []
+            else:
+                quarantine.record_success(file_key)
+            results.append((file_key, docs))
+    total_files = len(results)
+    quarantine.save()
     
-    documents = [doc for doc in results if doc is not None]
-    empty_pdfs = total_files - len(documents)
+    for file_key, docs in results:
+        if file_key in aliases:
+            for doc in docs:
+                doc['aliases'] = aliases[file_key]
+    if aliases:
+        logging.info(f"Skipped {sum(len(paths) for paths in aliases.values())} byte-identical copies.")
+    
+    # Files whose extraction finished; they are marked indexed once all their documents are in
+    processed = {file_key: docs for file_key, docs in results if file_key not in errors}
+    results = [docs for _, docs in results]
+    documents = [doc for docs in results for doc in docs]
+    empty_pdfs = sum(1 for docs in results if not docs)
     
     logging.info(f"Processed {total_files} PDFs. {empty_pdfs} were empty or failed to process.")
+    if granularity != 'document':
+        logging.info(f"Split into {len(documents)} {granularity} and parent documents.")
+    if signatures:
+        assign_dup_clusters(documents, near_dup_threshold)
     
+    failed_files = set()
     for i in tqdm(range(0, len(documents), 1000), desc="Ingesting to Elasticsearch"):
         batch = documents[i:i+1000]
-        actions = [{"_index": index_name, "_source": doc} for doc in batch]
+        actions = [
+            {"_index": index_name, "_id": doc['_id'], "_source": {k: v for k, v in doc.items() if not k.startswith('_')}}
+            for doc in batch
+        ]
         try:
             helpers.bulk(es, actions)
             logging.info(f"Ingested batch of {len(batch)} documents into '{index_name}'.")
         except Exception as e:
             logging.error(f"Error ingesting batch: {e}")
+            failed_files.update(doc['file_path'] for doc in batch)
+
+    if catalog is not None:
+        mark_indexed(catalog, base_path, processed, aliases, failed_files)
+        catalog.close()
 
     logging.info(f"Ingestion complete. Total documents ingested: {len(documents)}")
     logging.info(f"Total empty PDFs skipped: {empty_pdfs}")
+    quarantine.report()
 
 def main():
     parser = argparse.ArgumentParser(description="Ingest PDFs into Elasticsearch.")
-    parser.add_argument('--pdf_dir', required=True, help='Base directory containing PDF files or s3:// path.')
+    parser.add_argument('--pdf_dir', required=True, help='Base directory containing PDF files, s3:// path, or a ZIP/TAR archive (local or s3://).')
     parser.add_argument('--index', default='pdf_documents', help='Elasticsearch index name.')
     parser.add_argument('--es_host', default='http://localhost:9200', help='Elasticsearch host URL.')
+    parser.add_argument('--granularity', choices=['document', 'page', 'chunk'], default='document',
+                        help='Index each PDF as one document, or each page / fixed-size chunk as its own document.')
+    parser.add_argument('--chunk_size', type=positive_int, default=5000, help='Characters per chunk in chunk mode.')
+    parser.add_argument('--s3_max_concurrent_gets', type=int, default=8,
+                        help='Maximum S3 downloads in flight across all workers.')
+    parser.add_argument('--s3_spool_threshold_mb', type=int, default=64,
+                        help='S3 objects larger than this are spilled to disk instead of kept in memory.')
+    parser.add_argument('--s3_endpoint_url', help='Custom S3 endpoint, e.g. a local MinIO or moto server.')
+    parser.add_argument('--time_limit', type=int, default=extraction_watchdog.DEFAULT_TIME_LIMIT,
+                        help='Seconds allowed per PDF before it counts as failed (0 disables).')
+    parser.add_argument('--memory_limit_mb', type=int, default=extraction_watchdog.DEFAULT_MEMORY_LIMIT_MB,
+                        help='Memory limit per worker process in MB (0 disables).')
+    parser.add_argument('--max_tasks_per_child', type=int, default=extraction_watchdog.DEFAULT_MAX_TASKS_PER_CHILD,
+                        help='Recycle each worker process after this many PDFs.')
+    parser.add_argument('--quarantine_file',
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'quarantine.json'),
+                        help='Quarantine list of PDFs that repeatedly fail; these are skipped on later runs.')
+    parser.add_argument('--dedup_file',
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dedup.json'),
+                        help='Content hashes of local PDFs, used to extract byte-identical copies only once.')
+    parser.add_argument('--near_dup_threshold', type=float, default=0.0,
+                        help='Cluster PDFs whose estimated Jaccard similarity is at least this (e.g. 0.8) '
+                             'into dup_cluster groups; 0 disables. Requires numpy.')
+    parser.add_argument('--data_dir',
+                        help='Directory the API serves PDFs from (mounted as PDF_DIRECTORY); archive members are '
+                             'recorded relative to it. Defaults to the directory holding the archive.')
+    parser.add_argument('--only_new', action='store_true',
+                        help='Skip local PDFs the corpus catalog lists as already indexed.')
     parser.add_argument('--verbose', action='store_true', help='Enable verbose output')
 
     args = parser.parse_args()
@@ -165,6 +499,13 @@ def main():
         logging.error("S3 support requires boto3. Install it with: pip install boto3")
         sys.exit(1)
 
+    if args.near_dup_threshold and not NEAR_DUP_AVAILABLE:
+        logging.error("Near-duplicate detection requires numpy. Install it with: pip install numpy")
+        sys.exit(1)
+
+    if args.s3_endpoint_url:
+        os.environ['S3_ENDPOINT_URL'] = args.s3_endpoint_url
+
     logging.info(f"Connecting to Elasticsearch at {args.es_host}")
     
     max_retries = 5
@@ -190,7 +531,10 @@ def main():
     create_elasticsearch_index(es, args.index)
     
     logging.info(f"Starting PDF ingestion from: {args.pdf_dir}")
-    ingest_pdfs(es, args.index, args.pdf_dir)
+    ingest_pdfs(es, args.index, args.pdf_dir, args.granularity, args.chunk_size,
+                args.s3_max_concurrent_gets, args.s3_spool_threshold_mb, args.quarantine_file,
+                args.time_limit, args.memory_limit_mb, args.max_tasks_per_child,
+                args.near_dup_threshold, args.dedup_file, args.only_new, args.data_dir)
     logging.info("Ingestion process completed.")
 
 if __name__ == "__main__":
@@ -0,0 +1,91 @@
+import re
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+# 16 bands of 8 rows: pairs above ~0.7 Jaccard almost always share a band
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 5
+DEFAULT_THRESHOLD = 0.8
+
+# Universal hashing (a*x + b) mod p over 32-bit shingle hashes; a, b < 2^31 keep a*x + b inside uint64
+_PRIME = np.uint64(4294967311)
+_rng = np.random.RandomState(42)
+_A = _rng.randint(1, 2 ** 31, size=NUM_PERM).astype(np.uint64)
+_B = _rng.randint(0, 2 ** 31, size=NUM_PERM).astype(np.uint64)
+_BLOCK = 20000
+
+WORD_RE = re.compile(r'\w+')
+
+def shingle_hashes(text, size=SHINGLE_SIZE):
+    """Stable 32-bit hashes of the word shingles of a text"""
+    words = WORD_RE.findall(text.lower())
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    if len(words) < size:
+        shingles = {' '.join(words)}
+    else:
+        shingles = {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+    return np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+def minhash(text):
+    """MinHash signature of a text, or None if it has no words"""
+    hashes = shingle_hashes(text)
+    if not len(hashes):
+        return None
+    signature = np.full(NUM_PERM, np.iinfo(np.uint64).max, dtype=np.uint64)
+    # Work through the shingles in blocks so huge documents don't need a NUM_PERM x N matrix
+    for start in range(0, len(hashes), _BLOCK):
+        block = hashes[start:start + _BLOCK]
+        permuted = (_A[:, None] * block[None, :] + _B[:, None]) % _PRIME
+        np.minimum(signature, permuted.min(axis=1), out=signature)
+    return signature.astype(np.uint32)
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.mean(sig_a == sig_b))
+
+def cluster_signatures(signatures, threshold=DEFAULT_THRESHOLD):
+    """Group near-duplicates with LSH banding.
+
+    Args:
+        signatures (dict): Document id -> MinHash signature.
+        threshold (float): Minimum estimated Jaccard similarity to merge two documents.
+
+    Returns:
+        dict: Document id -> cluster id, where the cluster id is the smallest document id in the cluster.
+    """
+    parent = {doc_id: doc_id for doc_id in signatures}
+
+    def find(doc_id):
+        while parent[doc_id] != doc_id:
+            parent[doc_id] = parent[parent[doc_id]]
+            doc_id = parent[doc_id]
+        return doc_id
+
+    def union(a, b):
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            # The smaller id becomes the root so cluster ids are stable between runs
+            if root_b < root_a:
+                root_a, root_b = root_b, root_a
+            parent[root_b] = root_a
+
+    buckets = defaultdict(list)
+    for doc_id in sorted(signatures):
+        signature = signatures[doc_id]
+        for band in range(BANDS):
+            key = (band, signature[band * ROWS:(band + 1) * ROWS].tobytes())
+            candidates = buckets[key]
+            for other_id in candidates:
+                if find(other_id) != find(doc_id) and similarity(signature, signatures[other_id]) >= threshold:
+                    union(doc_id, other_id)
+                    break
+            # Only a few members per bucket are kept as comparison points
+            if len(candidates) < 4:
+                candidates.append(doc_id)
+
+    return {doc_id: find(doc_id) for doc_id in signatures}
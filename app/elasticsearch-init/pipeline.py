@@ -0,0 +1,404 @@
+import os
+import sys
+import time
+import queue
+import argparse
+import logging
+import importlib
+import threading
+import multiprocessing
+from functools import partial
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from elasticsearch import Elasticsearch, helpers
+
+# The ingester puts the pre-processing scripts on sys.path
+import main as ingester
+import page_scan
+import dedup
+import extraction_watchdog
+from extraction_watchdog import Quarantine
+from catalog import Catalog, open_catalog, DEFAULT_CATALOG_PATH
+
+# Documents are sent to Elasticsearch once this many are waiting or after
+# FLUSH_SECONDS, so the first PDFs are searchable soon after the run starts
+BULK_DOCS = 500
+FLUSH_SECONDS = 2.0
+
+# Seconds one ocrmypdf run or redaction may take before the PDF counts as
+# failed, so a hung run cannot stall the stages behind it
+DEFAULT_OCR_TIME_LIMIT = 1800
+DEFAULT_REDACT_TIME_LIMIT = 600
+
+
+def check_pdf(item):
+    """Find the pages that need OCR; item is the per-PDF state passed between stages"""
+    ocr_pages, page_count = page_scan.scan_pdf(item['path'])
+    item['page_count'] = page_count
+    item['needs_ocr'] = ocr_pages != []
+    item['ocr_pages'] = page_scan.ocr_page_range({'ocr_pages': ocr_pages, 'page_count': page_count})
+    return item
+
+
+def ocr_pdf(item, work_dir, language, jobs):
+    # Imported here so only the OCR workers load ocrmypdf
+    run_ocr = importlib.import_module('run-ocr')
+    output_pdf = os.path.join(work_dir, item['relpath'])
+    os.makedirs(os.path.dirname(output_pdf), exist_ok=True)
+    try:
+        error = run_ocr.run_ocrmypdf(item['path'], output_pdf, language, False, item['ocr_pages'], jobs)
+    except BaseException:
+        # Timed out: drop whatever ocrmypdf wrote so far
+        if os.path.exists(output_pdf):
+            os.remove(output_pdf)
+        raise
+    if error:
+        raise RuntimeError(error)
+    item['path'] = output_pdf
+    return item
+
+
+def redact_pdf(item, output_folder, work_dir):
+    # Imported here so only the redaction workers load the spaCy model
+    import redact
+    output_pdf = os.path.join(output_folder, item['relpath'])
+    os.makedirs(os.path.dirname(output_pdf), exist_ok=True)
+    result = redact.redact_pdf(item['path'], output_pdf, dry_run=False)
+    if result['status'] == 'error':
+        raise RuntimeError(result['error'])
+    remove_work_copy(item, work_dir)
+    item['path'] = output_pdf
+    return item
+
+
+def extract_pdf(item, granularity, chunk_size):
+    """Build the Elasticsearch documents for the redacted PDF"""
+    text = ingester.extract_text_from_pdf(item['path'])
+    item['docs'] = ingester.build_documents(text, os.path.splitext(item['relpath'])[0], item['relpath'],
+                                            granularity, chunk_size)
+    if item['aliases']:
+        for doc in item['docs']:
+            doc['aliases'] = item['aliases']
+    return item
+
+
+def guarded(func, item):
+    """Run a stage under its worker's per-PDF time limit; timeouts fail the PDF like any other error"""
+    _, result, error = extraction_watchdog.guarded_call(func, item)
+    if error:
+        raise RuntimeError(error)
+    return result
+
+
+def remove_work_copy(item, work_dir):
+    """Delete the OCR'd copy of a PDF once it is no longer needed"""
+    path = os.path.abspath(item['path'])
+    if path.startswith(os.path.abspath(work_dir) + os.sep) and os.path.exists(path):
+        os.remove(path)
+
+
+class Stage:
+    """
+    One pipeline stage: a process pool fed from a bounded queue by a thread.
+
+    At most workers * 2 items are in flight. Finished items are put on the
+    next stage's queue, which blocks while that queue is full, so a slow
+    stage holds back the ones before it instead of piling up work.
+    """
+
+    def __init__(self, pipeline, name, func, workers, queue_size, initializer=None, initargs=()):
+        self.pipeline = pipeline
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.initializer = initializer
+        self.initargs = initargs
+        self.inbox = queue.Queue(maxsize=queue_size)
+        self.counts = Counter()
+        self.running = 0
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+
+    def new_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=self.initializer, initargs=self.initargs)
+
+    def submit(self, executor, item):
+        """Submit an item, replacing the pool if a worker died since the last submission"""
+        try:
+            return executor, executor.submit(self.func, item)
+        except BrokenProcessPool:
+            logging.warning(f"{self.name}: a worker process died; starting a new pool")
+            executor.shutdown(wait=False, cancel_futures=True)
+            executor = self.new_executor()
+            return executor, executor.submit(self.func, item)
+
+    def run(self):
+        catalog = Catalog(self.pipeline.root, self.pipeline.catalog_path)
+        executor = self.new_executor()
+        in_flight = {}
+        while not (self.pipeline.finished.is_set() and self.inbox.empty() and not in_flight):
+            while len(in_flight) < self.workers * 2:
+                try:
+                    item = self.inbox.get(timeout=0.2)
+                except queue.Empty:
+                    break
+                executor, future = self.submit(executor, item)
+                in_flight[future] = item
+            self.running = len(in_flight)
+            if not in_flight:
+                continue
+            done, _ = wait(in_flight, timeout=0.2, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # A worker that died (segfault, OOM kill) fails every item in flight in its pool
+                    self.counts['failed'] += 1
+                    self.pipeline.fail(item, self.name, e)
+                    continue
+                self.counts['done'] += 1
+                try:
+                    self.pipeline.advance(self.name, result, catalog)
+                except Exception as e:
+                    self.counts['failed'] += 1
+                    self.pipeline.fail(item, self.name, e)
+            self.running = len(in_flight)
+        executor.shutdown()
+        catalog.close()
+
+    def status(self):
+        return (f"{self.name} {self.counts['done']} done, {self.running} running, "
+                f"{self.inbox.qsize()} queued" + (f", {self.counts['failed']} failed" if self.counts['failed'] else ''))
+
+
+class Pipeline:
+    """
+    Runs check, OCR, redaction and extraction as concurrent stages.
+
+    Each PDF moves on as soon as a stage finishes it: PDFs with a text layer
+    skip OCR, and the documents of redacted PDFs are bulk-indexed while the
+    rest of the corpus is still being processed. Every stage records its
+    result in the corpus catalog, for the PDF and its byte-identical copies.
+    As in the ingester, the check and extract stages run under the
+    watchdog's time and memory limits, and PDFs that fail are recorded in
+    the quarantine list shared with it. OCR and redaction have time limits
+    of their own, and a stage whose worker process dies gets a new pool.
+    """
+
+    def __init__(self, args, es, quarantine, aliases):
+        self.args = args
+        self.es = es
+        self.root = args.input_folder
+        self.catalog_path = args.catalog_file
+        self.quarantine = quarantine
+        self.aliases = aliases
+        self.finished = threading.Event()
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.feeding_done = False
+        self.indexed_pdfs = 0
+        self.indexed_docs = 0
+        self.docs = queue.Queue(maxsize=args.queue_size)
+        watchdog = (args.time_limit, args.memory_limit_mb)
+        self.stages = {
+            'check': Stage(self, 'check', partial(guarded, check_pdf), args.check_workers, args.queue_size,
+                           extraction_watchdog.init_worker, watchdog),
+            # No memory limit here: ocrmypdf's tesseract processes and the spaCy model
+            # would not fit the address-space cap
+            'ocr': Stage(self, 'ocr', partial(guarded, partial(ocr_pdf, work_dir=args.work_dir, language=args.language,
+                                                               jobs=args.ocr_jobs)),
+                         args.ocr_workers, args.queue_size, extraction_watchdog.init_worker, (args.ocr_time_limit, 0)),
+            'redact': Stage(self, 'redact', partial(guarded, partial(redact_pdf, output_folder=args.output_folder,
+                                                                     work_dir=args.work_dir)),
+                            args.redact_workers, args.queue_size, extraction_watchdog.init_worker,
+                            (args.redact_time_limit, 0)),
+            'extract': Stage(self, 'extract', partial(guarded, partial(extract_pdf, granularity=args.granularity,
+                                                                       chunk_size=args.chunk_size)),
+                             args.extract_workers, args.queue_size, extraction_watchdog.init_worker, watchdog),
+        }
+
+    def copies(self, item):
+        """The PDF and its byte-identical copies, which share its catalog status"""
+        return [item['source']] + [os.path.join(self.root, alias) for alias in item['aliases']]
+
+    def advance(self, stage, item, catalog):
+        """Record a stage's result and hand the PDF to the next stage"""
+        if stage == 'check':
+            catalog.mark(self.copies(item), selectable=not item['needs_ocr'], page_count=item['page_count'])
+            self.stages['ocr' if item['needs_ocr'] else 'redact'].inbox.put(item)
+        elif stage == 'ocr':
+            catalog.mark(self.copies(item), ocr_done=True)
+            self.stages['redact'].inbox.put(item)
+        elif stage == 'redact':
+            catalog.mark(self.copies(item), redacted=True)
+            self.stages['extract'].inbox.put(item)
+        else:
+            self.docs.put(item)
+
+    def fail(self, item, stage, error):
+        remove_work_copy(item, self.args.work_dir)
+        with self.lock:
+            self.quarantine.record_failure(item['source'], str(error), stage=f"pipeline-{stage}")
+        self._done(1)
+
+    def _done(self, count):
+        with self.lock:
+            self.pending -= count
+            if self.pending == 0 and self.feeding_done:
+                self.finished.set()
+
+    def index_documents(self):
+        """Bulk-index extracted documents in small batches as they arrive"""
+        catalog = Catalog(self.root, self.catalog_path)
+        batch = []
+        last_flush = time.time()
+        while not (self.finished.is_set() and self.docs.empty() and not batch):
+            try:
+                batch.append(self.docs.get(timeout=0.2))
+            except queue.Empty:
+                pass
+            waiting = sum(len(item['docs']) for item in batch)
+            if batch and (waiting >= BULK_DOCS or time.time() - last_flush >= FLUSH_SECONDS):
+                self.flush(batch, catalog)
+                batch = []
+                last_flush = time.time()
+        catalog.close()
+
+    def flush(self, items, catalog):
+        actions = [
+            {"_index": self.args.index, "_id": doc['_id'],
+             "_source": {k: v for k, v in doc.items() if not k.startswith('_')}}
+            for item in items for doc in item['docs']
+        ]
+        try:
+            if actions:
+                helpers.bulk(self.es, actions)
+            for item in items:
+                # A PDF without text produced no documents and stays unindexed until it has some
+                if item['docs']:
+                    catalog.mark(self.copies(item), indexed=True)
+            with self.lock:
+                for item in items:
+                    self.quarantine.record_success(item['source'])
+            self.indexed_pdfs += len(items)
+            self.indexed_docs += len(actions)
+        except Exception as e:
+            logging.error(f"Error ingesting batch of {len(items)} PDFs: {e}")
+        self._done(len(items))
+
+    def progress(self, start_time):
+        """Redraw the status line until the run is over"""
+        interactive = sys.stderr.isatty()
+        while not self.finished.wait(1 if interactive else self.args.progress_interval):
+            line = self.status_line(start_time)
+            if interactive:
+                sys.stderr.write(f"\r{line}\033[K")
+                sys.stderr.flush()
+            else:
+                logging.info(line)
+        if interactive:
+            sys.stderr.write('\n')
+
+    def status_line(self, start_time):
+        minutes = max(time.time() - start_time, 1e-9) / 60
+        stages = ' | '.join(stage.status() for stage in self.stages.values())
+        return (f"{stages} | indexed {self.indexed_pdfs} PDFs ({self.indexed_docs} docs), "
+                f"{self.indexed_pdfs / minutes:.1f} PDFs/min")
+
+    def run(self, pdf_paths):
+        self.pending = len(pdf_paths)
+        if not pdf_paths:
+            self.finished.set()
+        start_time = time.time()
+        threads = [stage.thread for stage in self.stages.values()]
+        threads.append(threading.Thread(target=self.index_documents, name='index', daemon=True))
+        threads.append(threading.Thread(target=self.progress, args=(start_time,), name='progress', daemon=True))
+        for thread in threads:
+            thread.start()
+
+        # Blocks whenever the check queue is full
+        for pdf_path in pdf_paths:
+            self.stages['check'].inbox.put({'source': pdf_path, 'path': pdf_path,
+                                            'relpath': os.path.relpath(pdf_path, self.root),
+                                            'aliases': self.aliases.get(pdf_path, [])})
+        with self.lock:
+            self.feeding_done = True
+            if self.pending == 0:
+                self.finished.set()
+
+        for thread in threads:
+            thread.join()
+        self.quarantine.save()
+        logging.info(self.status_line(start_time))
+        self.quarantine.report()
+
+
+def main():
+    cores = multiprocessing.cpu_count()
+    parser = argparse.ArgumentParser(description="Check, OCR, redact and index PDFs as one overlapped pipeline.")
+    parser.add_argument('--input_folder', required=True, help='Corpus root containing the PDFs.')
+    parser.add_argument('--output_folder', required=True, help='Where the redacted PDFs are written.')
+    parser.add_argument('--work_dir', default='reports/pipeline_ocr', help='Where OCR\'d PDFs are kept before redaction.')
+    parser.add_argument('--catalog_file', default=DEFAULT_CATALOG_PATH, help='Corpus catalog database path.')
+    parser.add_argument('--all', action='store_true', help='Process every PDF, not only those not yet indexed.')
+    parser.add_argument('--index', default='pdf_documents', help='Elasticsearch index name.')
+    parser.add_argument('--es_host', default='http://localhost:9200', help='Elasticsearch host URL.')
+    parser.add_argument('--granularity', choices=['document', 'page', 'chunk'], default='document',
+                        help='Index each PDF as one document, or each page / fixed-size chunk as its own document.')
+    parser.add_argument('--chunk_size', type=ingester.positive_int, default=5000, help='Characters per chunk in chunk mode.')
+    parser.add_argument('--language', default='eng', help='Language(s) for OCR.')
+    parser.add_argument('--check_workers', type=int, default=2, help='Processes checking for text layers.')
+    parser.add_argument('--ocr_workers', type=int, default=max(1, cores // 4), help='Concurrent ocrmypdf runs.')
+    parser.add_argument('--ocr_jobs', type=int, default=2, help='ocrmypdf jobs per OCR run.')
+    parser.add_argument('--redact_workers', type=int, default=max(1, cores // 4), help='Processes redacting PDFs.')
+    parser.add_argument('--extract_workers', type=int, default=2, help='Processes extracting text for indexing.')
+    parser.add_argument('--queue_size', type=int, default=16, help='PDFs that may wait in front of each stage.')
+    parser.add_argument('--progress_interval', type=int, default=30,
+                        help='Seconds between progress lines when not writing to a terminal.')
+    parser.add_argument('--time_limit', type=int, default=extraction_watchdog.DEFAULT_TIME_LIMIT,
+                        help='Seconds allowed per PDF in the check and extract stages (0 disables).')
+    parser.add_argument('--memory_limit_mb', type=int, default=extraction_watchdog.DEFAULT_MEMORY_LIMIT_MB,
+                        help='Memory limit per check and extract worker in MB (0 disables).')
+    parser.add_argument('--ocr_time_limit', type=int, default=DEFAULT_OCR_TIME_LIMIT,
+                        help='Seconds allowed per PDF in the OCR stage (0 disables).')
+    parser.add_argument('--redact_time_limit', type=int, default=DEFAULT_REDACT_TIME_LIMIT,
+                        help='Seconds allowed per PDF in the redact stage (0 disables).')
+    parser.add_argument('--quarantine_file',
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'quarantine.json'),
+                        help='Quarantine list shared with the ingester; PDFs that repeatedly fail are skipped.')
+    parser.add_argument('--dedup_file',
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dedup.json'),
+                        help='Content hashes shared with the ingester, used to process byte-identical copies once.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    es = Elasticsearch([args.es_host], retry_on_timeout=True, max_retries=3)
+    try:
+        es.cluster.health(wait_for_status='yellow', timeout='30s')
+    except Exception as e:
+        logging.error(f"Cannot connect to Elasticsearch at {args.es_host}: {e}")
+        sys.exit(1)
+    ingester.create_elasticsearch_index(es, args.index)
+
+    catalog = open_catalog(args.input_folder, args.catalog_file)
+    pdf_paths = catalog.pdfs() if args.all else catalog.pdfs(indexed=False)
+    catalog.close()
+
+    # Byte-identical copies are processed once, as in the ingester
+    duplicates = dedup.DuplicateIndex(args.dedup_file)
+    pdf_paths = duplicates.dedupe(pdf_paths)
+    duplicates.save()
+    aliases = {path: [os.path.relpath(alias, args.input_folder) for alias in duplicates.aliases_of(path)]
+               for path in pdf_paths if duplicates.aliases_of(path)}
+    quarantine = Quarantine(args.quarantine_file)
+    pdf_paths = quarantine.filter(pdf_paths)
+    logging.info(f"{len(pdf_paths)} PDFs to process.")
+
+    Pipeline(args, es, quarantine, aliases).run(pdf_paths)
+    logging.info("Pipeline completed.")
+
+if __name__ == "__main__":
+    main()
@@ -1,64 +1,239 @@
 import os
+import json
 import time
+import argparse
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from elasticsearch import Elasticsearch, helpers
+from tqdm import tqdm
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def reindex_data():
+DEFAULT_BATCH_BYTES = 5 * 1024 * 1024
+MAX_WRITE_ATTEMPTS = 3
+
+class Checkpoint:
+    """
+    Per-slice progress, saved as JSON so an interrupted run can resume.
+
+    Entries are keyed by the source index and where it is copied to (see
+    copy_key), so a run against another target starts from scratch.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = {}
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.state = json.load(f)
+
+    @staticmethod
+    def copy_key(source, index, target):
+        return f"{source}/{index} -> {target}"
+
+    def slice_done(self, key, slice_id, max_slices):
+        entry = self.state.get(key, {})
+        if entry.get('max_slices') != max_slices:
+            return False
+        return entry.get('slices', {}).get(str(slice_id), {}).get('done', False)
+
+    def mark(self, key, slice_id, max_slices, docs, done):
+        with self.lock:
+            entry = self.state.setdefault(key, {'max_slices': max_slices, 'slices': {}})
+            if entry.get('max_slices') != max_slices:
+                # Slicing changed since the last run, so earlier progress does not apply
+                entry.clear()
+                entry.update({'max_slices': max_slices, 'slices': {}})
+            entry['slices'][str(slice_id)] = {'done': done, 'docs': docs}
+            self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+class ApiWriter:
+    """Posts batches to the API's /api/documents/_bulk over one keep-alive session"""
+
+    def __init__(self, target_url, pool_size):
+        self.url = f"{target_url}/api/documents/_bulk"
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def target(self, index):
+        return self.url
+
+    def serialize(self, index, hit):
+        # The API indexes under the given _id, so resumed slices overwrite instead of duplicating
+        return json.dumps({**hit['_source'], '_id': hit['_id']})
+
+    def write(self, batch):
+        body = '[' + ','.join(batch) + ']'
+        response = self.session.post(self.url, data=body.encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'}, timeout=120)
+        response.raise_for_status()
+        result = response.json()
+        if result.get('failed'):
+            raise RuntimeError(f"{result['failed']} documents failed to index")
+        return result.get('indexed', len(batch))
+
+class EsWriter:
+    """Sends batches straight to a target cluster's _bulk endpoint"""
+
+    def __init__(self, es, url, target_index=None):
+        self.es = es
+        self.url = url
+        self.target_index = target_index
+
+    def target(self, index):
+        return f"{self.url}/{self.target_index or index}"
+
+    def serialize(self, index, hit):
+        action = json.dumps({"index": {"_index": self.target_index or index, "_id": hit['_id']}})
+        return action + '\n' + json.dumps(hit['_source'])
+
+    def write(self, batch):
+        result = self.es.bulk(body='\n'.join(batch) + '\n', request_timeout=120)
+        if result.get('errors'):
+            failed = [item for item in result['items'] if item['index'].get('error')]
+            raise RuntimeError(f"{len(failed)} documents failed to index: {failed[0]['index']['error']}")
+        return len(batch)
+
+def iter_slice_batches(es, writer, index, slice_id, max_slices, batch_bytes, batch_docs, page_size, scroll):
+    """Scroll one slice of the index and yield byte-sized batches of serialized documents"""
+    body = {"query": {"match_all": {}}}
+    if max_slices > 1:
+        body["slice"] = {"id": slice_id, "max": max_slices}
+
+    batch = []
+    size = 0
+    for hit in helpers.scan(es, index=index, query=body, size=page_size, scroll=scroll):
+        doc = writer.serialize(index, hit)
+        batch.append(doc)
+        size += len(doc)
+        if size >= batch_bytes or len(batch) >= batch_docs:
+            yield batch
+            batch = []
+            size = 0
+    if batch:
+        yield batch
+
+def write_with_retry(writer, batch):
+    for attempt in range(1, MAX_WRITE_ATTEMPTS + 1):
+        try:
+            return writer.write(batch)
+        except Exception as e:
+            if attempt == MAX_WRITE_ATTEMPTS:
+                raise
+            logger.warning(f"Batch write failed (attempt {attempt}/{MAX_WRITE_ATTEMPTS}): {e}")
+            time.sleep(2 ** attempt)
+
+def reindex_slice(source_es, writer, write_pool, in_flight, checkpoint, index, slice_id, max_slices, args):
+    """Read one slice and hand its batches to the writer pool, keeping at most in_flight batches queued"""
+    key = Checkpoint.copy_key(args.source, index, writer.target(index))
+    if checkpoint.slice_done(key, slice_id, max_slices):
+        logger.info(f"{index} slice {slice_id}/{max_slices} already done, skipping")
+        return 0
+
+    progress = tqdm(desc=f"{index} slice {slice_id}", unit="docs", position=slice_id, leave=True)
+    pending = []
+
+    def on_written(future):
+        in_flight.release()
+        if not future.exception():
+            progress.update(future.result())
+
+    for batch in iter_slice_batches(source_es, writer, index, slice_id, max_slices,
+                                    args.batch_bytes, args.batch_docs, args.page_size, args.scroll):
+        in_flight.acquire()
+        future = write_pool.submit(write_with_retry, writer, batch)
+        future.add_done_callback(on_written)
+        pending.append(future)
+
+    written = 0
+    failed = 0
+    for future in pending:
+        try:
+            written += future.result()
+        except Exception as e:
+            failed += 1
+            logger.error(f"{index} slice {slice_id}: batch failed after {MAX_WRITE_ATTEMPTS} attempts: {e}")
+    progress.close()
+
+    # A slice only counts as done when every batch landed; otherwise a rerun repeats it.
+    # Documents keep their source _id, so repeating a slice overwrites instead of duplicating.
+    checkpoint.mark(key, slice_id, max_slices, written, done=failed == 0)
+    logger.info(f"{index} slice {slice_id}/{max_slices}: {written} documents written, {failed} batches failed")
+    return written
+
+def reindex_data(args):
     # Connect to source Elasticsearch
-    source_es = Elasticsearch([os.environ.get('ES_SOURCE', 'http://localhost:9200')])
-    target_url = os.environ.get('ES_TARGET', 'http://localhost:8000')
-    
-    logger.info(f"Source ES: {os.environ.get('ES_SOURCE')}")
-    logger.info(f"Target API: {target_url}")
-
-    # Get all indices
-    indices = source_es.indices.get_alias().keys()
+    source_es = Elasticsearch([args.source], timeout=120, max_retries=3, retry_on_timeout=True)
+
+    logger.info(f"Source ES: {args.source}")
+    if args.target_es:
+        logger.info(f"Target ES: {args.target_es}")
+        target_es = Elasticsearch([args.target_es], timeout=120, max_retries=3, retry_on_timeout=True,
+                                  maxsize=args.in_flight)
+        writer = EsWriter(target_es, args.target_es, args.target_index)
+    else:
+        logger.info(f"Target API: {args.target_api}")
+        writer = ApiWriter(args.target_api, args.in_flight)
+
+    # Get all indices, or only the requested ones
+    indices = args.index or [name for name in source_es.indices.get_alias().keys() if not name.startswith('.')]
     logger.info(f"Found indices: {list(indices)}")
-    
-    for index in indices:
-        logger.info(f"Reindexing {index}...")
-        
-        # Get documents from source
-        docs = helpers.scan(source_es, index=index, query={"query": {"match_all": {}}})
-        batch = []
-        
-        for doc in docs:
-            batch.append(doc['_source'])
-            
-            # Send in batches of 100
-            if len(batch) >= 100:
-                try:
-                    response = requests.post(
-                        f"{target_url}/api/documents/_bulk",
-                        json=batch
-                    )
-                    if response.status_code == 200:
-                        result = response.json()
-                        logger.info(f"Successfully indexed {result['indexed']} documents")
-                    else:
-                        logger.error(f"Error indexing batch: {response.text}")
-                except Exception as e:
-                    logger.error(f"Error sending batch: {e}")
-                batch = []
-        
-        # Send remaining documents
-        if batch:
-            try:
-                response = requests.post(
-                    f"{target_url}/api/documents/_bulk",
-                    json=batch
-                )
-                if response.status_code == 200:
-                    result = response.json()
-                    logger.info(f"Successfully indexed final {result['indexed']} documents")
-                else:
-                    logger.error(f"Error indexing final batch: {response.text}")
-            except Exception as e:
-                logger.error(f"Error sending final batch: {e}")
+
+    checkpoint = Checkpoint(args.checkpoint_file)
+    in_flight = threading.BoundedSemaphore(args.in_flight)
+    start = time.time()
+    total = 0
+
+    with ThreadPoolExecutor(max_workers=args.in_flight) as write_pool:
+        for index in indices:
+            logger.info(f"Reindexing {index} with {args.slices} slices...")
+            with ThreadPoolExecutor(max_workers=args.slices) as readers:
+                futures = [
+                    readers.submit(reindex_slice, source_es, writer, write_pool, in_flight, checkpoint,
+                                   index, slice_id, args.slices, args)
+                    for slice_id in range(args.slices)
+                ]
+                total += sum(future.result() for future in futures)
+
+    elapsed = time.time() - start
+    logger.info(f"Reindexed {total} documents in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} docs/s)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy Elasticsearch indices with parallel sliced scrolls.")
+    parser.add_argument('--source', default=os.environ.get('ES_SOURCE', 'http://localhost:9200'),
+                        help='Source Elasticsearch URL.')
+    parser.add_argument('--target_api', default=os.environ.get('ES_TARGET', 'http://localhost:8000'),
+                        help='Target API base URL; batches go to /api/documents/_bulk.')
+    parser.add_argument('--target_es', default=os.environ.get('ES_TARGET_CLUSTER'),
+                        help='Write straight to this Elasticsearch cluster instead of the API.')
+    parser.add_argument('--target_index', help='Index name on the target cluster (default: same as source).')
+    parser.add_argument('--index', action='append', help='Index to copy (repeatable). Default: all non-system indices.')
+    parser.add_argument('--slices', type=int, default=4, help='Parallel scroll slices per index.')
+    parser.add_argument('--in_flight', type=int, default=4, help='Batches being written concurrently.')
+    parser.add_argument('--batch_bytes', type=int, default=DEFAULT_BATCH_BYTES, help='Target batch size in bytes.')
+    parser.add_argument('--batch_docs', type=int, default=1000, help='Maximum documents per batch.')
+    parser.add_argument('--page_size', type=int, default=500, help='Documents fetched per scroll page.')
+    parser.add_argument('--scroll', default='10m', help='Scroll keep-alive.')
+    parser.add_argument('--checkpoint_file', default='reindex_checkpoint.json',
+                        help='Per-slice progress file used to resume an interrupted run.')
+    args = parser.parse_args()
+
+    reindex_data(args)
 
 if __name__ == "__main__":
-    reindex_data() 
\ No newline at end of file
+    main()
@@ -0,0 +1,137 @@
+import io
+import os
+import tempfile
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import boto3
+
+# Objects up to this size stay in memory; larger ones spill to a temp file
+DEFAULT_SPOOL_THRESHOLD = 64 * 1024 * 1024
+DEFAULT_MAX_CONCURRENT_GETS = 8
+STREAM_CHUNK_SIZE = 1024 * 1024
+RANGE_READ_SIZE = 8 * 1024 * 1024
+
+# Per-process state, set up once per worker by init_worker
+_client = None
+_client_kwargs = {}
+_get_slots = None
+_spool_threshold = DEFAULT_SPOOL_THRESHOLD
+
+def parse_s3_path(s3_path):
+    parsed = urlparse(s3_path)
+    return parsed.netloc, parsed.path.lstrip('/')
+
+def client_kwargs_from_env():
+    """Client settings for pointing boto3 at a local S3 stand-in (MinIO, moto server)"""
+    endpoint_url = os.environ.get('S3_ENDPOINT_URL')
+    return {'endpoint_url': endpoint_url} if endpoint_url else {}
+
+def init_worker(get_slots=None, spool_threshold=DEFAULT_SPOOL_THRESHOLD, client_kwargs=None):
+    """Pool initializer: remember the shared GET semaphore and reset the client.
+
+    Every worker process builds its own boto3 client on first use and reuses it
+    for all the objects it handles.
+    """
+    global _client, _client_kwargs, _get_slots, _spool_threshold
+    _client = None
+    _client_kwargs = client_kwargs or {}
+    _get_slots = get_slots
+    _spool_threshold = spool_threshold
+
+def create_client(client_kwargs=None):
+    return boto3.client('s3', **(client_kwargs or {}))
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = create_client(_client_kwargs)
+    return _client
+
+def iter_s3_pdfs(s3_path, client=None):
+    """Yield s3:// URIs of PDFs under s3_path one listing page at a time.
+
+    Work can start on the first page of keys while later pages are still
+    being listed.
+    """
+    bucket, prefix = parse_s3_path(s3_path)
+    s3 = client or get_client()
+    paginator = s3.get_paginator('list_objects_v2')
+
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            if obj['Key'].lower().endswith('.pdf'):
+                yield f"s3://{bucket}/{obj['Key']}"
+
+@contextmanager
+def open_s3_object(s3_uri, client=None):
+    """Stream an S3 object into a file object, in memory below the spool threshold.
+
+    The GET holds one of the shared download slots (if any) so the number of
+    concurrent requests across all workers stays bounded.
+    """
+    bucket, key = parse_s3_path(s3_uri)
+    s3 = client or get_client()
+
+    with tempfile.SpooledTemporaryFile(max_size=_spool_threshold, suffix='.pdf') as buffer:
+        if _get_slots is not None:
+            _get_slots.acquire()
+        try:
+            body = s3.get_object(Bucket=bucket, Key=key)['Body']
+            for chunk in body.iter_chunks(chunk_size=STREAM_CHUNK_SIZE):
+                buffer.write(chunk)
+        finally:
+            if _get_slots is not None:
+                _get_slots.release()
+
+        buffer.seek(0)
+        yield buffer
+
+class S3RangeReader(io.RawIOBase):
+    """Seekable read-only view of an S3 object backed by ranged GETs"""
+
+    def __init__(self, client, bucket, key):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.size = client.head_object(Bucket=bucket, Key=key)['ContentLength']
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.size + offset
+        return self.position
+
+    def readinto(self, buffer):
+        if self.position >= self.size:
+            return 0
+        end = min(self.position + len(buffer), self.size) - 1
+        body = self.client.get_object(Bucket=self.bucket, Key=self.key,
+                                      Range=f"bytes={self.position}-{end}")['Body']
+        data = body.read()
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+@contextmanager
+def open_s3_ranged(bucket, key, client=None):
+    """Open an S3 object for random access, fetching RANGE_READ_SIZE bytes per GET"""
+    reader = io.BufferedReader(S3RangeReader(client or get_client(), bucket, key),
+                               buffer_size=RANGE_READ_SIZE)
+    try:
+        yield reader
+    finally:
+        reader.close()
@@ -0,0 +1,156 @@
+import sys
+import time
+import argparse
+import logging
+from datetime import datetime
+from elasticsearch import Elasticsearch
+from elasticsearch.exceptions import NotFoundError
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Matches path.repo in docker-compose.yml, which mounts ./snapshots
+DEFAULT_REPOSITORY = 'backup'
+DEFAULT_LOCATION = '/usr/share/elasticsearch/snapshots'
+POLL_INTERVAL = 5
+
+def format_bytes(num_bytes):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if num_bytes < 1024:
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} TB"
+
+def register_repository(es, repository, location):
+    """Register (or re-register) the shared filesystem snapshot repository"""
+    es.snapshot.create_repository(
+        repository=repository,
+        body={"type": "fs", "settings": {"location": location, "compress": True}}
+    )
+    logger.info(f"Registered snapshot repository '{repository}' at {location}")
+
+def resolve_indices(es, name):
+    """Concrete indices behind an index name or alias"""
+    try:
+        return sorted(es.indices.get_alias(index=name).keys())
+    except NotFoundError:
+        return []
+
+def create_snapshot(es, repository, snapshot, index):
+    indices = resolve_indices(es, index)
+    if not indices:
+        logger.error(f"Index or alias '{index}' not found")
+        sys.exit(1)
+
+    logger.info(f"Creating snapshot '{snapshot}' of {', '.join(indices)}")
+    es.snapshot.create(
+        repository=repository,
+        snapshot=snapshot,
+        body={"indices": ','.join(indices), "include_global_state": False},
+        wait_for_completion=False
+    )
+
+    start = time.time()
+    while True:
+        time.sleep(POLL_INTERVAL)
+        status = es.snapshot.status(repository=repository, snapshot=snapshot)['snapshots'][0]
+        stats = status['stats']
+        processed = stats['processed']['size_in_bytes']
+        total = stats['total']['size_in_bytes']
+        elapsed = time.time() - start
+        logger.info(f"{status['state']}: {format_bytes(processed)} / {format_bytes(total)} "
+                    f"({stats['processed']['file_count']}/{stats['total']['file_count']} files, "
+                    f"{format_bytes(processed / max(elapsed, 1e-9))}/s)")
+        if status['state'] in ('SUCCESS', 'FAILED', 'PARTIAL'):
+            break
+
+    elapsed = time.time() - start
+    if status['state'] != 'SUCCESS':
+        logger.error(f"Snapshot '{snapshot}' finished with state {status['state']}")
+        sys.exit(1)
+    logger.info(f"Snapshot '{snapshot}' complete: {format_bytes(total)} in {elapsed:.1f}s "
+                f"({format_bytes(stats['incremental']['size_in_bytes'])} new since the last snapshot)")
+
+def restore_snapshot(es, repository, snapshot, replace=False):
+    # Snapshots are taken per index (or alias), so restore everything they hold
+    info = es.snapshot.get(repository=repository, snapshot=snapshot)['snapshots'][0]
+    indices = info['indices']
+
+    existing = [name for name in indices if es.indices.exists(index=name)]
+    if existing:
+        if not replace:
+            logger.error(f"Indices already exist: {', '.join(existing)}. Use --replace to overwrite them.")
+            sys.exit(1)
+        logger.info(f"Deleting existing indices before restore: {', '.join(existing)}")
+        es.indices.delete(index=','.join(existing))
+
+    logger.info(f"Restoring {', '.join(indices)} from snapshot '{snapshot}'")
+    es.snapshot.restore(
+        repository=repository,
+        snapshot=snapshot,
+        body={"indices": ','.join(indices), "include_aliases": True, "include_global_state": False},
+        wait_for_completion=False
+    )
+
+    start = time.time()
+    while True:
+        time.sleep(POLL_INTERVAL)
+        try:
+            recovery = es.indices.recovery(index=','.join(indices))
+        except NotFoundError:
+            # The restored indices appear shortly after the restore starts
+            continue
+        shards = [shard for name in indices for shard in recovery.get(name, {}).get('shards', [])]
+        recovered = sum(shard['index']['size']['recovered_in_bytes'] for shard in shards)
+        total = sum(shard['index']['size']['total_in_bytes'] for shard in shards)
+        done = sum(1 for shard in shards if shard['stage'] == 'DONE')
+        elapsed = time.time() - start
+        logger.info(f"Restored {format_bytes(recovered)} / {format_bytes(total)} "
+                    f"({done}/{len(shards)} shards, {format_bytes(recovered / max(elapsed, 1e-9))}/s)")
+        if shards and done == len(shards):
+            break
+
+    elapsed = time.time() - start
+    health = es.cluster.health(index=','.join(indices), wait_for_status='yellow', timeout='60s')
+    logger.info(f"Restore of '{snapshot}' complete in {elapsed:.1f}s; index health: {health['status']}")
+
+def list_snapshots(es, repository):
+    snapshots = es.snapshot.get(repository=repository, snapshot='_all')['snapshots']
+    if not snapshots:
+        logger.info(f"No snapshots in repository '{repository}'")
+    for snap in snapshots:
+        print(f"{snap['snapshot']:<40} {snap['state']:<10} {snap.get('start_time', ''):<28} "
+              f"{', '.join(snap['indices'])}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and import the search index with Elasticsearch snapshots.")
+    parser.add_argument('command', choices=['register', 'create', 'restore', 'list'])
+    parser.add_argument('--es_host', default='http://localhost:9200', help='Elasticsearch host URL.')
+    parser.add_argument('--repository', default=DEFAULT_REPOSITORY, help='Snapshot repository name.')
+    parser.add_argument('--location', default=DEFAULT_LOCATION, help='Repository path inside the Elasticsearch container.')
+    parser.add_argument('--index', default='pdf_documents', help='Index or alias to snapshot.')
+    parser.add_argument('--snapshot', help='Snapshot name (default for create: <index>-<timestamp>; for restore: latest).')
+    parser.add_argument('--replace', action='store_true', help='Delete existing indices before restoring.')
+    args = parser.parse_args()
+
+    es = Elasticsearch([args.es_host], timeout=120, max_retries=3, retry_on_timeout=True)
+    register_repository(es, args.repository, args.location)
+
+    if args.command == 'create':
+        snapshot = args.snapshot or f"{args.index}-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        create_snapshot(es, args.repository, snapshot, args.index)
+    elif args.command == 'restore':
+        snapshot = args.snapshot
+        if not snapshot:
+            snapshots = [s for s in es.snapshot.get(repository=args.repository, snapshot='_all')['snapshots']
+                         if s['state'] == 'SUCCESS']
+            if not snapshots:
+                logger.error(f"No successful snapshots in repository '{args.repository}'")
+                sys.exit(1)
+            snapshot = max(snapshots, key=lambda s: s['start_time_in_millis'])['snapshot']
+        restore_snapshot(es, args.repository, snapshot, args.replace)
+    elif args.command == 'list':
+        list_snapshots(es, args.repository)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import argparse
+from datetime import datetime
+
+import numpy as np
+from tqdm import tqdm
+from pdfminer.high_level import extract_text
+
+import text_cache
+import ocr_sidecar
+from catalog import open_catalog
+from dedup import DuplicateIndex
+from embedding_store import embed_texts, SENTENCE_MODEL
+from embedding_backends import load_backend, BACKENDS, EMBEDDING_BACKEND, EMBEDDING_THREADS
+
+try:
+    import hnswlib
+    HNSWLIB_AVAILABLE = True
+except ImportError:
+    HNSWLIB_AVAILABLE = False
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_OUTPUT_DIR = os.path.join('reports', 'vector_index')
+
+# PDFs whose texts are held in memory and embedded at a time
+PDFS_PER_BATCH = 1000
+
+# HNSW links per node and build-time candidate list; higher is more accurate and slower to build
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+
+
+def document_id(relative_path):
+    """Elasticsearch _id the ingester gives a PDF's document (or parent record)"""
+    return hashlib.sha1(relative_path.encode('utf-8')).hexdigest()
+
+
+def document_text(pdf_path):
+    """The text the ingester indexes for a PDF: OCR sidecar if there is one, else the text layer"""
+    def text_layer():
+        return text_cache.cached_file_text(pdf_path, extract_text)
+    sidecar_text = ocr_sidecar.read_sidecar(pdf_path)
+    if sidecar_text is not None:
+        return ocr_sidecar.merge_text_layer(sidecar_text, text_layer)
+    return text_layer()
+
+
+def build_index(input_folder, output_dir, model_name=SENTENCE_MODEL, dedup_file=None,
+                backend_name=EMBEDDING_BACKEND, threads=EMBEDDING_THREADS):
+    """
+    Embed every PDF in the corpus and write the index /api/semantic-search loads.
+
+    The index directory holds the vectors (vectors.f32, float32 rows), the
+    Elasticsearch ids of their documents (ids.json), an HNSW graph over
+    them if hnswlib is installed (hnsw.bin), and meta.json. Each file is
+    written under a temporary name and moved into place, meta.json last, so
+    the API never loads a half-written index. Texts come from the text
+    cache and embeddings from the embedding store, so after ingestion and
+    topic modelling only new PDFs are extracted or encoded.
+
+    With an ONNX backend the exported model is copied into encoder/, and
+    the API encodes queries with it, so queries and documents share one
+    vector space without torch in the API image.
+    """
+    catalog = open_catalog(input_folder)
+    pdf_files = catalog.pdfs()
+    catalog.close()
+    # The ingester indexes one copy of byte-identical PDFs; pick the same one
+    pdf_files = DuplicateIndex(dedup_file).dedupe(pdf_files)
+    logging.info(f"Embedding {len(pdf_files)} PDFs with {model_name} ({backend_name})")
+
+    backend = load_backend(backend_name, model_name, threads)
+    dim = backend.dim
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {name: os.path.join(output_dir, name) for name in ('vectors.f32', 'ids.json', 'hnsw.bin', 'meta.json')}
+    ids = []
+    with open(f"{paths['vectors.f32']}.tmp", 'wb') as out:
+        for start in tqdm(range(0, len(pdf_files), PDFS_PER_BATCH), desc="Embedding PDFs"):
+            batch_ids = []
+            texts = []
+            for pdf_path in pdf_files[start:start + PDFS_PER_BATCH]:
+                try:
+                    text = document_text(pdf_path).strip()
+                except Exception as e:
+                    logging.error(f"Error extracting text from {pdf_path}: {e}")
+                    continue
+                # The ingester skips PDFs without text, so there is no document to point to
+                if text:
+                    batch_ids.append(document_id(os.path.relpath(pdf_path, input_folder)))
+                    texts.append(text)
+            if texts:
+                embed_texts(texts, backend.encode, backend.store_name).astype(np.float32).tofile(out)
+                ids.extend(batch_ids)
+
+    with open(f"{paths['ids.json']}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(ids, f)
+
+    hnsw = HNSWLIB_AVAILABLE and bool(ids)
+    if hnsw:
+        vectors = np.memmap(f"{paths['vectors.f32']}.tmp", dtype=np.float32, mode='r', shape=(len(ids), dim))
+        # Vectors are unit length, so inner product ranks by cosine similarity
+        index = hnswlib.Index(space='ip', dim=dim)
+        index.init_index(max_elements=len(ids), M=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION)
+        index.add_items(vectors, np.arange(len(ids)))
+        index.save_index(f"{paths['hnsw.bin']}.tmp")
+        del vectors
+    else:
+        logging.warning("hnswlib is not installed; the API will search the vectors exhaustively. "
+                        "Install it with: pip install hnswlib")
+
+    encoder_dir = os.path.join(output_dir, 'encoder')
+    if backend_name != 'torch':
+        shutil.rmtree(f"{encoder_dir}.tmp", ignore_errors=True)
+        os.makedirs(f"{encoder_dir}.tmp")
+        for path in (backend.model_file, os.path.join(backend.directory, 'tokenizer.json'),
+                     os.path.join(backend.directory, 'encoder.json')):
+            shutil.copy2(path, f"{encoder_dir}.tmp")
+        shutil.rmtree(encoder_dir, ignore_errors=True)
+        os.replace(f"{encoder_dir}.tmp", encoder_dir)
+
+    meta = {
+        'model': model_name,
+        'backend': backend_name,
+        'dim': dim,
+        'count': len(ids),
+        'hnsw': hnsw,
+        'built_at': datetime.now().isoformat(timespec='seconds')
+    }
+    with open(f"{paths['meta.json']}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=4)
+
+    for name in ('vectors.f32', 'ids.json', 'hnsw.bin', 'meta.json'):
+        if os.path.exists(f"{paths[name]}.tmp"):
+            os.replace(f"{paths[name]}.tmp", paths[name])
+        elif name == 'hnsw.bin' and os.path.exists(paths[name]):
+            os.remove(paths[name])
+    logging.info(f"Wrote a vector index of {len(ids)} documents to {output_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the vector index used by /api/semantic-search.")
+    parser.add_argument('--input_folder', required=True, help='Corpus root, the same directory the ingester indexed.')
+    parser.add_argument('--output_dir', default=DEFAULT_OUTPUT_DIR, help='Where the index files are written.')
+    parser.add_argument('--model', default=SENTENCE_MODEL, help='Sentence-transformers model for the embeddings.')
+    parser.add_argument('--backend', choices=BACKENDS, default=EMBEDDING_BACKEND,
+                        help='Embedding backend; onnx runs the model int8-quantized through ONNX Runtime.')
+    parser.add_argument('--threads', type=int, default=EMBEDDING_THREADS,
+                        help='Intra-op threads for encoding (0: all cores).')
+    parser.add_argument('--dedup_file', default='reports/dedup.json',
+                        help='Content hashes of local PDFs, used to skip byte-identical copies as the ingester does.')
+    args = parser.parse_args()
+    build_index(args.input_folder, args.output_dir, args.model, args.dedup_file, args.backend, args.threads)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import sqlite3
+import argparse
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from dedup import file_digest, HASH_THREADS
+
+# Shared by every corpus; rows are keyed by the corpus root and the path
+# under it, both relative to the catalog's directory, so the host
+# (./data, ./reports) and the ingest container (/app/data, /app/reports)
+# share them
+DEFAULT_CATALOG_PATH = os.environ.get(
+    'CATALOG_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'reports', 'catalog.sqlite')
+)
+
+# Everything derived from the file's content is cleared when the file changes
+RESET_CONTENT = "sha256 = NULL, page_count = NULL, selectable = NULL, ocr_done = 0, redacted = 0, indexed = 0"
+BOOLEAN_FIELDS = ('selectable', 'ocr_done', 'redacted', 'indexed')
+# A stage that could not determine these leaves the recorded value alone
+KEEP_IF_UNKNOWN = ('sha256', 'page_count')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pdfs (
+    root TEXT NOT NULL,
+    relpath TEXT NOT NULL,
+    dir TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    sha256 TEXT,
+    page_count INTEGER,
+    selectable INTEGER,
+    ocr_done INTEGER NOT NULL DEFAULT 0,
+    redacted INTEGER NOT NULL DEFAULT 0,
+    indexed INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT,
+    PRIMARY KEY (root, relpath)
+);
+CREATE INDEX IF NOT EXISTS pdfs_dir ON pdfs (root, dir);
+CREATE TABLE IF NOT EXISTS dirs (
+    root TEXT NOT NULL,
+    relpath TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    subdirs TEXT NOT NULL,
+    PRIMARY KEY (root, relpath)
+);
+"""
+
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+class Catalog:
+    """
+    SQLite catalog with one row per PDF under a corpus root.
+
+    One database can hold several corpora; every query is scoped to this
+    catalog's root, so refreshing one corpus never touches another's rows.
+
+    Each row holds size, mtime, hash, page count and the pipeline status
+    (text layer, OCR, redaction, indexing). refresh() only lists directories
+    whose mtime changed since the last refresh, and a file whose size or mtime
+    changed has its content-derived fields reset. Stages ask pdfs() for their
+    work list and record their results with mark().
+    """
+
+    def __init__(self, root, path=DEFAULT_CATALOG_PATH):
+        self.root = root
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.key = os.path.relpath(os.path.abspath(root), directory)
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(pdfs)")]
+        if columns and 'root' not in columns:
+            # Catalogs from before rows were keyed by root cannot tell which corpus a row belongs to
+            logging.warning(f"Rebuilding catalog {path}: it predates per-corpus rows")
+            self.conn.executescript("DROP TABLE pdfs; DROP TABLE IF EXISTS dirs;")
+        self.conn.executescript(SCHEMA)
+
+    def relpath(self, path):
+        return os.path.relpath(path, self.root)
+
+    def refresh(self, full=False):
+        """
+        Bring the catalog in line with the files under the root.
+
+        Args:
+            full (bool): List every directory, even those whose mtime is unchanged.
+
+        Returns:
+            tuple: Counts of (added, changed, removed) PDFs.
+        """
+        known_dirs = {rel: (mtime, json.loads(subdirs))
+                      for rel, mtime, subdirs in self.conn.execute("SELECT relpath, mtime, subdirs FROM dirs WHERE root = ?", (self.key,))}
+        seen_dirs = set()
+        added = changed = removed = 0
+        stack = ['']
+
+        with self.conn:
+            while stack:
+                rel_dir = stack.pop()
+                try:
+                    dir_mtime = os.stat(os.path.join(self.root, rel_dir)).st_mtime
+                except FileNotFoundError:
+                    continue
+                seen_dirs.add(rel_dir)
+
+                known = known_dirs.get(rel_dir)
+                if known and known[0] == dir_mtime and not full:
+                    # No entries were added, removed or renamed here
+                    stack.extend(known[1])
+                    continue
+
+                subdirs = []
+                files = {}
+                for entry in os.scandir(os.path.join(self.root, rel_dir)):
+                    rel = os.path.join(rel_dir, entry.name)
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(rel)
+                    elif entry.is_file() and entry.name.lower().endswith('.pdf'):
+                        files[rel] = entry.stat()
+
+                existing = {rel: (size, mtime) for rel, size, mtime in
+                            self.conn.execute("SELECT relpath, size, mtime FROM pdfs WHERE root = ? AND dir = ?",
+                                              (self.key, rel_dir))}
+                for rel, stat in files.items():
+                    if rel not in existing:
+                        self.conn.execute("INSERT INTO pdfs (root, relpath, dir, size, mtime, updated_at) "
+                                          "VALUES (?, ?, ?, ?, ?, ?)",
+                                          (self.key, rel, rel_dir, stat.st_size, stat.st_mtime, _now()))
+                        added += 1
+                    elif existing[rel] != (stat.st_size, stat.st_mtime):
+                        self.conn.execute(f"UPDATE pdfs SET size = ?, mtime = ?, {RESET_CONTENT}, updated_at = ? "
+                                          "WHERE root = ? AND relpath = ?",
+                                          (stat.st_size, stat.st_mtime, _now(), self.key, rel))
+                        changed += 1
+                for rel in set(existing) - set(files):
+                    self.conn.execute("DELETE FROM pdfs WHERE root = ? AND relpath = ?", (self.key, rel))
+                    removed += 1
+
+                self.conn.execute("INSERT OR REPLACE INTO dirs (root, relpath, mtime, subdirs) VALUES (?, ?, ?, ?)",
+                                  (self.key, rel_dir, dir_mtime, json.dumps(subdirs)))
+                stack.extend(subdirs)
+
+            for rel_dir in set(known_dirs) - seen_dirs:
+                removed += self.conn.execute("DELETE FROM pdfs WHERE root = ? AND dir = ?",
+                                             (self.key, rel_dir)).rowcount
+                self.conn.execute("DELETE FROM dirs WHERE root = ? AND relpath = ?", (self.key, rel_dir))
+
+        if added or changed or removed:
+            logging.info(f"Catalog refreshed: {added} added, {changed} changed, {removed} removed")
+        return added, changed, removed
+
+    def _where(self, filters):
+        clauses = ["root = ?"]
+        params = [self.key]
+        for field, value in filters.items():
+            if value is None:
+                clauses.append(f"{field} IS NULL")
+            else:
+                clauses.append(f"{field} = ?")
+                params.append(int(value) if isinstance(value, bool) else value)
+        return ' WHERE ' + ' AND '.join(clauses), params
+
+    def rows(self, **filters):
+        """Catalog rows matching the filters, e.g. rows(selectable=False, ocr_done=False)"""
+        where, params = self._where(filters)
+        cursor = self.conn.execute(f"SELECT * FROM pdfs{where} ORDER BY relpath", params)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def pdfs(self, **filters):
+        """Paths (joined to the root) of the PDFs matching the filters"""
+        return [os.path.join(self.root, row['relpath']) for row in self.rows(**filters)]
+
+    def mark(self, paths, **fields):
+        """
+        Record stage results for PDFs.
+
+        The files are stat'ed again, so a file a stage rewrote on purpose
+        (in-place OCR) is not treated as changed by the next refresh; its
+        hash is computed again instead. None for sha256 or page_count means
+        the stage could not tell, and keeps the recorded value.
+
+        Args:
+            paths (list): Paths under the root.
+            **fields: Columns to set, e.g. ocr_done=True, page_count=12.
+        """
+        if isinstance(paths, str):
+            paths = [paths]
+        values = {field: int(value) if field in BOOLEAN_FIELDS and value is not None else value
+                  for field, value in fields.items()
+                  if not (field in KEEP_IF_UNKNOWN and value is None)}
+        assignments = ''.join(f"{field} = ?, " for field in values)
+        with self.conn:
+            for path in paths:
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                rel = self.relpath(path)
+                row = self.conn.execute("SELECT size, mtime FROM pdfs WHERE root = ? AND relpath = ?",
+                                        (self.key, rel)).fetchone()
+                if row is None:
+                    continue
+                rewritten = row != (stat.st_size, stat.st_mtime) and 'sha256' not in values
+                self.conn.execute(
+                    f"UPDATE pdfs SET {assignments}size = ?, mtime = ?, "
+                    f"{'sha256 = ?, ' if rewritten else ''}updated_at = ? WHERE root = ? AND relpath = ?",
+                    [*values.values(), stat.st_size, stat.st_mtime,
+                     *([file_digest(path)] if rewritten else []), _now(), self.key, rel]
+                )
+
+    def fill_hashes(self):
+        """Compute the SHA-256 of every PDF that has none yet"""
+        paths = self.pdfs(sha256=None)
+        with ThreadPoolExecutor(max_workers=HASH_THREADS) as executor:
+            digests = list(executor.map(file_digest, paths))
+        with self.conn:
+            self.conn.executemany("UPDATE pdfs SET sha256 = ? WHERE root = ? AND relpath = ?",
+                                  [(digest, self.key, self.relpath(path)) for path, digest in zip(paths, digests)])
+        return len(paths)
+
+    def summary(self):
+        row = self.conn.execute("""
+            SELECT COUNT(*), COALESCE(SUM(size), 0),
+                   SUM(sha256 IS NOT NULL), SUM(selectable IS NULL), SUM(selectable = 0),
+                   SUM(ocr_done), SUM(selectable = 0 AND ocr_done = 0), SUM(redacted), SUM(indexed)
+            FROM pdfs WHERE root = ?
+        """, (self.key,)).fetchone()
+        keys = ['pdfs', 'bytes', 'hashed', 'unchecked', 'unselectable', 'ocr_done', 'needs_ocr', 'redacted', 'indexed']
+        return {key: value or 0 for key, value in zip(keys, row)}
+
+    def close(self):
+        self.conn.close()
+
+
+def open_catalog(root, path=None):
+    """Open the catalog for a corpus root and bring it up to date"""
+    catalog = Catalog(root, path or DEFAULT_CATALOG_PATH)
+    catalog.refresh()
+    return catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Update the corpus catalog and show the pipeline status")
+    parser.add_argument('--input_folder', required=True, help='Corpus root containing the PDFs')
+    parser.add_argument('--catalog_file', default=DEFAULT_CATALOG_PATH, help='Catalog database path')
+    parser.add_argument('--full', action='store_true', help='Re-stat every file, not only changed directories')
+    parser.add_argument('--hash', action='store_true', help='Compute missing SHA-256 hashes')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    catalog = Catalog(args.input_folder, args.catalog_file)
+    added, changed, removed = catalog.refresh(full=args.full)
+    print(f"Catalog {args.catalog_file}: {added} added, {changed} changed, {removed} removed")
+    if args.hash:
+        print(f"Hashed {catalog.fill_hashes()} PDFs")
+
+    summary = catalog.summary()
+    print(f"PDFs:            {summary['pdfs']} ({summary['bytes'] / 1024 ** 3:.2f} GB)")
+    print(f"Hashed:          {summary['hashed']}")
+    print(f"Not checked yet: {summary['unchecked']}")
+    print(f"No text layer:   {summary['unselectable']} ({summary['needs_ocr']} still need OCR)")
+    print(f"OCR done:        {summary['ocr_done']}")
+    print(f"Redacted:        {summary['redacted']}")
+    print(f"Indexed:         {summary['indexed']}")
+    catalog.close()
+
+if __name__ == "__main__":
+    main()
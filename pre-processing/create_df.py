@@ -1,11 +1,16 @@
-import os
 import pandas as pd
 from pdfminer.high_level import extract_text
 from tqdm import tqdm
 import argparse
 import logging
 import pickle
+from functools import partial
 from multiprocessing import Pool, cpu_count
+import extraction_watchdog
+from extraction_watchdog import Quarantine
+from dedup import DuplicateIndex
+from catalog import open_catalog
+import text_cache
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -24,8 +29,11 @@ def extract_pdf_text(pdf_path):
     Extract text from a PDF file.
     """
     try:
-        text = extract_text(pdf_path)
+        text = text_cache.cached_file_text(pdf_path, extract_text)
         return sanitize_text(text)
+    except MemoryError:
+        # Let the watchdog record the file as failed
+        raise
     except Exception as e:
         logging.error(f"Error extracting text from {pdf_path}: {e}")
         return ""
@@ -37,22 +45,46 @@ def process_single_pdf(args):
         return {'full_path': full_path, 'text': text}
     return None
 
-def process_pdfs(input_folder):
+def process_pdfs(input_folder, quarantine_file=None,
+                 time_limit=extraction_watchdog.DEFAULT_TIME_LIMIT,
+                 memory_limit_mb=extraction_watchdog.DEFAULT_MEMORY_LIMIT_MB,
+                 max_tasks_per_child=extraction_watchdog.DEFAULT_MAX_TASKS_PER_CHILD,
+                 dedup_file=None):
     """
     Process all PDFs in the input folder and create a DataFrame.
+    Files that time out, exceed the memory limit or crash go to the quarantine list.
+    Byte-identical copies are extracted once; their paths go in the 'aliases' column.
     """
-    pdf_files = []
-    for root, _, files in os.walk(input_folder):
-        for file in files:
-            if file.lower().endswith('.pdf'):
-                full_path = os.path.join(root, file)
-                pdf_files.append((full_path, input_folder))
+    catalog = open_catalog(input_folder)
+    pdf_paths = catalog.pdfs()
+    catalog.close()
     
+    duplicates = DuplicateIndex(dedup_file)
+    pdf_files = [(full_path, input_folder) for full_path in duplicates.dedupe(pdf_paths)]
+    duplicates.save()
+    
+    # Files that failed on earlier runs are skipped
+    quarantine = Quarantine(quarantine_file)
+    pdf_files = quarantine.filter(pdf_files)
+    
+    data = []
     pool_size = max(1, cpu_count() - 2)  # Ensure at least 1 process
-    with Pool(processes=pool_size) as pool:
-        results = list(tqdm(pool.imap(process_single_pdf, pdf_files), total=len(pdf_files), desc="Processing PDFs"))
+    with Pool(processes=pool_size,
+              maxtasksperchild=max_tasks_per_child or None,
+              initializer=extraction_watchdog.init_worker,
+              initargs=(time_limit, memory_limit_mb)) as pool:
+        results = pool.imap(partial(extraction_watchdog.guarded_call, process_single_pdf), pdf_files)
+        for full_path, result, error in tqdm(results, total=len(pdf_files), desc="Processing PDFs"):
+            if error:
+                quarantine.record_failure(full_path, error, stage='create-df')
+                continue
+            quarantine.record_success(full_path)
+            if result is not None:
+                result['aliases'] = duplicates.aliases_of(full_path)
+                data.append(result)
     
-    data = [result for result in results if result is not None]
+    quarantine.save()
+    quarantine.report()
     return pd.DataFrame(data)
 
 def save_dataframe(df, output_file):
@@ -67,10 +99,21 @@ def main():
     parser = argparse.ArgumentParser(description="Create a DataFrame from PDF documents")
     parser.add_argument('--input_folder', required=True, help='Path to the folder containing PDFs')
     parser.add_argument('--output_file', required=True, help='Path to save the output DataFrame')
+    parser.add_argument('--time_limit', type=int, default=extraction_watchdog.DEFAULT_TIME_LIMIT,
+                        help='Seconds allowed per PDF before it counts as failed (0 disables)')
+    parser.add_argument('--memory_limit_mb', type=int, default=extraction_watchdog.DEFAULT_MEMORY_LIMIT_MB,
+                        help='Memory limit per worker process in MB (0 disables)')
+    parser.add_argument('--max_tasks_per_child', type=int, default=extraction_watchdog.DEFAULT_MAX_TASKS_PER_CHILD,
+                        help='Recycle each worker process after this many PDFs')
+    parser.add_argument('--quarantine_file', default='reports/quarantine.json',
+                        help='Quarantine list of PDFs that repeatedly fail')
+    parser.add_argument('--dedup_file', default='reports/dedup.json',
+                        help='Content hashes and duplicate paths of the PDFs')
     args = parser.parse_args()
 
     logging.info("Starting PDF processing")
-    df = process_pdfs(args.input_folder)
+    df = process_pdfs(args.input_folder, args.quarantine_file, args.time_limit,
+                      args.memory_limit_mb, args.max_tasks_per_child, args.dedup_file)
     
     logging.info(f"Created DataFrame with {len(df)} documents")
     
@@ -0,0 +1,156 @@
+import os
+import json
+import hashlib
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+PARTIAL_BYTES = 64 * 1024
+READ_BYTES = 1024 * 1024
+HASH_THREADS = 8
+
+
+def partial_digest(path, partial_bytes=PARTIAL_BYTES):
+    """SHA-256 of the first and last partial_bytes of a file"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        h.update(f.read(partial_bytes))
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size > partial_bytes:
+            f.seek(max(partial_bytes, size - partial_bytes))
+            h.update(f.read(partial_bytes))
+    return h.hexdigest()
+
+
+def file_digest(path):
+    """SHA-256 of a whole file, read in 1MB blocks"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_BYTES), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def bytes_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class DuplicateIndex:
+    """
+    Finds byte-identical PDFs so each unique file is processed once.
+
+    Files are compared by size first, then by a hash of their first and last
+    64KB, and only files that still collide get a full SHA-256. Hashes are
+    kept in a JSON manifest keyed by path and reused while the file's size
+    and mtime are unchanged, so later runs and other scripts hash nothing new.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.files = {}
+        self.aliases = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+                self.files = manifest.get('files', {})
+                self.aliases = manifest.get('aliases', {})
+            except Exception as e:
+                logging.warning(f"Could not read dedup manifest {path}: {e}")
+
+    def _entry(self, path):
+        """Manifest entry for path, reset if the file changed since it was hashed"""
+        stat = os.stat(path)
+        entry = self.files.get(path)
+        if not entry or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+            entry = {'size': stat.st_size, 'mtime': stat.st_mtime}
+            self.files[path] = entry
+        return entry
+
+    def _fill(self, entries, key, digest_func):
+        """Compute a digest for the entries missing it, using a few threads for I/O"""
+        missing = [path for path in entries if key not in entries[path]]
+        if not missing:
+            return
+        with ThreadPoolExecutor(max_workers=HASH_THREADS) as executor:
+            for path, digest in zip(missing, executor.map(digest_func, missing)):
+                entries[path][key] = digest
+
+    def digest(self, path):
+        """Full SHA-256 of a file, from the manifest when it is still current"""
+        entry = self._entry(path)
+        if 'sha256' not in entry:
+            entry['sha256'] = file_digest(path)
+        return entry['sha256']
+
+    def dedupe(self, paths):
+        """
+        Reduce paths to one canonical path per unique file.
+
+        Args:
+            paths (list): File paths, possibly with byte-identical copies.
+
+        Returns:
+            list: The canonical paths, in input order. The other copies are
+            recorded in self.aliases under their canonical path.
+        """
+        entries = {}
+        for path in paths:
+            try:
+                entries[path] = self._entry(path)
+            except OSError as e:
+                logging.warning(f"Cannot stat {path}: {e}")
+
+        by_size = defaultdict(list)
+        for path, entry in entries.items():
+            by_size[entry['size']].append(path)
+        candidates = {path: entries[path] for group in by_size.values() if len(group) > 1 for path in group}
+
+        self._fill(candidates, 'partial', partial_digest)
+        by_partial = defaultdict(list)
+        for path, entry in candidates.items():
+            by_partial[(entry['size'], entry['partial'])].append(path)
+        candidates = {path: entries[path] for group in by_partial.values() if len(group) > 1 for path in group}
+
+        self._fill(candidates, 'sha256', file_digest)
+        by_digest = defaultdict(list)
+        for path, entry in candidates.items():
+            by_digest[entry['sha256']].append(path)
+
+        # Forget aliases from earlier runs for these files; they are recomputed below
+        for path in entries:
+            self.aliases.pop(path, None)
+
+        duplicates = set()
+        for group in by_digest.values():
+            if len(group) < 2:
+                continue
+            # The first path in sorted order is canonical so every script picks the same one
+            canonical, *others = sorted(group)
+            self.aliases[canonical] = others
+            duplicates.update(others)
+
+        unique = [path for path in entries if path not in duplicates]
+        if duplicates:
+            logging.info(f"Found {len(duplicates)} duplicate copies; processing {len(unique)} unique files")
+        return unique
+
+    def aliases_of(self, path):
+        """Other paths with the same content as a canonical path"""
+        return self.aliases.get(path, [])
+
+    def expand(self, paths):
+        """Map canonical paths back to themselves plus all their aliases"""
+        return [alias for path in paths for alias in [path] + self.aliases_of(path)]
+
+    def save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'files': self.files, 'aliases': self.aliases}, f, indent=4)
+        os.replace(tmp_path, self.path)
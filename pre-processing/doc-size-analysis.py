@@ -1,53 +1,23 @@
 import os
 import matplotlib.pyplot as plt
 import numpy as np
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from fpdf import FPDF
 import argparse
+from catalog import open_catalog
 
 # -------------------------------------------------
 # Utility Functions
 # -------------------------------------------------
 
-def get_pdf_size(file_path):
+def get_pdf_sizes(input_folder):
     """
-    Get the size of a PDF file in megabytes (MB).
+    Get (path, size in MB) for every PDF from the corpus catalog,
+    which only re-stats directories that changed since the last run.
     """
-    try:
-        file_size = os.path.getsize(file_path) / (1024 * 1024)  # Convert bytes to MB
-        return file_size
-    except Exception as e:
-        print(f"Error getting size for {file_path}: {e}")
-        return None
-
-def get_pdf_files(input_folder):
-    """
-    Recursively find all PDF files in the specified folder.
-    """
-    pdf_files = []
-    for root, _, files in os.walk(input_folder):
-        for file_name in files:
-            if file_name.lower().endswith('.pdf'):
-                file_path = os.path.join(root, file_name)
-                pdf_files.append(file_path)
-    return pdf_files
-
-def get_pdf_sizes_concurrently(pdf_files, max_workers=8):
-    """
-    Get the sizes of PDF files concurrently using threading.
-    """
-    pdf_sizes = []
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {executor.submit(get_pdf_size, pdf_file): pdf_file for pdf_file in pdf_files}
-        for future in as_completed(futures):
-            pdf_file = futures[future]
-            try:
-                size = future.result()
-                if size is not None:
-                    pdf_sizes.append((pdf_file, size))
-            except Exception as e:
-                print(f"Error processing {pdf_file}: {e}")
-    return pdf_sizes
+    catalog = open_catalog(input_folder)
+    pdf_data = [(os.path.join(input_folder, row['relpath']), row['size'] / (1024 * 1024)) for row in catalog.rows()]
+    catalog.close()
+    return pdf_data
 
 # -------------------------------------------------
 # Visualization Functions
@@ -157,11 +127,8 @@ def main():
     # Ensure output directory exists
     os.makedirs(output_dir, exist_ok=True)
 
-    # Retrieve all PDF files
-    pdf_files = get_pdf_files(input_folder)
-
-    # Get sizes concurrently
-    pdf_data = get_pdf_sizes_concurrently(pdf_files, max_workers=os.cpu_count())
+    # Retrieve the sizes of all PDF files
+    pdf_data = get_pdf_sizes(input_folder)
 
     # Generate combined chart
     combined_chart_img_path = generate_combined_chart(pdf_data, output_dir)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+import re
+import time
+import argparse
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+try:
+    from dateutil import parser as date_parser
+    DATEUTIL_AVAILABLE = True
+except ImportError:
+    DATEUTIL_AVAILABLE = False
+
+# One compiled pattern per line kind; every line is matched at most once
+# against each, so parsing is linear in the length of the text
+HEADER_LINE = re.compile(
+    r'[ \t>]*(from|sender|sent|date|to|cc|bcc|subject)[ \t]*:[ \t]*(.*)',
+    re.IGNORECASE
+)
+MESSAGE_SEPARATOR = re.compile(r'\s*-{2,}\s*(?:original message|forwarded message)\s*-{2,}', re.IGNORECASE)
+EMAIL_REGEX = re.compile(r'[\w\.-]+@[\w\.-]+\.\w+')
+
+FIELD_NAMES = {'sender': 'from', 'sent': 'date'}
+# dateutil fills in missing parts from its default; a value that leaves
+# this year in place named no year, and is not taken as a date
+SENTINEL_DATE = datetime(1, 1, 1)
+ADDRESS_FIELDS = ('from', 'to', 'cc', 'bcc')
+# A message needs one of these besides a From without an address
+OTHER_HEADERS = ('to', 'cc', 'bcc', 'date', 'subject')
+
+
+def _new_message(offset):
+    return {'offset': offset, 'from': '', 'to': '', 'cc': '', 'bcc': '', 'date': '', 'subject': ''}
+
+
+def _finish(messages, message):
+    """
+    Add the email addresses found in the address fields and keep the message.
+
+    A 'From: ...' line in a body ('From: there we went on') has no address
+    and no other headers; it is dropped rather than counted as a message.
+    """
+    for field in ADDRESS_FIELDS:
+        message[f'{field}_emails'] = EMAIL_REGEX.findall(message[field])
+    if message['from_emails'] or any(message[field] for field in OTHER_HEADERS):
+        messages.append(message)
+
+
+def parse_messages(text):
+    """
+    Split a PDF's text into the email messages it contains.
+
+    A line-by-line state machine: a From (or Sender) header, or an
+    '-----Original Message-----' line, starts a new message. The header
+    lines that follow fill in To, Cc, Bcc, Date (or Sent) and Subject. A
+    header whose value is on the next line, as pdfminer often lays it out,
+    takes the next non-blank line, or for Date only a line that parses as a
+    date. A To/Cc/Bcc value keeps taking lines
+    holding addresses, and the first other line ends the header block.
+    Header lines in a message body are ignored unless they start a message,
+    and messages with neither a sender address nor any other header are
+    dropped.
+
+    Args:
+        text (str): Extracted text of one PDF.
+
+    Returns:
+        list: One dict per message with the raw 'from', 'to', 'cc', 'bcc',
+            'date' and 'subject' values, the addresses in each address field
+            ('from_emails', 'to_emails', ...), and the character 'offset'
+            where the message starts.
+    """
+    messages = []
+    message = None
+    in_headers = False
+    field = None
+    awaiting_value = False
+    offset = 0
+
+    for line in text.splitlines(keepends=True):
+        line_offset = offset
+        offset += len(line)
+        line = line.strip()
+
+        # Cheap substring tests keep the regexes off most body lines
+        if '--' in line and MESSAGE_SEPARATOR.match(line):
+            if message is not None:
+                _finish(messages, message)
+            message = _new_message(line_offset)
+            in_headers = True
+            field = None
+            continue
+
+        header = HEADER_LINE.match(line) if ':' in line else None
+        if header:
+            name = header.group(1).lower()
+            name = FIELD_NAMES.get(name, name)
+            value = header.group(2).strip()
+            if name == 'from' and (message is None or message['from'] or not in_headers):
+                if message is not None:
+                    _finish(messages, message)
+                message = _new_message(line_offset)
+                in_headers = True
+            if message is None or not in_headers:
+                continue
+            field = name
+            message[field] = value if not message[field] else f"{message[field]} {value}"
+            awaiting_value = not value
+            continue
+
+        if not in_headers or not line:
+            continue
+        if awaiting_value and (field != 'date' or parse_date(line)):
+            message[field] = line
+            awaiting_value = False
+        elif awaiting_value:
+            # 'Date:' with no value, followed by the body
+            in_headers = False
+            field = None
+            awaiting_value = False
+        elif field in ('to', 'cc', 'bcc') and ('@' in line or line.endswith((';', ','))):
+            # An address list wrapped onto the next line
+            message[field] = f"{message[field]} {line}"
+        else:
+            in_headers = False
+            field = None
+
+    if message is not None:
+        _finish(messages, message)
+    return messages
+
+
+def parse_date(value):
+    """
+    Day a Date or Sent header value refers to.
+
+    RFC 2822 dates ('Mon, 2 Mar 2020 09:00:00 -0500') are parsed by the
+    standard library, and Outlook's 'Monday, March 2, 2020 9:00 AM' style
+    by dateutil when it is installed. The whole value must be a date with
+    an explicit year; 'Tuesday' or 'Re: budget for 2019' is not one.
+
+    Returns:
+        datetime.date: The day, or None if the value is not a date.
+    """
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).date()
+    except (TypeError, ValueError, IndexError):
+        pass
+    if DATEUTIL_AVAILABLE:
+        try:
+            parsed = date_parser.parse(value, default=SENTINEL_DATE)
+        except (ValueError, OverflowError):
+            return None
+        if parsed.year != SENTINEL_DATE.year:
+            return parsed.date()
+    return None
+
+
+def message_relationships(messages):
+    """Sender -> recipient pairs (To and Cc) from parsed messages, without self-loops"""
+    relationships = []
+    for message in messages:
+        if not message['from_emails']:
+            continue
+        sender = message['from_emails'][0]
+        for receiver in message['to_emails'] + message['cc_emails']:
+            if receiver != sender:
+                relationships.append((sender, receiver))
+    return relationships
+
+
+def header_fields(messages):
+    """Search fields for a PDF's messages, as stored by the Elasticsearch ingester"""
+    def unique(values):
+        return list(dict.fromkeys(value for value in values if value))
+    return {
+        'email_from': unique(email.lower() for m in messages for email in m['from_emails']),
+        'email_to': unique(email.lower() for m in messages for email in m['to_emails'] + m['cc_emails']),
+        'email_subject': unique(m['subject'] for m in messages),
+        'message_count': len(messages)
+    }
+
+
+# The patterns EmailNetworkAnalyzer matched with before, kept for the benchmark
+LEGACY_FROM_PATTERN = r'(?:From:|From|Sender:).*?(?=To:|Cc:|Subject:|$)'
+LEGACY_TO_PATTERN = r'(?:To:|To).*?(?=From:|Cc:|Subject:|$)'
+
+
+def legacy_relationships(text):
+    relationships = []
+    to_sections = re.finditer(LEGACY_TO_PATTERN, text, re.IGNORECASE | re.MULTILINE)
+    for from_match in re.finditer(LEGACY_FROM_PATTERN, text, re.IGNORECASE | re.MULTILINE):
+        sender_emails = re.findall(EMAIL_REGEX, from_match.group())
+        if sender_emails:
+            for to_match in to_sections:
+                for receiver in re.findall(EMAIL_REGEX, to_match.group()):
+                    if receiver != sender_emails[0]:
+                        relationships.append((sender_emails[0], receiver))
+    return relationships
+
+
+def benchmark(paths, repeat=3):
+    """Time the header parser against the old regexes on the given text or PDF files"""
+    texts = []
+    for path in paths:
+        if path.lower().endswith('.pdf'):
+            from text_cache import cached_file_text
+            from pdfminer.high_level import extract_text
+            texts.append(cached_file_text(path, extract_text))
+        else:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                texts.append(f.read())
+    total_mb = sum(len(text) for text in texts) / 1024 / 1024
+    print(f"{len(texts)} texts, {total_mb:.1f} MB")
+
+    for name, func in (('parse_messages', lambda t: message_relationships(parse_messages(t))),
+                       ('legacy regexes', legacy_relationships)):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            found = sum(len(func(text)) for text in texts)
+            best = min(best, time.perf_counter() - start)
+        print(f"{name:16} {best:8.3f}s  {total_mb / best:8.1f} MB/s  {found} relationships")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the email header parser")
+    parser.add_argument('paths', nargs='+', help='PDF or text files, e.g. large email dumps')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per parser; the fastest is reported')
+    args = parser.parse_args()
+    benchmark(args.paths, args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,28 @@
-import re
 import pandas as pd
 import networkx as nx
 import numpy as np
 import seaborn as sns
 import matplotlib.pyplot as plt
-from collections import Counter, defaultdict
+from collections import Counter
 import os
 import logging
 from pathlib import Path
 from datetime import datetime
 from pdfminer.high_level import extract_text
+import text_cache
+from catalog import open_catalog
+from text_chunks import split_text
+from email_headers import parse_messages, message_relationships, parse_date, EMAIL_REGEX
+from graph_store import SparseGraph
+from domain_aggregation import aggregate_domains, domain_views
+from embedding_store import embed_texts, text_digest, SENTENCE_MODEL
+from embedding_backends import load_backend, EMBEDDING_BACKEND, EMBEDDING_THREADS
+from topic_maps import umap_layout, umap_place, tsne_layout, place_points
+from topic_state import TopicState, DRIFT_THRESHOLD, MAX_PLACED_SHARE
 from tqdm import tqdm
 from multiprocessing import Pool, cpu_count
 import spacy
 import json
-from sklearn.manifold import TSNE
 from umap import UMAP
 from sentence_transformers import SentenceTransformer
 from bertopic import BERTopic
@@ -24,26 +32,177 @@ from sklearn.metrics.pairwise import cosine_similarity
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SPACY_MODEL = "en_core_web_sm"
+# Only the shared tok2vec and the entity recognizer are needed for NER
+NER_EXCLUDE = ['tagger', 'parser', 'attribute_ruler', 'lemmatizer', 'senter']
+ENTITY_LABELS = ('ORG', 'PERSON', 'GPE')  # Organizations, People, Locations
+
+# PDFs handed to a worker at a time, and text chunks per nlp.pipe batch
+FILES_PER_TASK = 16
+NER_BATCH_SIZE = 8
+
+def load_ner_pipeline():
+    """spaCy pipeline with only the components named entity recognition needs"""
+    # Texts are parsed in chunks (see iter_entity_sets), so the default max_length is kept
+    return spacy.load(SPACY_MODEL, exclude=NER_EXCLUDE)
+
+def extract_document_text(pdf_path):
+    """Extract text from a PDF file"""
+    try:
+        text = text_cache.cached_file_text(pdf_path, extract_text)
+        return text.strip() if text else ""
+    except Exception as e:
+        logger.error(f"Error extracting text from {pdf_path}: {str(e)}")
+        return ""
+
+def find_relationships(text, all_emails):
+    """(sender, receiver, day) triples from the email headers in a text; day is None if unknown"""
+    relationships = []
+    for message in parse_messages(text):
+        # Each message's sender is paired with its own To and Cc recipients
+        day = parse_date(message['date'])
+        for sender, receiver in message_relationships([message]):
+            relationships.append((sender, receiver, day))
+            logger.debug(f"Found relationship: {sender} -> {receiver}")
+    
+    # If no structured relationships found, try to infer from email order
+    if not relationships and len(all_emails) >= 2:
+        logger.debug("No structured relationships found, inferring from email order")
+        # Assume first email is sender and subsequent emails are recipients
+        sender = all_emails[0]
+        for receiver in all_emails[1:]:
+            if receiver != sender:  # Avoid self-loops
+                relationships.append((sender, receiver, None))
+                logger.debug(f"Inferred relationship: {sender} -> {receiver}")
+    
+    return relationships
+
+def iter_entity_sets(nlp, texts, entity_normalize):
+    """
+    Yield the set of normalized entities of each text, in order.
+
+    Every text is cut into chunks of at most MAX_CHUNK_CHARS that are
+    streamed through nlp.pipe, and the entities of a text's chunks are
+    collected into one set, so memory per worker stays bounded however
+    long a document is while co-occurrence is still counted per document.
+    """
+    chunks = ((chunk, index) for index, text in enumerate(texts) for chunk in split_text(text))
+    current = 0
+    doc_entities = set()
+    for doc, index in nlp.pipe(chunks, as_tuples=True, batch_size=NER_BATCH_SIZE):
+        while current < index:
+            yield doc_entities
+            doc_entities = set()
+            current += 1
+        for ent in doc.ents:
+            if ent.label_ in ENTITY_LABELS:
+                # Normalize the entity name before adding
+                doc_entities.add(entity_normalize.get(ent.text, ent.text))
+    while current < len(texts):
+        yield doc_entities
+        doc_entities = set()
+        current += 1
+
+def analyze_document(pdf_path, text, doc_entities):
+    """Email relationships and entities of one document, given its entities"""
+    # Entity pairs are not listed here; SparseGraph.add_group counts the
+    # co-occurrences of the whole set at once
+    entities_list = list(doc_entities)
+    
+    # Find all emails in the document
+    all_emails = EMAIL_REGEX.findall(text)
+    logger.debug(f"Found {len(all_emails)} total emails in document")
+    relationships = find_relationships(text, all_emails)
+    
+    # Return both email and entity data
+    return {
+        'path': pdf_path,
+        'relationships': relationships,
+        'total_emails': len(all_emails),
+        'entities': entities_list
+    }
+
+def new_partial():
+    """Empty per-worker counts, merged into the analyzer by EmailNetworkAnalyzer.merge_partial"""
+    return {
+        'email_network': SparseGraph(directed=True),
+        'email_freq': Counter(),
+        'entity_mentions': Counter(),
+        'entity_connections': SparseGraph(directed=False),
+        'documents': [],
+        'processed': 0
+    }
+
+def add_result(partial, result):
+    """Count one document's relationships and entities into a partial"""
+    for sender, receiver, day in result['relationships']:
+        partial['email_network'].add_edge(sender, receiver, day=day)
+        partial['email_freq'][sender] += 1
+        partial['email_freq'][receiver] += 1
+    
+    for entity in result['entities']:
+        partial['entity_mentions'][entity] += 1
+    
+    # Connects every pair of the document's entities, in both directions
+    partial['entity_connections'].add_group(result['entities'])
+    partial['processed'] += 1
+
+# Per-worker state, set up once by init_worker
+_worker_nlp = None
+_worker_entity_normalize = {}
+
+def init_worker(entity_normalize):
+    global _worker_nlp, _worker_entity_normalize
+    _worker_nlp = load_ner_pipeline()
+    _worker_entity_normalize = entity_normalize
+
+def analyze_batch(pdf_paths):
+    """
+    Map step: extract and analyze a batch of PDFs in a worker process.
+
+    Texts go through nlp.pipe in bounded chunks, and the results are summed into
+    one partial, so only counts and texts travel back to the parent. If the
+    NER pipeline itself fails, the rest of the batch is skipped and the
+    partial built so far is returned.
+    """
+    partial = new_partial()
+    documents = []
+    for pdf_path in pdf_paths:
+        text = extract_document_text(pdf_path)
+        if text:
+            documents.append((str(pdf_path), text))
+        else:
+            logger.warning(f"No text extracted from: {pdf_path}")
+    
+    entity_sets = iter_entity_sets(_worker_nlp, [text for _, text in documents], _worker_entity_normalize)
+    done = 0
+    try:
+        for (pdf_path, text), doc_entities in zip(documents, entity_sets):
+            done += 1
+            try:
+                add_result(partial, analyze_document(pdf_path, text, doc_entities))
+                partial['documents'].append({'path': pdf_path, 'text': text})
+            except Exception as e:
+                logger.error(f"Error processing {pdf_path}: {str(e)}")
+    except Exception as e:
+        logger.error(f"Entity extraction failed after {done} of {len(documents)} documents in batch: {str(e)}")
+    return partial
+
 class EmailNetworkAnalyzer:
-    def __init__(self):
+    def __init__(self, embedding_backend=EMBEDDING_BACKEND, embedding_threads=EMBEDDING_THREADS):
         # Add at the start of __init__
         os.environ["TOKENIZERS_PARALLELISM"] = "false"
         
-        # More flexible patterns to capture email headers and relationships
-        self.from_pattern = r'(?:From:|From|Sender:).*?(?=To:|Cc:|Subject:|$)'
-        self.to_pattern = r'(?:To:|To).*?(?=From:|Cc:|Subject:|$)'
-        self.cc_pattern = r'(?:Cc:|Cc|Carbon Copy:).*?(?=From:|To:|Subject:|$)'
-        self.email_pattern = r'[\w\.-]+@[\w\.-]+\.\w+'
-        
-        # Initialize network structures with defaultdict
-        self.email_network = defaultdict(lambda: defaultdict(int))
+        # Sender -> receiver counts and entity co-occurrence counts as sparse
+        # matrices over interned ids; see graph_store.SparseGraph
+        self.email_network = SparseGraph(directed=True)
         self.email_freq = Counter()
         self.entity_mentions = Counter()
-        self.entity_connections = defaultdict(lambda: defaultdict(int))
+        self.entity_connections = SparseGraph(directed=False)
         
-        # Initialize spaCy with increased max length
-        self.nlp = spacy.load("en_core_web_sm")
-        self.nlp.max_length = 7000000  # Increase max length to 5M characters
+        # spaCy with only the NER components, used for single documents;
+        # analyze_directory loads one per worker process
+        self.nlp = load_ner_pipeline()
         
         # Add entity normalization mapping
         self.entity_mapping = {
@@ -64,7 +223,11 @@ class EmailNetworkAnalyzer:
         self.processed_documents = []
         
         # Initialize topic modeling components
-        self.sentence_model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.sentence_model = SentenceTransformer(SENTENCE_MODEL)
+        # Encoder for document embeddings (see embedding_backends), loaded on first use
+        self.embedding_backend_name = embedding_backend
+        self.embedding_threads = embedding_threads
+        self.embedding_backend = None
         self.topic_model = BERTopic(
             embedding_model=self.sentence_model,
             umap_model=UMAP(
@@ -76,31 +239,22 @@ class EmailNetworkAnalyzer:
         )
 
     def find_pdf_files(self, directory):
-        """Recursively find all PDF files in the directory"""
-        pdf_files = []
-        for root, _, files in os.walk(directory):
-            pdf_files.extend([
-                os.path.join(root, f) 
-                for f in files 
-                if f.lower().endswith('.pdf')
-            ])
+        """Find all PDF files in the directory, as listed by the corpus catalog"""
+        catalog = open_catalog(directory)
+        pdf_files = catalog.pdfs()
+        catalog.close()
         return pdf_files
     
     def extract_text_from_pdf(self, pdf_path):
         """Extract text from a PDF file"""
-        try:
-            text = extract_text(pdf_path)
-            return text.strip() if text else ""
-        except Exception as e:
-            logger.error(f"Error extracting text from {pdf_path}: {str(e)}")
-            return ""
+        return extract_document_text(pdf_path)
     
     def normalize_entity(self, entity):
         """Normalize entity names to handle variations"""
         return self.entity_normalize.get(entity, entity)
     
     def process_pdf(self, pdf_path):
-        """Process a single PDF file"""
+        """Process a single PDF file in this process"""
         logger.info(f"Processing: {pdf_path}")
         
         text = self.extract_text_from_pdf(pdf_path)
@@ -117,85 +271,22 @@ class EmailNetworkAnalyzer:
         })
         
         try:
-            # Extract entities using spaCy
-            doc = self.nlp(text)
-            logger.info(f"NLP processing complete for {pdf_path}")
-            
-            # Track entities in this document
-            doc_entities = set()
-            entity_pairs = []  # Store co-occurring pairs instead of updating connections directly
-            
-            for ent in doc.ents:
-                if ent.label_ in ['ORG', 'PERSON', 'GPE']:  # Organizations, People, Locations
-                    # Normalize the entity name before adding
-                    normalized_entity = self.normalize_entity(ent.text)
-                    doc_entities.add(normalized_entity)
-            
-            # Create pairs of co-occurring entities
-            entities_list = list(doc_entities)
-            for i in range(len(entities_list)):
-                for j in range(i + 1, len(entities_list)):
-                    entity_pairs.append((entities_list[i], entities_list[j]))
-            
-            # Find all emails in the document
-            all_emails = re.findall(self.email_pattern, text)
-            logger.debug(f"Found {len(all_emails)} total emails in document")
-            
-            relationships = []
-            
-            # Try to find structured email headers first
-            from_sections = re.finditer(self.from_pattern, text, re.IGNORECASE | re.MULTILINE)
-            to_sections = re.finditer(self.to_pattern, text, re.IGNORECASE | re.MULTILINE)
-            
-            # Process structured sections
-            for from_match in from_sections:
-                from_text = from_match.group()
-                sender_emails = re.findall(self.email_pattern, from_text)
-                
-                if sender_emails:
-                    sender = sender_emails[0]
-                    logger.debug(f"Found sender: {sender}")
-                    
-                    # Look for recipients in nearby To: sections
-                    for to_match in to_sections:
-                        to_text = to_match.group()
-                        receiver_emails = re.findall(self.email_pattern, to_text)
-                        
-                        for receiver in receiver_emails:
-                            if receiver != sender:  # Avoid self-loops
-                                relationships.append((sender, receiver))
-                                logger.debug(f"Found relationship: {sender} -> {receiver}")
-            
-            # If no structured relationships found, try to infer from email order
-            if not relationships and len(all_emails) >= 2:
-                logger.debug("No structured relationships found, inferring from email order")
-                # Assume first email is sender and subsequent emails are recipients
-                sender = all_emails[0]
-                for receiver in all_emails[1:]:
-                    if receiver != sender:  # Avoid self-loops
-                        relationships.append((sender, receiver))
-                        logger.debug(f"Inferred relationship: {sender} -> {receiver}")
-            
-            if relationships:
-                logger.debug(f"Found {len(relationships)} total relationships")
-            else:
-                logger.debug("No relationships found")
-                
-            # Return both email and entity data
-            return {
-                'path': pdf_path,
-                'relationships': relationships,
-                'total_emails': len(all_emails),
-                'entities': list(doc_entities),
-                'entity_pairs': entity_pairs  # Add entity pairs to result
-            }
-            
+            doc_entities = next(iter_entity_sets(self.nlp, [text], self.entity_normalize))
+            return analyze_document(pdf_path, text, doc_entities)
         except Exception as e:
             logger.error(f"Error processing {pdf_path}: {str(e)}")
             return None
     
-    def analyze_directory(self, pdf_dir, test_run=False):
-        """Analyze all PDFs in directory"""
+    def merge_partial(self, partial):
+        """Reduce step: add a worker's counts and texts to the analyzer's totals"""
+        self.email_network.merge(partial['email_network'])
+        self.email_freq.update(partial['email_freq'])
+        self.entity_mentions.update(partial['entity_mentions'])
+        self.entity_connections.merge(partial['entity_connections'])
+        self.processed_documents.extend(partial['documents'])
+    
+    def analyze_directory(self, pdf_dir, test_run=False, workers=None):
+        """Analyze all PDFs in directory, extracting and running NER in a process pool"""
         logger.info(f"Scanning directory: {pdf_dir}")
         pdf_files = self.find_pdf_files(pdf_dir)
         logger.info(f"Found {len(pdf_files)} PDF files")
@@ -204,49 +295,28 @@ class EmailNetworkAnalyzer:
             pdf_files = pdf_files[:50]  # Process 50 files in test mode
             logger.info(f"TEST RUN: Processing {len(pdf_files)} documents")
         
-        for pdf_path in tqdm(pdf_files, desc="Processing PDFs"):
-            try:
-                result = self.process_pdf(pdf_path)
-                if result:
-                    # Store email relationships
-                    for sender, receiver in result['relationships']:
-                        # Initialize sender if not exists
-                        if sender not in self.email_network:
-                            self.email_network[sender] = defaultdict(int)
-                        
-                        # Add connection
-                        self.email_network[sender][receiver] += 1
-                        
-                        # Update frequency counters
-                        self.email_freq[sender] += 1
-                        self.email_freq[receiver] += 1
-                    
-                    # Store entity relationships
-                    for entity in result['entities']:
-                        self.entity_mentions[entity] += 1
-                    
-                    # Initialize entity connections
-                    for entity1, entity2 in result['entity_pairs']:
-                        if entity1 not in self.entity_connections:
-                            self.entity_connections[entity1] = defaultdict(int)
-                        if entity2 not in self.entity_connections:
-                            self.entity_connections[entity2] = defaultdict(int)
-                        
-                        # Add bidirectional connection
-                        self.entity_connections[entity1][entity2] += 1
-                        self.entity_connections[entity2][entity1] += 1
-                    
-                    logger.info(f"Successfully processed: {pdf_path}")
-                    
-            except Exception as e:
-                logger.error(f"Failed to process {pdf_path}: {str(e)}")
-                continue
-        
-        logger.info(f"Processed {len(pdf_files)} documents")
+        batches = [pdf_files[i:i + FILES_PER_TASK] for i in range(0, len(pdf_files), FILES_PER_TASK)]
+        workers = workers or max(1, cpu_count() - 2)  # Ensure at least 1 process
+        processed = 0
+        with Pool(processes=workers, initializer=init_worker, initargs=(self.entity_normalize,)) as pool:
+            with tqdm(total=len(pdf_files), desc="Processing PDFs") as progress:
+                for batch, partial in zip(batches, pool.imap(analyze_batch, batches)):
+                    self.merge_partial(partial)
+                    processed += partial['processed']
+                    progress.update(len(batch))
+        
+        logger.info(f"Processed {processed} of {len(pdf_files)} documents")
         logger.info(f"Found {len(self.email_freq)} unique email addresses")
-        logger.info(f"Detected {sum(len(receivers) for receivers in self.email_network.values())} connections")
+        logger.info(f"Detected {self.email_network.edge_count} connections")
 
-    def create_network_visualization(self, min_weight=2):
+    def aggregate_domains(self, top_n=10, rank_by='addresses', start=None, end=None):
+        """Domain counts for the heatmap and network views; see domain_aggregation.aggregate_domains"""
+        aggregate = aggregate_domains(self.email_network, top_n, rank_by, start, end)
+        self.domain_names = aggregate['domains']
+        self.domain_matrix = aggregate['matrix']
+        return aggregate
+    
+    def create_network_visualization(self, min_weight=2, top_n=10, rank_by='addresses', start=None, end=None):
         """Create summary visualizations and corresponding D3 data"""
         logger.info("Creating network visualizations and D3 data...")
         
@@ -254,22 +324,21 @@ class EmailNetworkAnalyzer:
         d3_output_dir = os.path.join('reports', 'email_analysis', 'd3_data')
         os.makedirs(d3_output_dir, exist_ok=True)
         
-        # Get domain data
-        domains = Counter(email.split('@')[1] for email in self.email_freq.keys())
-        top_domains = domains.most_common(10)
-        domain_names = [d[0] for d in top_domains]
-        domain_counts = [d[1] for d in top_domains]
+        # Get domain data; the bar chart, heatmap and network all come from this one aggregate
+        aggregate = self.aggregate_domains(top_n, rank_by, start, end)
+        domain_names = aggregate['domains']
+        domain_counts = [int(count) for count in aggregate['addresses']]
         
         # 1. Save Bar Chart Data
         bar_chart_data = [
             {"domain": domain, "count": count} 
-            for domain, count in top_domains
+            for domain, count in zip(domain_names, domain_counts)
         ]
         with open(os.path.join(d3_output_dir, 'domain_bar_chart.json'), 'w') as f:
             json.dump(bar_chart_data, f, indent=2)
         
         # 2. Save Email Activity Distribution Data
-        connection_counts = [len(receivers) for receivers in self.email_network.values()]
+        connection_counts = [int(count) for count in self.email_network.out_degree(weighted=False) if count]
         distribution_data = [
             {"connections": count, "frequency": freq} 
             for count, freq in Counter(connection_counts).items()
@@ -278,50 +347,11 @@ class EmailNetworkAnalyzer:
             json.dump(distribution_data, f, indent=2)
         
         # 3. Save Domain Network Data
-        domain_matrix = np.zeros((10, 10))
-        for sender, receivers in self.email_network.items():
-            sender_domain = sender.split('@')[1]
-            if sender_domain in domain_names:
-                for receiver, weight in receivers.items():
-                    receiver_domain = receiver.split('@')[1]
-                    if receiver_domain in domain_names:
-                        i = domain_names.index(sender_domain)
-                        j = domain_names.index(receiver_domain)
-                        domain_matrix[i][j] += weight
-        
-        # Create D3 network data
-        network_data = {
-            "nodes": [
-                {"id": domain, "group": 1, "size": count} 
-                for domain, count in zip(domain_names, domain_counts)
-            ],
-            "links": []
-        }
-        
-        if domain_matrix.sum() > 0:
-            edge_threshold = min(
-                np.percentile(domain_matrix[domain_matrix > 0], .1),
-                np.max(domain_matrix) * 0.999
-            )
-            
-            for i in range(len(domain_names)):
-                for j in range(i+1, len(domain_names)):
-                    weight = domain_matrix[i][j]
-                    if weight > edge_threshold:
-                        network_data["links"].append({
-                            "source": domain_names[i],
-                            "target": domain_names[j],
-                            "value": float(weight)
-                        })
-        
+        heatmap_data, network_data = domain_views(aggregate)
         with open(os.path.join(d3_output_dir, 'domain_network.json'), 'w') as f:
             json.dump(network_data, f, indent=2)
         
         # 4. Save Heatmap Data
-        heatmap_data = {
-            "domains": domain_names,
-            "matrix": domain_matrix.tolist()
-        }
         with open(os.path.join(d3_output_dir, 'domain_heatmap.json'), 'w') as f:
             json.dump(heatmap_data, f, indent=2)
         
@@ -338,7 +368,7 @@ class EmailNetworkAnalyzer:
         entity_names = [e[0] for e in top_entities]
         for i, entity1 in enumerate(entity_names):
             for j, entity2 in enumerate(entity_names[i+1:], i+1):
-                weight = self.entity_connections[entity1][entity2]
+                weight = self.entity_connections.weight(entity1, entity2)
                 if weight > 0:
                     entity_network_data["links"].append({
                         "source": entity1,
@@ -375,7 +405,7 @@ class EmailNetworkAnalyzer:
         domains = Counter(email.split('@')[1] for email in self.email_freq.keys())
         
         # Calculate additional metrics
-        total_connections = sum(len(v) for v in self.email_network.values())
+        total_connections = self.email_network.edge_count
         avg_connections = total_connections / len(self.email_freq) if self.email_freq else 0
         
         stats = {
@@ -386,45 +416,124 @@ class EmailNetworkAnalyzer:
                 self.email_freq.most_common(20),
                 columns=['Email', 'Frequency']
             ),
-            'domain_stats': dict(domains.most_common(20))
+            'domain_stats': dict(domains.most_common(20)),
+            'central_emailers': self.email_network.top_nodes(self.email_network.pagerank(), 20)
         }
         return stats
+    
+    def save_graphs(self, output_dir):
+        """Save the email and entity graphs as .npz files; reload them with SparseGraph.load"""
+        self.email_network.save(os.path.join(output_dir, 'email_graph.npz'))
+        self.entity_connections.save(os.path.join(output_dir, 'entity_graph.npz'))
+
+    def embed_documents(self, documents):
+        """Document embeddings, mean-pooled over chunks and reused from the embedding store across runs"""
+        backend = self.get_embedding_backend()
+        return embed_texts(documents, backend.encode, backend.store_name, show_progress_bar=True)
 
-    def generate_visualization_data(self, output_dir):
-        """Generate all visualization data while preserving existing analysis"""
+    def get_embedding_backend(self):
+        if self.embedding_backend is None:
+            self.embedding_backend = load_backend(self.embedding_backend_name, SENTENCE_MODEL,
+                                                  self.embedding_threads, model=self.sentence_model)
+        return self.embedding_backend
+    
+    def fit_topics(self, documents, embeddings, state_dir):
+        """Fit the topic model and both maps on all documents, and save them to state_dir"""
+        topics, _ = self.topic_model.fit_transform(documents, embeddings)
+        state = TopicState.fit(
+            [text_digest(document) for document in documents], topics,
+            umap_layout(self.topic_model.umap_model, embeddings), tsne_layout(embeddings),
+            embeddings, self.get_embedding_backend().store_name
+        )
+        os.makedirs(state_dir, exist_ok=True)
+        model_path = os.path.join(state_dir, state.model_file)
+        self.topic_model.save(f"{model_path}.tmp", serialization='pickle', save_embedding_model=False)
+        os.replace(f"{model_path}.tmp", model_path)
+        state.save(state_dir)
+        # Models of earlier fits are only removed once the new state points past them
+        for name in os.listdir(state_dir):
+            if name.startswith('bertopic_') and name != state.model_file:
+                os.remove(os.path.join(state_dir, name))
+        return state
+
+    def update_topics(self, documents, embeddings, state_dir, drift_threshold=DRIFT_THRESHOLD):
+        """
+        Topics and map coordinates of the documents, updating the saved topic model when possible.
+
+        Documents seen by the last run keep their topic and coordinates.
+        New documents are assigned topics with the saved model's transform,
+        placed on the UMAP map by its UMAP and on the t-SNE map next to
+        their nearest mapped documents. The model is refitted on all
+        documents when there is no saved model, when it was fitted with
+        another embedding backend, when documents placed since the last
+        fit have drifted from its topics by more than drift_threshold (see
+        TopicState.drift), or when they are more than MAX_PLACED_SHARE of
+        the corpus.
+
+        Returns:
+            TopicState: Row i describes documents[i].
+        """
+        store_name = self.get_embedding_backend().store_name
+        state = TopicState.load(state_dir)
+        if state is None or state.store_name != store_name \
+                or not os.path.exists(os.path.join(state_dir, state.model_file)):
+            logger.info("No saved topic model for these embeddings; fitting one")
+            return self.fit_topics(documents, embeddings, state_dir)
+
+        digests = [text_digest(document) for document in documents]
+        rows = state.positions(digests)
+        known = rows >= 0
+        new = np.flatnonzero(~known)
+        fitted = np.zeros(len(documents), dtype=bool)
+        fitted[known] = state.fitted[rows[known]]
+        placed_share = 1 - fitted.mean() if len(documents) else 0.0
+        if placed_share > MAX_PLACED_SHARE:
+            logger.info(f"{placed_share:.0%} of documents were not in the last fit; refitting the topic model")
+            return self.fit_topics(documents, embeddings, state_dir)
+        drift = state.drift(embeddings[~fitted])
+        if drift > drift_threshold:
+            logger.info(f"Documents added since the last fit drifted {drift:.1%} from its topics; "
+                        "refitting the topic model")
+            return self.fit_topics(documents, embeddings, state_dir)
+        logger.info(f"Reusing the topic model fitted at {state.fitted_at} (drift {drift:.1%})")
+
+        self.topic_model = BERTopic.load(os.path.join(state_dir, state.model_file),
+                                         embedding_model=self.sentence_model)
+        topics = np.full(len(documents), -1, dtype=np.int64)
+        umap_points = np.zeros((len(documents), 2))
+        tsne_points = np.zeros((len(documents), 2))
+        topics[known] = state.topics[rows[known]]
+        umap_points[known] = state.umap_points[rows[known]]
+        tsne_points[known] = state.tsne_points[rows[known]]
+        if len(new):
+            logger.info(f"Assigning topics to {len(new)} new documents")
+            new_topics, _ = self.topic_model.transform([documents[i] for i in new], embeddings[new])
+            topics[new] = new_topics
+            umap_points[new] = umap_place(self.topic_model.umap_model, embeddings[known],
+                                          umap_points[known], embeddings[new])
+            tsne_points[new] = place_points(embeddings[known], tsne_points[known], embeddings[new])
+
+        state = TopicState(digests, topics, umap_points, tsne_points, fitted, state.centroids,
+                           state.baseline, store_name, state.fitted_at)
+        state.save(state_dir)
+        return state
+
+    def generate_visualization_data(self, output_dir, top_n=10, rank_by='addresses', start=None, end=None,
+                                    incremental=False, drift_threshold=DRIFT_THRESHOLD):
+        """
+        Generate all visualization data while preserving existing analysis.
+
+        The fitted topic model and the topic maps are saved to
+        output_dir/topic_model. With incremental, they are updated from
+        there instead of refitted (see update_topics).
+        """
         vis_data_dir = os.path.join(output_dir, 'd3_data')
         os.makedirs(vis_data_dir, exist_ok=True)
         
         logger.info("Creating network visualizations and D3 data...")
         
         # 1. Create network data (NOT the matplotlib figure)
-        network_data = {
-            "nodes": [],
-            "links": []
-        }
-        
-        # Get top domains
-        domain_counts = Counter(email.split('@')[1] for email in self.email_freq.keys())
-        domain_names = [d[0] for d in domain_counts.most_common(10)]
-        
-        # Add nodes
-        for domain in domain_names:
-            network_data["nodes"].append({
-                "id": domain,
-                "group": 1,
-                "size": domain_counts[domain]
-            })
-        
-        # Add links
-        for i, domain1 in enumerate(domain_names):
-            for j, domain2 in enumerate(domain_names[i+1:], i+1):
-                weight = self.domain_matrix[i][j] if hasattr(self, 'domain_matrix') else 0
-                if weight > 0:
-                    network_data["links"].append({
-                        "source": domain1,
-                        "target": domain2,
-                        "value": float(weight)
-                    })
+        _, network_data = domain_views(self.aggregate_domains(top_n, rank_by, start, end))
         
         # Save network data
         with open(os.path.join(vis_data_dir, 'domain_network_complete.json'), 'w') as f:
@@ -433,15 +542,24 @@ class EmailNetworkAnalyzer:
         # 2. Generate topic model visualizations
         logger.info("Generating topic model visualizations...")
         documents = [doc['text'] for doc in self.processed_documents]
-        embeddings = self.sentence_model.encode(documents, show_progress_bar=True)
-        topics, probs = self.topic_model.fit_transform(documents, embeddings)
+        embeddings = self.embed_documents(documents)
+        state_dir = os.path.join(output_dir, 'topic_model')
+        if incremental:
+            state = self.update_topics(documents, embeddings, state_dir, drift_threshold)
+        else:
+            state = self.fit_topics(documents, embeddings, state_dir)
+        topics = state.topics.tolist()
+        
+        # Topic sizes count every document, not only those the model was fitted on
+        topic_info = self.topic_model.get_topic_info()
+        topic_info['Count'] = topic_info['Topic'].map(Counter(topics)).fillna(0).astype(int)
         
         # Save topic visualizations
         topic_vis = {
-            'umap': self._create_umap_visualization(embeddings, topics),
-            'tsne': self._create_tsne_visualization(embeddings, topics),
+            'umap': self._create_umap_visualization(state.umap_points, topics),
+            'tsne': self._create_tsne_visualization(state.tsne_points, topics),
             'similarity': self._create_topic_similarity_network(),
-            'info': self.topic_model.get_topic_info().to_dict('records')
+            'info': topic_info.to_dict('records')
         }
         
         for name, data in topic_vis.items():
@@ -450,24 +568,18 @@ class EmailNetworkAnalyzer:
         
         logger.info("Visualization data generation complete!")
 
-    def _create_umap_visualization(self, embeddings, topics):
-        """Create UMAP visualization data"""
-        umap_model = UMAP(n_components=2, metric='cosine')
-        umap_embeddings = umap_model.fit_transform(embeddings)
-        
+    def _create_umap_visualization(self, points, topics):
+        """Create UMAP visualization data from the topic model's own 2-D reduction (see topic_maps.umap_layout)"""
         return {
-            'points': umap_embeddings.tolist(),
+            'points': points.tolist(),
             'topics': topics,
             'labels': self.topic_model.get_topic_info()['Name'].tolist()
         }
 
-    def _create_tsne_visualization(self, embeddings, topics):
-        """Create t-SNE visualization data"""
-        tsne = TSNE(n_components=2)
-        tsne_embeddings = tsne.fit_transform(embeddings)
-        
+    def _create_tsne_visualization(self, points, topics):
+        """Create t-SNE visualization data; see topic_maps.tsne_layout for how large corpora are mapped"""
         return {
-            'points': tsne_embeddings.tolist(),
+            'points': points.tolist(),
             'topics': topics,
             'labels': self.topic_model.get_topic_info()['Name'].tolist()
         }
@@ -478,8 +590,9 @@ class EmailNetworkAnalyzer:
         topic_info = self.topic_model.get_topic_info()
         topics = topic_info.index.tolist()
         
-        # Calculate similarities using cosine similarity of topic embeddings
-        topic_embeddings = []
+        # Calculate similarities using cosine similarity of topic embeddings,
+        # encoded in one batch once every topic's words are collected
+        topic_texts = []
         nodes = []
         
         for topic in topics:
@@ -491,7 +604,7 @@ class EmailNetworkAnalyzer:
             try:
                 words = [word for word, _ in topic_words]
                 if words:  # Only process if we have words
-                    topic_embeddings.append(self.sentence_model.encode(' '.join(words)))
+                    topic_texts.append(' '.join(words))
                     nodes.append({
                         'id': str(topic),
                         'label': ' '.join(words[:3]),
@@ -501,11 +614,10 @@ class EmailNetworkAnalyzer:
                 logger.warning(f"Skipping topic {topic}: {str(e)}")
                 continue
         
-        if not topic_embeddings:  # If no valid topics found
+        if not topic_texts:  # If no valid topics found
             return {'nodes': [], 'links': []}
         
-        # Convert to numpy array
-        topic_embeddings = np.array(topic_embeddings)
+        topic_embeddings = np.asarray(self.get_embedding_backend().encode(topic_texts))
         
         # Calculate cosine similarity
         similarities = cosine_similarity(topic_embeddings)
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import json
+import time
+import logging
+import argparse
+import importlib.util
+
+import numpy as np
+
+from embedding_store import SENTENCE_MODEL, ENCODE_BATCH_SIZE, encode_chunked
+
+try:
+    import onnxruntime as ort
+    from tokenizers import Tokenizer
+    ONNXRUNTIME_AVAILABLE = True
+except ImportError:
+    ONNXRUNTIME_AVAILABLE = False
+
+# torch runs the model as exported by sentence-transformers; onnx runs it
+# int8-quantized through ONNX Runtime, onnx-fp32 unquantized
+BACKENDS = ('torch', 'onnx', 'onnx-fp32')
+EMBEDDING_BACKEND = os.environ.get('EMBEDDING_BACKEND', 'torch')
+
+# Intra-op threads per encoder; 0 leaves the library default (all cores)
+EMBEDDING_THREADS = int(os.environ.get('EMBEDDING_THREADS', 0))
+
+# Exported ONNX models, one subdirectory per model
+ONNX_MODEL_PATH = os.environ.get(
+    'ONNX_MODEL_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'reports', 'onnx')
+)
+
+# Padded tokens per ONNX batch: 64 texts of 256 word pieces, or more short ones
+MAX_BATCH_TOKENS = ENCODE_BATCH_SIZE * 256
+
+
+def token_batches(lengths, max_tokens=MAX_BATCH_TOKENS):
+    """
+    Group texts by token count so that each padded batch holds at most max_tokens.
+
+    Texts are sorted by length, so a batch pads its texts only to the
+    longest of similar lengths, and batches of short texts are large.
+
+    Returns:
+        list: Arrays of text indices, one per batch.
+    """
+    order = np.argsort(lengths, kind='stable')
+    batches = []
+    start = 0
+    for end in range(1, len(order) + 1):
+        # Sorted ascending, so the last text sets the padded width
+        if end == len(order) or (end - start + 1) * max(lengths[order[end]], 1) > max_tokens:
+            batches.append(order[start:end])
+            start = end
+    return batches
+
+
+def pool(hidden, mask, mode):
+    """Sentence vectors from token vectors, as the sentence-transformers Pooling module computes them"""
+    if mode == 'cls':
+        return hidden[:, 0]
+    mask = mask[:, :, None].astype(hidden.dtype)
+    if mode == 'max':
+        return np.where(mask > 0, hidden, -1e9).max(axis=1)
+    return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+
+def encoder_directory(model_name, path=ONNX_MODEL_PATH):
+    return os.path.join(path, re.sub(r'[^\w.-]+', '_', model_name))
+
+
+def available_backends(model_name=SENTENCE_MODEL, path=ONNX_MODEL_PATH):
+    """Backends that can run here: the ONNX ones need onnxruntime and tokenizers, and onnx until the model is exported"""
+    if not ONNXRUNTIME_AVAILABLE:
+        return ('torch',)
+    exported = os.path.exists(os.path.join(encoder_directory(model_name, path), 'encoder.json'))
+    if not exported and importlib.util.find_spec('onnx') is None:
+        return ('torch',)
+    return BACKENDS
+
+
+def export_onnx(model_name=SENTENCE_MODEL, path=ONNX_MODEL_PATH):
+    """
+    Export a sentence-transformers model to ONNX, with an int8 copy, unless already exported.
+
+    The transformer is exported with dynamic batch and sequence axes, and
+    its weights are quantized to int8 with ONNX Runtime's dynamic
+    quantization; activations are quantized per batch at run time. The
+    tokenizer and the pooling settings are saved next to it, so encoding
+    needs neither torch nor sentence-transformers.
+
+    Returns:
+        str: Directory holding model.onnx, model.int8.onnx, tokenizer.json
+            and encoder.json, which is written last and marks a complete export.
+    """
+    directory = encoder_directory(model_name, path)
+    if os.path.exists(os.path.join(directory, 'encoder.json')):
+        return directory
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    logging.info(f"Exporting {model_name} to ONNX in {directory}")
+    os.makedirs(directory, exist_ok=True)
+    model = SentenceTransformer(model_name, device='cpu')
+    transformer, pooling = model[0], model[1]
+    pooling_mode = pooling.get_pooling_mode_str()
+    if pooling_mode not in ('mean', 'cls', 'max'):
+        raise ValueError(f"{model_name} uses {pooling_mode} pooling, which the ONNX backend does not implement")
+
+    tokenizer = transformer.tokenizer
+    example = tokenizer(["An example sentence to trace the model with."], return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in example]
+
+    class TokenEmbeddings(torch.nn.Module):
+        """The transformer's last hidden state, taking its inputs positionally for the export"""
+
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, *inputs):
+            return self.auto_model(**dict(zip(input_names, inputs)))[0]
+
+    axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names + ['last_hidden_state']}
+    with torch.no_grad():
+        torch.onnx.export(
+            TokenEmbeddings(transformer.auto_model).eval(), tuple(example[name] for name in input_names),
+            os.path.join(directory, 'model.onnx'), input_names=input_names,
+            output_names=['last_hidden_state'], dynamic_axes=axes, opset_version=14
+        )
+    quantize_dynamic(os.path.join(directory, 'model.onnx'), os.path.join(directory, 'model.int8.onnx'),
+                     weight_type=QuantType.QInt8)
+    tokenizer.save_pretrained(directory)
+
+    config = {
+        'model': model_name,
+        'dim': model.get_sentence_embedding_dimension(),
+        'max_seq_length': model.max_seq_length,
+        'pad_token_id': tokenizer.pad_token_id or 0,
+        'pooling': pooling_mode,
+        'normalize': any(isinstance(module, Normalize) for module in model),
+        'inputs': input_names
+    }
+    with open(os.path.join(directory, 'encoder.json.tmp'), 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=4)
+    os.replace(os.path.join(directory, 'encoder.json.tmp'), os.path.join(directory, 'encoder.json'))
+    return directory
+
+
+class TorchBackend:
+    """Encodes with sentence-transformers in full-precision PyTorch"""
+
+    name = 'torch'
+
+    def __init__(self, model_name=SENTENCE_MODEL, threads=EMBEDDING_THREADS, model=None):
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(model_name, device='cpu')
+        self.model = model
+        self.model_name = model_name
+        # Embeddings of each backend are stored apart, as they differ slightly
+        self.store_name = model_name
+        self.dim = model.get_sentence_embedding_dimension()
+
+    def encode(self, texts):
+        return self.model.encode(list(texts), batch_size=ENCODE_BATCH_SIZE, show_progress_bar=False,
+                                 convert_to_numpy=True)
+
+
+class OnnxBackend:
+    """
+    Encodes with an exported model through ONNX Runtime on CPU.
+
+    Texts are tokenized in one call, then batched by token count (see
+    token_batches) rather than by a fixed number of texts, so short texts
+    do not pay for padding to the longest one.
+    """
+
+    def __init__(self, model_name=SENTENCE_MODEL, threads=EMBEDDING_THREADS, quantized=True,
+                 path=ONNX_MODEL_PATH, max_batch_tokens=MAX_BATCH_TOKENS):
+        if not ONNXRUNTIME_AVAILABLE:
+            raise ImportError("The ONNX backend needs onnxruntime and tokenizers. "
+                              "Install them with: pip install onnxruntime onnx tokenizers")
+        self.directory = export_onnx(model_name, path)
+        with open(os.path.join(self.directory, 'encoder.json'), 'r', encoding='utf-8') as f:
+            self.config = json.load(f)
+        self.name = 'onnx' if quantized else 'onnx-fp32'
+        self.model_name = model_name
+        self.store_name = f"{model_name}-{'onnx-int8' if quantized else 'onnx'}"
+        self.dim = self.config['dim']
+        self.max_batch_tokens = max_batch_tokens
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.model_file = os.path.join(self.directory, 'model.int8.onnx' if quantized else 'model.onnx')
+        self.session = ort.InferenceSession(self.model_file, options, providers=['CPUExecutionProvider'])
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(self.directory, 'tokenizer.json'))
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(max_length=self.config['max_seq_length'])
+
+    def encode(self, texts):
+        encodings = self.tokenizer.encode_batch(list(texts))
+        lengths = np.array([len(encoding.ids) for encoding in encodings])
+        vectors = np.zeros((len(encodings), self.dim), dtype=np.float32)
+        for batch in token_batches(lengths, self.max_batch_tokens):
+            width = max(lengths[batch].max(), 1)
+            inputs = {
+                'input_ids': np.full((len(batch), width), self.config['pad_token_id'], dtype=np.int64),
+                'attention_mask': np.zeros((len(batch), width), dtype=np.int64),
+                'token_type_ids': np.zeros((len(batch), width), dtype=np.int64)
+            }
+            for row, i in enumerate(batch):
+                n = lengths[i]
+                inputs['input_ids'][row, :n] = encodings[i].ids
+                inputs['attention_mask'][row, :n] = 1
+                inputs['token_type_ids'][row, :n] = encodings[i].type_ids
+            hidden = self.session.run(None, {name: inputs[name] for name in self.config['inputs']})[0]
+            vectors[batch] = pool(hidden, inputs['attention_mask'], self.config['pooling'])
+        if self.config['normalize']:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.where(norms == 0, 1, norms)
+        return vectors
+
+
+def load_backend(name=EMBEDDING_BACKEND, model_name=SENTENCE_MODEL, threads=EMBEDDING_THREADS, model=None):
+    """
+    An embedding backend by name, one of BACKENDS.
+
+    Backends have an encode method mapping a list of strings to a 2-D
+    float32 array, for encode_chunked and embed_texts, and a store_name to
+    keep their embeddings under. model is an already loaded
+    SentenceTransformer for the torch backend to reuse.
+    """
+    if name == 'torch':
+        return TorchBackend(model_name, threads, model)
+    if name in ('onnx', 'onnx-fp32'):
+        return OnnxBackend(model_name, threads, quantized=name == 'onnx')
+    raise ValueError(f"Unknown embedding backend {name}; expected one of {BACKENDS}")
+
+
+def compare_backends(texts, model_name=SENTENCE_MODEL, backends=BACKENDS, threads=EMBEDDING_THREADS, k=10):
+    """
+    Time each backend on the same texts and compare its embeddings with the torch backend's.
+
+    Texts are embedded as the embedding store does, chunked and mean
+    pooled. Accuracy is the cosine similarity of each text's vector to
+    its torch vector, and the share of each text's k nearest neighbours
+    (among the sample) that torch also finds.
+
+    Returns:
+        list: One dict of results per backend.
+    """
+    reference = None
+    results = []
+    for name in ('torch',) + tuple(b for b in backends if b != 'torch'):
+        backend = load_backend(name, model_name, threads)
+        backend.encode(texts[:8])  # warm up, and finish any export outside the timing
+        start = time.perf_counter()
+        vectors, counts = encode_chunked(texts, backend.encode)
+        seconds = time.perf_counter() - start
+        result = {
+            'backend': name,
+            'seconds': seconds,
+            'texts_per_second': len(texts) / seconds,
+            'chunks_per_second': int(counts.sum()) / seconds
+        }
+        if reference is None:
+            reference = vectors
+        else:
+            cosines = (vectors * reference).sum(axis=1)
+            top = min(k, len(texts) - 1)
+            neighbours = [np.argsort(-(v @ v.T) + 2 * np.eye(len(v)), axis=1)[:, :top]
+                          for v in (reference, vectors)]
+            overlap = [len(set(a) & set(b)) / top for a, b in zip(*neighbours)] if top > 0 else [1.0]
+            result.update({
+                'mean_cosine': float(cosines.mean()),
+                'min_cosine': float(cosines.min()),
+                f'neighbours_at_{k}': float(np.mean(overlap))
+            })
+        if name in backends:
+            results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the throughput and accuracy of the embedding backends.")
+    parser.add_argument('--input_folder', required=True, help='Corpus root; PDFs are sampled from its catalog.')
+    parser.add_argument('--sample', type=int, default=500, help='PDFs to embed.')
+    parser.add_argument('--model', default=SENTENCE_MODEL, help='Sentence-transformers model.')
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS,
+                        help='Backends to compare (default: every backend whose libraries are installed).')
+    parser.add_argument('--threads', type=int, default=EMBEDDING_THREADS,
+                        help='Intra-op threads per backend (0: all cores).')
+    parser.add_argument('--output', help='Also write the results to this JSON file.')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if not args.backends:
+        args.backends = available_backends(args.model)
+        skipped = [name for name in BACKENDS if name not in args.backends]
+        if skipped:
+            logging.warning(f"Skipping {', '.join(skipped)}: install onnxruntime, onnx and tokenizers "
+                            "(pip install onnxruntime onnx tokenizers) to benchmark them")
+
+    from catalog import open_catalog
+    from build_vector_index import document_text
+
+    catalog = open_catalog(args.input_folder)
+    pdf_files = catalog.pdfs()
+    catalog.close()
+    picks = np.linspace(0, len(pdf_files) - 1, min(args.sample, len(pdf_files))).round().astype(int)
+    texts = [text for text in (document_text(pdf_files[i]).strip() for i in picks) if text]
+    print(f"{len(texts)} texts, {sum(len(text) for text in texts) / 1024 / 1024:.1f} MB")
+
+    results = compare_backends(texts, args.model, tuple(args.backends), args.threads)
+    for result in results:
+        line = f"{result['backend']:10} {result['seconds']:8.1f}s  {result['texts_per_second']:8.1f} texts/s  " \
+               f"{result['chunks_per_second']:8.1f} chunks/s"
+        if 'mean_cosine' in result:
+            line += f"  cosine {result['mean_cosine']:.4f} (min {result['min_cosine']:.4f})" \
+                    f"  neighbours@10 {result['neighbours_at_10']:.3f}"
+        print(line)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
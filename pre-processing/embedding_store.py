@@ -0,0 +1,226 @@
+import os
+import re
+import sqlite3
+import hashlib
+import logging
+
+import numpy as np
+from tqdm import tqdm
+
+from text_chunks import split_text
+
+# One subdirectory per model; EMBEDDING_STORE_PATH=off disables the store
+DEFAULT_STORE_PATH = os.environ.get(
+    'EMBEDDING_STORE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'reports', 'embeddings')
+)
+
+# Model used for document embeddings, by topic modelling and semantic search
+SENTENCE_MODEL = "all-MiniLM-L6-v2"
+
+# all-MiniLM-L6-v2 reads at most 256 word pieces, roughly 1000 characters of
+# English, so texts are encoded in chunks of that size and the chunk vectors
+# averaged. Very long texts are represented by MAX_CHUNKS evenly spaced chunks.
+CHUNK_CHARS = 1000
+MAX_CHUNKS = 64
+ENCODE_BATCH_SIZE = 64
+
+# Texts encoded and written per step, and rows the vector file grows by at least
+TEXTS_PER_WRITE = 256
+GROW_ROWS = 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vectors (
+    digest TEXT PRIMARY KEY,
+    row INTEGER NOT NULL,
+    chunks INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def text_digest(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def text_chunks(text, chunk_chars=CHUNK_CHARS, max_chunks=MAX_CHUNKS):
+    """The chunks a text is encoded as; never empty"""
+    chunks = [chunk for chunk in split_text(text, chunk_chars) if chunk.strip()]
+    if len(chunks) > max_chunks:
+        picks = np.linspace(0, len(chunks) - 1, max_chunks).round().astype(int)
+        chunks = [chunks[i] for i in picks]
+    return chunks or [text]
+
+
+def encode_chunked(texts, encode):
+    """
+    Embed texts as the mean of their chunk embeddings.
+
+    Args:
+        texts (list): Texts to embed.
+        encode (callable): Maps a list of strings to a 2-D array of
+            embeddings, e.g. a SentenceTransformer's encode method.
+
+    Returns:
+        tuple: (vectors, chunk_counts). vectors is a float32 array with one
+            unit-length row per text; chunk_counts gives the chunks per text.
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=int)
+    chunks = []
+    counts = []
+    for text in texts:
+        text_chunk_list = text_chunks(text)
+        chunks.extend(text_chunk_list)
+        counts.append(len(text_chunk_list))
+    chunk_vectors = np.asarray(encode(chunks), dtype=np.float32)
+    counts = np.array(counts)
+    offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    vectors = np.add.reduceat(chunk_vectors, offsets, axis=0) / counts[:, None]
+    # Rescaled to unit length, so dot products are cosine similarities
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors /= np.where(norms == 0, 1, norms)
+    return vectors.astype(np.float32), counts
+
+
+class EmbeddingStore:
+    """
+    Text embeddings of one model, keyed by the SHA-256 of the text.
+
+    Vectors are rows of a memory-mapped float32 file, so opening the store
+    reads nothing until rows are used. A SQLite index maps each text hash
+    to its row. Rows are only appended, and a row is indexed after its
+    vector is flushed to disk, so an interrupted run loses at most the
+    batch it was writing. Texts that changed get a new hash and are encoded
+    again; unchanged texts are never re-encoded. One process should write
+    to a store at a time; any number may read.
+    """
+
+    def __init__(self, model_name, path=DEFAULT_STORE_PATH):
+        self.model_name = model_name
+        self.directory = os.path.join(path, re.sub(r'[^\w.-]+', '_', model_name))
+        os.makedirs(self.directory, exist_ok=True)
+        self.vectors_path = os.path.join(self.directory, 'vectors.f32')
+        self.conn = sqlite3.connect(os.path.join(self.directory, 'index.sqlite'), timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        meta = dict(self.conn.execute("SELECT key, value FROM meta"))
+        self.dim = int(meta['dim']) if 'dim' in meta else None
+        self.rows = int(meta.get('rows', 0))
+        self.vectors = None
+        if self.dim:
+            self._map(self.rows)
+
+    def _map(self, min_rows):
+        """Memory-map the vector file, growing it first if it holds fewer than min_rows rows"""
+        row_bytes = self.dim * 4
+        size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        capacity = size // row_bytes
+        if capacity < max(min_rows, 1):
+            capacity = max(min_rows, capacity * 2, GROW_ROWS)
+            with open(self.vectors_path, 'ab') as f:
+                f.truncate(capacity * row_bytes)
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r+', shape=(capacity, self.dim))
+
+    def __len__(self):
+        return self.rows
+
+    def lookup(self, digests):
+        """{digest: row} for the digests the store holds"""
+        found = {}
+        for start in range(0, len(digests), 500):
+            batch = digests[start:start + 500]
+            placeholders = ','.join('?' * len(batch))
+            found.update(self.conn.execute(
+                f"SELECT digest, row FROM vectors WHERE digest IN ({placeholders})", batch))
+        return found
+
+    def add(self, digests, vectors, chunk_counts):
+        """Append vectors and index them under their digests; returns {digest: row}"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dim', ?)", (str(self.dim),))
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('model', ?)", (self.model_name,))
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-dimensional vectors for {self.model_name}, got {vectors.shape[1]}")
+
+        start = self.rows
+        end = start + len(vectors)
+        if self.vectors is None or self.vectors.shape[0] < end:
+            self._map(end)
+        self.vectors[start:end] = vectors
+        self.vectors.flush()
+
+        rows = {digest: start + i for i, digest in enumerate(digests)}
+        self.conn.execute("BEGIN")
+        self.conn.executemany("INSERT OR REPLACE INTO vectors (digest, row, chunks) VALUES (?, ?, ?)",
+                              [(digest, rows[digest], int(count)) for digest, count in zip(digests, chunk_counts)])
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('rows', ?)", (str(end),))
+        self.conn.execute("COMMIT")
+        self.rows = end
+        return rows
+
+    def get(self, digests):
+        """Vectors for digests the store holds, in order; raises KeyError for any it does not"""
+        rows = self.lookup(list(set(digests)))
+        return np.array(self.vectors[[rows[digest] for digest in digests]])
+
+    def embed(self, texts, encode, show_progress_bar=False):
+        """
+        Embeddings of texts, encoding only the ones not stored yet.
+
+        Args:
+            texts (list): Texts to embed.
+            encode (callable): Maps a list of strings to a 2-D array, as in
+                encode_chunked.
+            show_progress_bar (bool): Show progress over the new texts.
+
+        Returns:
+            numpy.ndarray: One float32 row per text, in order.
+        """
+        digests = [text_digest(text) for text in texts]
+        rows = self.lookup(list(set(digests)))
+        text_of = dict(zip(digests, texts))
+        missing = [digest for digest in dict.fromkeys(digests) if digest not in rows]
+        if missing:
+            logging.info(f"Encoding {len(missing)} of {len(text_of)} texts with {self.model_name}; "
+                         f"{len(text_of) - len(missing)} are stored")
+        batches = range(0, len(missing), TEXTS_PER_WRITE)
+        for start in tqdm(batches, desc="Encoding texts", disable=not show_progress_bar or not missing):
+            batch = missing[start:start + TEXTS_PER_WRITE]
+            vectors, counts = encode_chunked([text_of[digest] for digest in batch], encode)
+            rows.update(self.add(batch, vectors, counts))
+        if not digests:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.array(self.vectors[[rows[digest] for digest in digests]])
+
+    def close(self):
+        self.vectors = None
+        self.conn.close()
+
+
+def open_store(model_name, path=DEFAULT_STORE_PATH):
+    """The embedding store for a model, or None when EMBEDDING_STORE_PATH=off or it cannot be opened"""
+    if path.lower() == 'off':
+        return None
+    try:
+        return EmbeddingStore(model_name, path)
+    except (sqlite3.Error, OSError) as e:
+        logging.warning(f"Embedding store unavailable at {path}: {e}")
+        return None
+
+
+def embed_texts(texts, encode, model_name, show_progress_bar=False):
+    """Chunk-aware embeddings of texts, reused from and added to the model's store when it is enabled"""
+    store = open_store(model_name)
+    if store is None:
+        return encode_chunked(texts, encode)[0]
+    try:
+        return store.embed(texts, encode, show_progress_bar)
+    finally:
+        store.close()
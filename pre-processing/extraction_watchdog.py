@@ -0,0 +1,163 @@
+import os
+import json
+import signal
+import logging
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows has no rlimits
+    resource = None
+
+DEFAULT_TIME_LIMIT = 300
+DEFAULT_MEMORY_LIMIT_MB = 4096
+DEFAULT_MAX_TASKS_PER_CHILD = 50
+DEFAULT_MAX_FAILURES = 2
+
+# Per-process limit, set by init_worker
+_time_limit = None
+
+
+class ExtractionTimeout(BaseException):
+    """
+    Raised inside a worker when a file exceeds its time limit.
+
+    Derives from BaseException so the broad `except Exception` blocks in the
+    extraction helpers don't swallow it.
+    """
+
+
+def _on_timeout(signum, frame):
+    raise ExtractionTimeout()
+
+
+def init_worker(time_limit=DEFAULT_TIME_LIMIT, memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB,
+                initializer=None, initargs=()):
+    """
+    Pool initializer that installs the time limit and caps the worker's address space.
+
+    Args:
+        time_limit (int): Seconds a single file may take; None or 0 disables it.
+        memory_limit_mb (int): Address-space limit for the worker; None or 0 disables it.
+        initializer (callable): Optional further initializer to chain.
+        initargs (tuple): Arguments for the chained initializer.
+    """
+    global _time_limit
+    _time_limit = time_limit or None
+
+    if _time_limit and hasattr(signal, 'SIGALRM'):
+        signal.signal(signal.SIGALRM, _on_timeout)
+
+    if memory_limit_mb and resource is not None:
+        limit = memory_limit_mb * 1024 * 1024
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def task_key(item):
+    """The file a task refers to: the item itself or the first element of a tuple"""
+    return item[0] if isinstance(item, (tuple, list)) else item
+
+
+def guarded_call(func, item):
+    """
+    Run func(item) under the worker's time limit.
+
+    Returns:
+        tuple: (key, result, error) where error is None on success.
+    """
+    key = str(task_key(item))
+    use_alarm = _time_limit and hasattr(signal, 'SIGALRM')
+    if use_alarm:
+        signal.setitimer(signal.ITIMER_REAL, _time_limit)
+    try:
+        return key, func(item), None
+    except ExtractionTimeout:
+        return key, None, f"timed out after {_time_limit}s"
+    except MemoryError:
+        return key, None, "memory limit exceeded"
+    except Exception as e:
+        return key, None, f"{type(e).__name__}: {e}"
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+class Quarantine:
+    """
+    JSON-backed record of files that failed, keyed by path.
+
+    A file is quarantined once it has failed max_failures times in a row;
+    a success clears its record.
+    """
+
+    def __init__(self, path, max_failures=DEFAULT_MAX_FAILURES):
+        self.path = path
+        self.max_failures = max_failures
+        self.entries = {}
+        self.newly_quarantined = []
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except Exception as e:
+                logging.warning(f"Could not read quarantine file {path}: {e}")
+
+    def is_quarantined(self, key):
+        entry = self.entries.get(str(key))
+        return bool(entry) and entry['failures'] >= self.max_failures
+
+    def filter(self, items):
+        """Drop quarantined files from a list of work items"""
+        kept = [item for item in items if not self.is_quarantined(task_key(item))]
+        skipped = len(items) - len(kept)
+        if skipped:
+            logging.info(f"Skipping {skipped} quarantined files listed in {self.path}")
+        return kept
+
+    def iter_filter(self, items):
+        """Lazily drop quarantined files from an iterable of work items"""
+        for item in items:
+            if not self.is_quarantined(task_key(item)):
+                yield item
+
+    def record_failure(self, key, error, stage=None):
+        key = str(key)
+        entry = self.entries.setdefault(key, {'failures': 0})
+        entry['failures'] += 1
+        entry['last_error'] = error
+        entry['last_failed_at'] = datetime.now().isoformat(timespec='seconds')
+        if stage:
+            entry['stage'] = stage
+        logging.warning(f"Failed on {key} ({entry['failures']}/{self.max_failures}): {error}")
+        if entry['failures'] == self.max_failures:
+            self.newly_quarantined.append(key)
+
+    def record_success(self, key):
+        self.entries.pop(str(key), None)
+
+    def save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=4)
+        os.replace(tmp_path, self.path)
+
+    def report(self):
+        """Log the quarantine list at the end of a run"""
+        quarantined = [key for key in self.entries if self.is_quarantined(key)]
+        if not quarantined:
+            return
+        logging.warning(f"{len(quarantined)} files are quarantined and will be skipped on later runs "
+                        f"({len(self.newly_quarantined)} new this run). See {self.path}")
+        for key in self.newly_quarantined:
+            logging.warning(f"  quarantined: {key} - {self.entries[key]['last_error']}")
@@ -5,6 +5,9 @@ import argparse
 import pandas as pd
 from pathlib import Path
 from email_network_analysis import EmailNetworkAnalyzer
+from domain_aggregation import RANK_BY
+from embedding_backends import BACKENDS, EMBEDDING_BACKEND, EMBEDDING_THREADS
+from topic_state import DRIFT_THRESHOLD
 import matplotlib.pyplot as plt
 
 # Set up logging
@@ -16,25 +19,33 @@ def create_output_directory(base_dir):
     os.makedirs(base_dir, exist_ok=True)
     return base_dir
 
-def generate_report(pdf_dir, output_dir, test_run=False):
+def generate_report(pdf_dir, output_dir, test_run=False, workers=None,
+                    top_domains=10, rank_domains_by='addresses', start=None, end=None,
+                    embedding_backend=EMBEDDING_BACKEND, embedding_threads=EMBEDDING_THREADS,
+                    incremental=False, drift_threshold=DRIFT_THRESHOLD):
     """Generate comprehensive email analysis report"""
-    analyzer = EmailNetworkAnalyzer()
+    analyzer = EmailNetworkAnalyzer(embedding_backend, embedding_threads)
     
     # Analyze PDFs
-    analyzer.analyze_directory(pdf_dir, test_run=test_run)
+    analyzer.analyze_directory(pdf_dir, test_run=test_run, workers=workers)
     
     # Generate all visualization data (including D3 JSONs)
-    analyzer.generate_visualization_data(output_dir)
+    analyzer.generate_visualization_data(output_dir, top_domains, rank_domains_by, start, end,
+                                         incremental=incremental, drift_threshold=drift_threshold)
     
     # Create and save matplotlib visualization (legacy)
     try:
-        fig = analyzer.create_network_visualization()
+        fig = analyzer.create_network_visualization(top_n=top_domains, rank_by=rank_domains_by,
+                                                    start=start, end=end)
         if fig:
             fig.savefig(os.path.join(output_dir, "email_analysis.png"), dpi=300, bbox_inches='tight')
             plt.close(fig)
     except Exception as e:
         logger.warning(f"Could not create matplotlib visualization: {str(e)}")
     
+    # Sparse email and entity graphs, for later degree, neighbour and PageRank queries
+    analyzer.save_graphs(output_dir)
+    
     # Generate and save statistics
     stats = analyzer.generate_statistics()
     
@@ -48,7 +59,10 @@ def generate_report(pdf_dir, output_dir, test_run=False):
                 'total_connections': stats['total_connections'],
                 'avg_connections': stats['avg_connections_per_email']
             },
-            'domain_stats': stats['domain_stats']
+            'domain_stats': stats['domain_stats'],
+            'central_emailers': [
+                {'email': email, 'pagerank': score} for email, score in stats['central_emailers']
+            ]
         }, f, indent=2)
     
     return stats
@@ -61,6 +75,23 @@ def main():
     parser.add_argument('--verbose', action='store_true', help='Enable verbose output')
     parser.add_argument('--test-run', action='store_true', 
                        help='Process only 500 documents for testing')
+    parser.add_argument('--workers', type=int,
+                       help='Processes extracting text and running NER (default: all cores but two)')
+    parser.add_argument('--top_domains', type=int, default=10,
+                       help='Domains shown in the domain heatmap and network')
+    parser.add_argument('--rank_domains_by', choices=RANK_BY, default='addresses',
+                       help='Pick the top domains by distinct addresses, or by emails sent, received or both')
+    parser.add_argument('--start', help='Only count emails dated on or after this day (YYYY-MM-DD) in the domain views')
+    parser.add_argument('--end', help='Only count emails dated before this day (YYYY-MM-DD) in the domain views')
+    parser.add_argument('--embedding_backend', choices=BACKENDS, default=EMBEDDING_BACKEND,
+                        help='Encoder for document embeddings; onnx runs the model int8-quantized through ONNX Runtime')
+    parser.add_argument('--embedding_threads', type=int, default=EMBEDDING_THREADS,
+                        help='Intra-op threads for encoding (default: all cores)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Update the topic model saved by the last run instead of refitting it')
+    parser.add_argument('--drift_threshold', type=float, default=DRIFT_THRESHOLD,
+                        help='With --incremental, refit once new documents fit the saved topics this much '
+                             'worse than the documents it was fitted on (0.1 = 10%%)')
 
     args = parser.parse_args()
 
@@ -75,7 +106,12 @@ def main():
     
     # Generate report
     try:
-        stats = generate_report(args.pdf_dir, output_dir, test_run=args.test_run)
+        stats = generate_report(args.pdf_dir, output_dir, test_run=args.test_run, workers=args.workers,
+                                top_domains=args.top_domains, rank_domains_by=args.rank_domains_by,
+                                start=args.start, end=args.end,
+                                embedding_backend=args.embedding_backend,
+                                embedding_threads=args.embedding_threads,
+                                incremental=args.incremental, drift_threshold=args.drift_threshold)
         logger.info(f"Analysis complete. Results saved to {output_dir}")
         logger.info(f"Found {stats['total_unique_emails']} unique email addresses")
         logger.info(f"Detected {stats['total_connections']} connections")
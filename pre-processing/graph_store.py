@@ -0,0 +1,307 @@
+import json
+from array import array
+from datetime import date
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+# Buffered edges are summed into the CSR matrix once this many are waiting
+BATCH_EDGES = 1_000_000
+
+# Edge dates are logged as days since this date
+EPOCH = date(1970, 1, 1)
+
+
+class Vocabulary:
+    """Interns strings as consecutive integer ids"""
+
+    def __init__(self, tokens=()):
+        self.tokens = []
+        self.ids = {}
+        for token in tokens:
+            self.add(token)
+
+    def add(self, token):
+        token_id = self.ids.get(token)
+        if token_id is None:
+            token_id = self.ids[token] = len(self.tokens)
+            self.tokens.append(token)
+        return token_id
+
+    def get(self, token):
+        return self.ids.get(token)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __contains__(self, token):
+        return token in self.ids
+
+
+class SparseGraph:
+    """
+    Weighted graph over interned string nodes, stored as a scipy CSR matrix.
+
+    Edges are appended to flat integer buffers and summed into the matrix
+    in batches of BATCH_EDGES, so adding an edge costs a few bytes until
+    the next batch. Undirected graphs keep both directions of every edge,
+    so row sums are degrees and a row lists all of a node's neighbours.
+    Graphs hold no lambdas or nested dicts and pickle compactly, so worker
+    processes can return them whole.
+
+    Edges added with a day are also kept in an edge log with one row per
+    edge, so counts can later be taken over a time window.
+    """
+
+    def __init__(self, directed=True):
+        self.directed = directed
+        self.vocab = Vocabulary()
+        self._matrix = sparse.csr_matrix((0, 0), dtype=np.int64)
+        self._rows = array('q')
+        self._cols = array('q')
+        self._weights = array('q')
+        # Node id arrays of co-occurrence groups, and (rows, cols, weights) of merged graphs
+        self._groups = []
+        self._chunks = []
+        self._pending = 0
+        # Dated edge log: single edges, and (rows, cols, days) arrays of merged graphs
+        self._log_rows = array('q')
+        self._log_cols = array('q')
+        self._log_days = array('i')
+        self._log_chunks = []
+
+    def add_edge(self, source, target, weight=1, day=None):
+        self._rows.append(self.vocab.add(source))
+        self._cols.append(self.vocab.add(target))
+        self._weights.append(weight)
+        if day is not None:
+            for _ in range(weight):
+                self._log_rows.append(self._rows[-1])
+                self._log_cols.append(self._cols[-1])
+                self._log_days.append((day - EPOCH).days)
+        if not self.directed:
+            self._rows.append(self._cols[-1])
+            self._cols.append(self._rows[-2])
+            self._weights.append(weight)
+        self._added(1)
+
+    def add_edges(self, edges):
+        for source, target in edges:
+            self.add_edge(source, target)
+
+    def add_group(self, nodes):
+        """
+        Connect every pair of distinct nodes in a group, e.g. the entities of one document.
+
+        The group is kept as one row of a sparse group x node incidence
+        matrix B, and B.T @ B adds all its pairs at the next batch, so the
+        pairs are never built as Python tuples.
+        """
+        if self.directed:
+            raise ValueError("Co-occurrence groups need an undirected graph")
+        ids = np.unique(np.fromiter((self.vocab.add(node) for node in nodes), dtype=np.int64))
+        if len(ids) > 1:
+            self._groups.append(ids)
+            self._added(len(ids) * (len(ids) - 1))
+
+    def merge(self, other):
+        """Add another graph's edges, mapping its node ids into this graph's vocabulary"""
+        if other.directed != self.directed:
+            raise ValueError("Cannot merge directed and undirected graphs")
+        mapping = np.fromiter((self.vocab.add(token) for token in other.vocab.tokens),
+                              dtype=np.int64, count=len(other.vocab))
+        coo = other.matrix.tocoo()
+        self._chunks.append((mapping[coo.row], mapping[coo.col], coo.data.astype(np.int64)))
+        rows, cols, days = other.dated_edges()
+        if len(days):
+            self._log_chunks.append((mapping[rows], mapping[cols], days))
+        self._added(coo.nnz)
+
+    def _added(self, count):
+        self._pending += count
+        if self._pending >= BATCH_EDGES:
+            self._flush()
+
+    def _flush(self):
+        n = len(self.vocab)
+        matrix = self._matrix
+        if matrix.shape[0] < n:
+            indptr = np.pad(matrix.indptr, (0, n - matrix.shape[0]), mode='edge')
+            matrix = sparse.csr_matrix((matrix.data, matrix.indices, indptr), shape=(n, n))
+
+        rows = [np.array(self._rows, dtype=np.int64)] + [chunk[0] for chunk in self._chunks]
+        cols = [np.array(self._cols, dtype=np.int64)] + [chunk[1] for chunk in self._chunks]
+        weights = [np.array(self._weights, dtype=np.int64)] + [chunk[2] for chunk in self._chunks]
+        if sum(len(r) for r in rows):
+            # Duplicate coordinates are summed by the conversion to CSR
+            matrix = matrix + sparse.coo_matrix(
+                (np.concatenate(weights), (np.concatenate(rows), np.concatenate(cols))), shape=(n, n)
+            ).tocsr()
+
+        if self._groups:
+            indptr = np.zeros(len(self._groups) + 1, dtype=np.int64)
+            np.cumsum([len(ids) for ids in self._groups], out=indptr[1:])
+            incidence = sparse.csr_matrix(
+                (np.ones(indptr[-1], dtype=np.int64), np.concatenate(self._groups), indptr),
+                shape=(len(self._groups), n)
+            )
+            cooccurrence = (incidence.T @ incidence).tocsr()
+            cooccurrence.setdiag(0)
+            matrix = matrix + cooccurrence
+
+        matrix.eliminate_zeros()
+        self._matrix = matrix
+        self._rows, self._cols, self._weights = array('q'), array('q'), array('q')
+        self._groups = []
+        self._chunks = []
+        self._pending = 0
+
+    def dated_edges(self):
+        """
+        The edge log as arrays.
+
+        Returns:
+            tuple: (source ids, target ids, days as numpy datetime64[D]), one
+                entry per dated edge, in the order they were added.
+        """
+        if len(self._log_rows) or len(self._log_chunks) != 1:
+            # Concatenated into one chunk, so repeated calls do not copy again
+            chunks = self._log_chunks + [(
+                np.array(self._log_rows, dtype=np.int64),
+                np.array(self._log_cols, dtype=np.int64),
+                np.array(self._log_days, dtype=np.int64).astype('datetime64[D]')
+            )]
+            self._log_chunks = [tuple(np.concatenate(parts) for parts in zip(*chunks))]
+            self._log_rows, self._log_cols, self._log_days = array('q'), array('q'), array('i')
+        return self._log_chunks[0]
+
+    @property
+    def matrix(self):
+        """Adjacency matrix in CSR form, indexed by vocabulary id"""
+        if self._pending or self._matrix.shape[0] < len(self.vocab):
+            self._flush()
+        return self._matrix
+
+    def __len__(self):
+        return len(self.vocab)
+
+    @property
+    def edge_count(self):
+        nnz = self.matrix.nnz
+        return nnz if self.directed else nnz // 2
+
+    def out_degree(self, weighted=True):
+        """Per-node array of summed outgoing weights, or of distinct neighbours if not weighted"""
+        matrix = self.matrix
+        if not weighted:
+            return np.diff(matrix.indptr)
+        return np.asarray(matrix.sum(axis=1)).ravel()
+
+    def in_degree(self, weighted=True):
+        matrix = self.matrix
+        if not weighted:
+            return np.bincount(matrix.indices, minlength=matrix.shape[0])
+        return np.asarray(matrix.sum(axis=0)).ravel()
+
+    def degree(self, weighted=True):
+        """Total degree; for undirected graphs the same as out_degree"""
+        if not self.directed:
+            return self.out_degree(weighted)
+        return self.out_degree(weighted) + self.in_degree(weighted)
+
+    def weight(self, source, target):
+        i, j = self.vocab.get(source), self.vocab.get(target)
+        if i is None or j is None:
+            return 0
+        return int(self.matrix[i, j])
+
+    def neighbours(self, node, k=None):
+        """A node's heaviest outgoing edges as (neighbour, weight), heaviest first"""
+        i = self.vocab.get(node)
+        if i is None:
+            return []
+        matrix = self.matrix
+        start, end = matrix.indptr[i], matrix.indptr[i + 1]
+        weights = matrix.data[start:end]
+        order = np.argsort(-weights, kind='stable')[:k]
+        return [(self.vocab.tokens[matrix.indices[start + o]], int(weights[o])) for o in order]
+
+    def edges(self):
+        """Yield (source, target, weight); undirected edges are yielded once"""
+        coo = self.matrix.tocoo()
+        tokens = self.vocab.tokens
+        for i, j, w in zip(coo.row.tolist(), coo.col.tolist(), coo.data.tolist()):
+            if self.directed or i < j:
+                yield tokens[i], tokens[j], w
+
+    def top_nodes(self, scores, k=10):
+        """The k nodes with the highest score as (node, score)"""
+        scores = np.asarray(scores)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k] if k else []
+        top = sorted(top, key=lambda i: -scores[i])
+        return [(self.vocab.tokens[i], float(scores[i])) for i in top]
+
+    def pagerank(self, alpha=0.85, tol=1e-6, max_iter=100):
+        """
+        PageRank by power iteration over the weighted transition matrix.
+
+        Nodes without outgoing edges spread their rank evenly, as in
+        networkx.pagerank, whose convergence test this follows.
+
+        Returns:
+            numpy.ndarray: Rank of every node, indexed by vocabulary id.
+        """
+        matrix = self.matrix.astype(np.float64)
+        n = matrix.shape[0]
+        if n == 0:
+            return np.zeros(0)
+        out_weight = np.asarray(matrix.sum(axis=1)).ravel()
+        dangling = out_weight == 0
+        inverse = np.divide(1.0, out_weight, out=np.zeros(n), where=~dangling)
+        transposed = (sparse.diags(inverse) @ matrix).T.tocsr()
+        rank = np.full(n, 1.0 / n)
+        for _ in range(max_iter):
+            previous = rank
+            rank = alpha * (transposed @ previous + previous[dangling].sum() / n) + (1 - alpha) / n
+            if np.abs(rank - previous).sum() < n * tol:
+                break
+        return rank
+
+    def components(self):
+        """Weakly connected component label of every node, indexed by vocabulary id"""
+        _, labels = connected_components(self.matrix, directed=self.directed, connection='weak')
+        return labels
+
+    def communities(self, resolution=1, seed=None):
+        """Louvain communities of the undirected, weighted graph, largest first, as sets of nodes"""
+        import networkx as nx
+        matrix = self.matrix
+        if self.directed:
+            matrix = matrix + matrix.T
+        graph = nx.from_scipy_sparse_array(matrix)
+        communities = nx.community.louvain_communities(graph, resolution=resolution, seed=seed)
+        return [{self.vocab.tokens[i] for i in community}
+                for community in sorted(communities, key=len, reverse=True)]
+
+    def save(self, path):
+        """Write the matrix and vocabulary to one compressed .npz file"""
+        matrix = self.matrix
+        log_rows, log_cols, log_days = self.dated_edges()
+        np.savez_compressed(
+            path, data=matrix.data, indices=matrix.indices, indptr=matrix.indptr,
+            directed=np.array(self.directed), tokens=np.array(json.dumps(self.vocab.tokens)),
+            log_rows=log_rows, log_cols=log_cols, log_days=log_days.astype(np.int32)
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            graph = cls(directed=bool(f['directed']))
+            graph.vocab = Vocabulary(json.loads(str(f['tokens'])))
+            n = len(graph.vocab)
+            graph._matrix = sparse.csr_matrix((f['data'], f['indices'], f['indptr']), shape=(n, n))
+            if 'log_days' in f:
+                graph._log_chunks = [(f['log_rows'], f['log_cols'], f['log_days'].astype('datetime64[D]'))]
+        return graph
@@ -3,31 +3,43 @@
 import os
 import json
 import argparse
-from pdfminer.high_level import extract_text
-from pdfminer.pdfdocument import PDFTextExtractionNotAllowed
+from functools import partial
 from multiprocessing import Pool, cpu_count
+import extraction_watchdog
+from extraction_watchdog import Quarantine
+from dedup import DuplicateIndex
+from catalog import open_catalog
+import page_scan
 
-def is_text_selectable(pdf_path):
+def check_text_layer(pdf_path):
+    """Returns (pdf_path, ocr_pages, page_count); ocr_pages is None when the whole file needs OCR"""
     try:
-        # Extract text from the first page to improve performance
-        text = extract_text(pdf_path, maxpages=1)
-        if text and any(char.isalnum() for char in text):
-            return (pdf_path, True)
-        else:
-            return (pdf_path, False)
-    except PDFTextExtractionNotAllowed:
-        # Text extraction is not allowed (e.g., encrypted PDF)
-        return (pdf_path, False)
+        # Every page is checked, so typed cover pages no longer hide scanned attachments
+        ocr_pages, page_count = page_scan.scan_pdf(pdf_path)
+        return (pdf_path, ocr_pages, page_count)
+    except MemoryError:
+        # Let the watchdog record the file as failed
+        raise
     except Exception as e:
         # Handle other exceptions (e.g., corrupted PDF)
         print(f"Error processing {pdf_path}: {e}")
-        return (pdf_path, False)
+        return (pdf_path, None, None)
 
 def main():
     # Parse command-line arguments
     parser = argparse.ArgumentParser(description="Analyze PDFs for text selectability")
     parser.add_argument('--input_folder', required=True, help='Path to the folder containing PDFs')
     parser.add_argument('--output_dir', required=True, help='Directory to save the output files')
+    parser.add_argument('--time_limit', type=int, default=extraction_watchdog.DEFAULT_TIME_LIMIT,
+                        help='Seconds allowed per PDF before it counts as failed (0 disables)')
+    parser.add_argument('--memory_limit_mb', type=int, default=extraction_watchdog.DEFAULT_MEMORY_LIMIT_MB,
+                        help='Memory limit per worker process in MB (0 disables)')
+    parser.add_argument('--max_tasks_per_child', type=int, default=extraction_watchdog.DEFAULT_MAX_TASKS_PER_CHILD,
+                        help='Recycle each worker process after this many PDFs')
+    parser.add_argument('--quarantine_file', help='Quarantine list of failing PDFs (default: <output_dir>/quarantine.json)')
+    parser.add_argument('--dedup_file', help='Content hashes and duplicate paths of the PDFs (default: <output_dir>/dedup.json)')
+    parser.add_argument('--page_map_file', help='Pages without a text layer per PDF (default: <output_dir>/page_map.json)')
+    parser.add_argument('--recheck', action='store_true', help='Check every PDF again, not only new or changed ones')
     args = parser.parse_args()
 
     input_folder = args.input_folder
@@ -36,28 +48,66 @@ def main():
     # Ensure output directory exists
     os.makedirs(output_dir, exist_ok=True)
 
-    pdf_paths = []
-    # Collect all PDF file paths
-    for root, _, files in os.walk(input_folder):
-        for file in files:
-            if file.lower().endswith('.pdf'):
-                pdf_path = os.path.join(root, file)
-                pdf_paths.append(pdf_path)
+    # The catalog knows which PDFs were already checked; only new or changed files are left
+    catalog = open_catalog(input_folder)
+    pdf_paths = catalog.pdfs() if args.recheck else catalog.pdfs(selectable=None)
+    print(f"{len(pdf_paths)} PDFs to check.")
 
-    total_pdfs = len(pdf_paths)
-    unselectable_pdfs = []
+    # Byte-identical copies are checked once and share the result
+    duplicates = DuplicateIndex(args.dedup_file or os.path.join(output_dir, 'dedup.json'))
+    pdf_paths = duplicates.dedupe(pdf_paths)
+    duplicates.save()
+
+    # Files that failed on earlier runs are skipped
+    quarantine = Quarantine(args.quarantine_file or os.path.join(output_dir, 'quarantine.json'))
+    pdf_paths = quarantine.filter(pdf_paths)
+
+    failed_pdfs = []
+    page_map_file = args.page_map_file or os.path.join(output_dir, 'page_map.json')
+    page_map = page_scan.load_page_map(page_map_file)
+    scanned = {}
 
     # Use multiprocessing Pool to process PDFs in parallel
     pool_size = max(1, cpu_count() - 2)  # Ensure at least 1 process
     print(f"Using {pool_size} processes for multiprocessing.")
-    with Pool(processes=pool_size) as pool:
-        # Map the is_text_selectable function to the list of PDF paths
-        results = pool.map(is_text_selectable, pdf_paths)
+    with Pool(processes=pool_size,
+              maxtasksperchild=args.max_tasks_per_child or None,
+              initializer=extraction_watchdog.init_worker,
+              initargs=(args.time_limit, args.memory_limit_mb)) as pool:
+        # Each PDF runs under the watchdog's time and memory limits
+        results = pool.imap_unordered(partial(extraction_watchdog.guarded_call, check_text_layer), pdf_paths)
+
+        # Process the results
+        for pdf_path, result, error in results:
+            if error:
+                quarantine.record_failure(pdf_path, error, stage='ocr-check')
+                failed_pdfs.append(pdf_path)
+                continue
+            quarantine.record_success(pdf_path)
+            _, ocr_pages, page_count = result
+            scanned[pdf_path] = {'page_count': page_count, 'ocr_pages': ocr_pages}
+
+    quarantine.save()
+
+    # Map the results back onto every copy and record them in the catalog
+    checked_pdfs = len(scanned)
+    for pdf_path, entry in scanned.items():
+        copies = duplicates.expand([pdf_path])
+        catalog.mark(copies, selectable=entry['ocr_pages'] == [], page_count=entry['page_count'])
+        for copy in copies:
+            # Only PDFs with pages to OCR are kept in the page map
+            page_map.pop(copy, None)
+            if entry['ocr_pages'] != []:
+                page_map[copy] = entry
+    failed_pdfs = duplicates.expand(failed_pdfs)
 
-    # Process the results
-    for pdf_path, is_selectable in results:
-        if not is_selectable:
-            unselectable_pdfs.append(pdf_path)
+    # Report on the whole corpus, including PDFs checked on earlier runs
+    total_pdfs = catalog.summary()['pdfs']
+    unselectable_pdfs = catalog.pdfs(selectable=False, ocr_done=False)
+    page_map = {path: page_map[path] for path in unselectable_pdfs if path in page_map}
+    page_scan.save_page_map(page_map_file, page_map)
+    catalog.close()
+    partial_pdfs = sum(1 for entry in page_map.values() if page_scan.ocr_page_range(entry))
 
     # Calculate the percentage of unselectable PDFs
     percentage_unselectable = (len(unselectable_pdfs) / total_pdfs) * 100 if total_pdfs > 0 else 0
@@ -67,7 +117,9 @@ def main():
         'total_pdfs': total_pdfs,
         'number_unselectable_pdfs': len(unselectable_pdfs),
         'percentage_unselectable': percentage_unselectable,
-        'unselectable_pdfs': unselectable_pdfs
+        'unselectable_pdfs': unselectable_pdfs,
+        'failed_pdfs': failed_pdfs,
+        'duplicate_pdfs': {path: duplicates.aliases_of(path) for path in pdf_paths if duplicates.aliases_of(path)}
     }
 
     # Write the metadata to a JSON file
@@ -76,10 +128,16 @@ def main():
         json.dump(metadata, f, indent=4)
 
     # Print the results
-    print(f"Total PDFs processed: {total_pdfs}")
-    print(f"Number of unselectable PDFs: {len(unselectable_pdfs)}")
+    print(f"PDFs checked this run: {checked_pdfs} unique")
+    print(f"Total PDFs in the corpus: {total_pdfs}")
+    print(f"Number of unselectable PDFs still needing OCR: {len(unselectable_pdfs)}")
     print(f"Percentage of unselectable PDFs: {percentage_unselectable:.2f}%")
+    print(f"PDFs needing OCR on some pages only: {partial_pdfs}")
+    if failed_pdfs:
+        print(f"Failed PDFs (timeout, memory or error): {len(failed_pdfs)}")
+    quarantine.report()
     print(f"Metadata saved to: {output_file_path}")
+    print(f"Page map saved to: {page_map_file}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,97 @@
+import os
+import json
+import logging
+from datetime import datetime
+
+from dedup import file_digest
+
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+class OcrJournal:
+    """
+    Append-only record of every OCR job, keyed by the SHA-256 of its input.
+
+    Each finished job is appended as one JSON line and fsync'ed, so a run
+    that dies leaves at most a torn last line, which is ignored on load.
+    The latest line per input hash wins. Because records are keyed by
+    content, a rerun recognises files that were already OCR'd even after
+    they were moved, and in-place outputs by their output hash.
+    """
+
+    def __init__(self, path, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.entries = {}
+        self.outputs = set()
+        self.counts = {'done': 0, 'failed': 0}
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self._apply(json.loads(line))
+                    except (json.JSONDecodeError, KeyError):
+                        logging.warning(f"Ignoring a damaged line in OCR journal {path}")
+        self.file = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.file = open(path, 'a', encoding='utf-8')
+
+    def _apply(self, record):
+        self.entries[record['input_sha256']] = record
+        if record['status'] == 'done' and record.get('output_sha256'):
+            self.outputs.add(record['output_sha256'])
+
+    def completed(self, input_digest, output_pdf=None):
+        """
+        Whether a file with this content needs no more OCR.
+
+        Args:
+            input_digest (str): SHA-256 of the file as it is now.
+            output_pdf (str): Output path, or None for in-place OCR.
+
+        Returns:
+            bool: True if the file is itself an OCR output, or was OCR'd
+            into output_pdf and that output is still intact.
+        """
+        if input_digest in self.outputs:
+            return True
+        entry = self.entries.get(input_digest)
+        if not entry or entry['status'] != 'done' or output_pdf is None:
+            return False
+        return os.path.exists(output_pdf) and file_digest(output_pdf) == entry.get('output_sha256')
+
+    def gave_up(self, input_digest):
+        """Whether this content already failed max_attempts times in a row"""
+        entry = self.entries.get(input_digest)
+        return bool(entry) and entry['status'] == 'failed' and entry['attempts'] >= self.max_attempts
+
+    def record(self, input_pdf, input_digest, output_pdf, output_digest, status, seconds, error=None):
+        previous = self.entries.get(input_digest)
+        attempts = previous['attempts'] + 1 if previous and previous['status'] == 'failed' else 1
+        record = {
+            'input': input_pdf,
+            'input_sha256': input_digest,
+            'output': output_pdf,
+            'output_sha256': output_digest,
+            'status': status,
+            'attempts': attempts,
+            'seconds': round(seconds, 2),
+            'finished_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        if error:
+            record['error'] = error
+        self._apply(record)
+        self.counts[status] += 1
+        if self.file:
+            self.file.write(json.dumps(record) + '\n')
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        return record
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,51 @@
+import os
+import re
+
+# run-ocr.py --sidecar_only writes the OCR text of <name>.pdf to <name>.pdf.ocr.txt
+SIDECAR_SUFFIX = '.ocr.txt'
+
+# ocrmypdf's placeholder for pages it did not OCR because they already had text
+SKIPPED_PAGE = re.compile(r'^\s*\[OCR skipped on page \d+\]\s*$')
+
+
+def sidecar_path(pdf_path):
+    return f"{pdf_path}{SIDECAR_SUFFIX}"
+
+
+def read_sidecar(pdf_path):
+    """
+    OCR text for a PDF on disk, if a sidecar at least as new as the PDF exists.
+
+    Returns:
+        str: The sidecar text with pages separated by form feeds, or None.
+    """
+    path = sidecar_path(pdf_path)
+    try:
+        if os.path.getmtime(path) < os.path.getmtime(pdf_path):
+            # The PDF changed after it was OCR'd
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def merge_text_layer(sidecar_text, extract_text_layer):
+    """
+    Fill the pages ocrmypdf skipped with the PDF's own text layer.
+
+    Args:
+        sidecar_text (str): Sidecar contents, one page per form feed.
+        extract_text_layer (callable): Returns the PDF's extracted text, pages
+            ending in form feeds. Only called if some page was skipped.
+
+    Returns:
+        str: The text in pdfminer's layout, every page ending in a form feed.
+    """
+    pages = sidecar_text.split('\f')
+    skipped = [i for i, page in enumerate(pages) if SKIPPED_PAGE.match(page)]
+    if skipped:
+        layer_pages = extract_text_layer().split('\f')
+        for i in skipped:
+            pages[i] = layer_pages[i] if i < len(layer_pages) else ''
+    return ''.join(page + '\f' for page in pages)
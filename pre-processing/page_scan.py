@@ -0,0 +1,96 @@
+import os
+import json
+
+import fitz  # PyMuPDF
+
+# A page counts as having a text layer once it holds this many letters or digits,
+# the same test ocrmypdf's skip_text applies before leaving a page alone
+MIN_TEXT_CHARS = 1
+
+
+def scan_page(page):
+    """
+    Decide whether one page needs OCR.
+
+    Pages without fonts cannot carry text, so their text is never extracted.
+    Pages with neither text nor images are blank and are left alone.
+
+    Returns:
+        bool: True if the page has images but no text layer.
+    """
+    if page.get_fonts():
+        text = page.get_text("text")
+        if sum(char.isalnum() for char in text) >= MIN_TEXT_CHARS:
+            return False
+    return bool(page.get_image_info())
+
+
+def scan_pdf(pdf_path):
+    """
+    Find the pages of a PDF that need OCR.
+
+    Uses PyMuPDF's font tables and raw text instead of pdfminer's layout
+    analysis, so every page can be checked in about the time pdfminer
+    took for the first one.
+
+    Returns:
+        tuple: (ocr_pages, page_count). ocr_pages lists the 1-based page
+            numbers without a text layer, or is None when the PDF cannot be
+            read and the whole file should go to OCR.
+    """
+    with fitz.open(pdf_path) as doc:
+        if doc.needs_pass:
+            return None, doc.page_count
+        ocr_pages = [page.number + 1 for page in doc if scan_page(page)]
+        return ocr_pages, doc.page_count
+
+
+def count_pages(pdf_path):
+    """Page count of a PDF, or 0 if it cannot be opened"""
+    try:
+        with fitz.open(pdf_path) as doc:
+            return doc.page_count
+    except Exception:
+        return 0
+
+
+def load_page_map(path):
+    """Page map written by ocr-check.py: {pdf path: {'page_count': n, 'ocr_pages': [...]}}"""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_page_map(path, page_map):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(page_map, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def ocr_page_range(entry):
+    """
+    ocrmypdf 'pages' argument for a page map entry.
+
+    Returns:
+        str: e.g. '2,5-7', or None to OCR the whole file.
+    """
+    if not entry or entry.get('ocr_pages') is None:
+        return None
+    pages = entry['ocr_pages']
+    if not pages or len(pages) >= entry.get('page_count', 0):
+        return None
+    ranges = []
+    start = prev = pages[0]
+    for page in pages[1:] + [None]:
+        if page is not None and page == prev + 1:
+            prev = page
+            continue
+        ranges.append(str(start) if start == prev else f"{start}-{prev}")
+        if page is not None:
+            start = prev = page
+    return ','.join(ranges)
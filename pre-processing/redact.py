@@ -10,7 +10,14 @@ from tqdm import tqdm
 import fitz  # PyMuPDF
 import re
 import sys
+import shutil
 from contextlib import contextmanager
+from dedup import DuplicateIndex
+from catalog import open_catalog
+from text_chunks import split_text
+import text_cache
+
+PYMUPDF_EXTRACTOR = f"pymupdf-{fitz.VersionBind}:pages"
 
 # Ensure the 'reports' directory exists
 LOG_DIR = '../reports'
@@ -84,12 +91,12 @@ def extract_sensitive_data(text):
             phone_numbers.add(phone)
     sensitive_data['phone_numbers'] = list(phone_numbers)
 
-    # Extract full names using SpaCy's NER
-    doc = nlp(text)
+    # Extract full names using SpaCy's NER, in bounded chunks for very long pages
     full_names = set()
-    for ent in doc.ents:
-        if ent.label_ == "PERSON":
-            full_names.add(ent.text)
+    for doc in nlp.pipe(split_text(text)):
+        for ent in doc.ents:
+            if ent.label_ == "PERSON":
+                full_names.add(ent.text)
     sensitive_data['full_names'] = list(full_names)
 
     return sensitive_data
@@ -108,6 +115,23 @@ def suppress_stderr():
         finally:
             sys.stderr = old_stderr
 
+def extract_page_texts(pdf_path):
+    """
+    Extract the text of every page with PyMuPDF.
+
+    Args:
+        pdf_path (str): Path to the PDF.
+
+    Returns:
+        str: Page texts joined by form feeds, the page separator pdfminer uses too.
+    """
+    with suppress_stderr():
+        doc = fitz.open(pdf_path)
+    try:
+        return '\f'.join(page.get_text().replace('\f', ' ') for page in doc)
+    finally:
+        doc.close()
+
 def redact_pdf(pdf_path, output_pdf_path, dry_run):
     """
     Redact sensitive full names, email addresses, and phone numbers from a PDF.
@@ -121,16 +145,15 @@ def redact_pdf(pdf_path, output_pdf_path, dry_run):
         dict: Status of the redaction process.
     """
     try:
-        # Open the PDF using PyMuPDF within the suppress_stderr context
-        with suppress_stderr():
-            doc = fitz.open(pdf_path)
+        # Page texts come from the shared text cache; the PDF itself is only opened to redact it
+        page_texts = text_cache.cached_file_text(pdf_path, extract_page_texts, PYMUPDF_EXTRACTOR).split('\f')
+        if not dry_run:
+            # Open the PDF using PyMuPDF within the suppress_stderr context
+            with suppress_stderr():
+                doc = fitz.open(pdf_path)
         redacted_items = {'full_names': [], 'emails': [], 'phone_numbers': []}
 
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            # Extract text from the current page
-            text = page.get_text()
-
+        for page_num, text in enumerate(page_texts):
             # Extract sensitive data from the page
             sensitive_data = extract_sensitive_data(text)
 
@@ -147,6 +170,7 @@ def redact_pdf(pdf_path, output_pdf_path, dry_run):
                 continue  # Skip redaction in dry-run mode
 
             if sensitive_data['full_names'] or sensitive_data['emails'] or sensitive_data['phone_numbers']:
+                page = doc[page_num]
                 # Redact full names
                 for name in sensitive_data['full_names']:
                     with suppress_stderr():
@@ -179,21 +203,67 @@ def redact_pdf(pdf_path, output_pdf_path, dry_run):
             doc.close()
 
             if any(redacted_items.values()):
-                return {'pdf_path': pdf_path, 'status': 'success', 'redacted_items': redacted_items}
+                return {'pdf_path': pdf_path, 'status': 'success', 'redacted_items': redacted_items,
+                        'page_count': len(page_texts)}
             else:
                 # No sensitive data found; copy the original PDF
                 with open(pdf_path, 'rb') as src, open(output_pdf_path, 'wb') as dst:
                     dst.write(src.read())
                 doc.close()
-                return {'pdf_path': pdf_path, 'status': 'no_sensitive_data', 'redacted_items': redacted_items}
+                return {'pdf_path': pdf_path, 'status': 'no_sensitive_data', 'redacted_items': redacted_items,
+                        'page_count': len(page_texts)}
         else:
-            return {'pdf_path': pdf_path, 'status': 'success', 'redacted_items': redacted_items}
+            return {'pdf_path': pdf_path, 'status': 'success', 'redacted_items': redacted_items,
+                    'page_count': len(page_texts)}
 
     except Exception as e:
         logging.error(f"Error processing {pdf_path}: {e}", exc_info=True)
         return {'pdf_path': pdf_path, 'status': 'error', 'error': str(e)}
 
-def process_pdfs(input_folder, output_folder, dry_run, log_file):
+def map_to_aliases(results, duplicates, output_paths, dry_run):
+    """
+    Extend the results to the duplicate copies of each redacted PDF.
+
+    Copies get the canonical file's redacted output instead of being redacted again.
+
+    Args:
+        results (list): Results of redact_pdf for the unique PDFs.
+        duplicates (DuplicateIndex): Duplicate paths found for this run.
+        output_paths (dict): Output path for every input PDF.
+        dry_run (bool): If True, only log the copies.
+
+    Returns:
+        list: Results for the copies.
+    """
+    alias_results = []
+    for result in results:
+        pdf_path = result['pdf_path']
+        for alias in duplicates.aliases_of(pdf_path):
+            if dry_run:
+                logging.info(f"{alias} has the same content as {pdf_path}; see its entries above.")
+            elif result['status'] != 'error':
+                shutil.copyfile(output_paths[pdf_path], output_paths[alias])
+            alias_results.append({**result, 'pdf_path': alias, 'alias_of': pdf_path})
+    return alias_results
+
+def record_in_catalog(catalog, results, dry_run):
+    """
+    Store page counts and, unless this was a dry run, the redaction status in the catalog.
+
+    Args:
+        catalog (Catalog): The corpus catalog.
+        results (list): Results for every processed PDF, copies included.
+        dry_run (bool): If True, no PDF was redacted.
+    """
+    for result in results:
+        if result['status'] == 'error':
+            continue
+        if dry_run:
+            catalog.mark(result['pdf_path'], page_count=result['page_count'])
+        else:
+            catalog.mark(result['pdf_path'], page_count=result['page_count'], redacted=True)
+
+def process_pdfs(input_folder, output_folder, dry_run, log_file, dedup_file=None, only_new=False):
     """
     Process all PDFs in the input folder for redaction.
 
@@ -202,32 +272,43 @@ def process_pdfs(input_folder, output_folder, dry_run, log_file):
         output_folder (str): Directory to save redacted PDFs.
         dry_run (bool): If True, perform a dry run without saving redacted PDFs.
         log_file (str): Path to the log file.
+        dedup_file (str): Manifest of content hashes used to skip duplicate copies.
+        only_new (bool): If True, skip PDFs the catalog lists as already redacted.
     """
     # Ensure output directory exists
     if not dry_run:
         os.makedirs(output_folder, exist_ok=True)
 
-    # Gather all PDF paths
-    pdf_paths = []
-    for root, dirs, files in os.walk(input_folder):
-        for file in files:
-            if file.lower().endswith('.pdf'):
-                pdf_path = os.path.join(root, file)
-                relative_path = os.path.relpath(pdf_path, input_folder)
-                output_pdf_path = os.path.join(output_folder, relative_path)
-                output_pdf_dir = os.path.dirname(output_pdf_path)
-                if not dry_run:
-                    os.makedirs(output_pdf_dir, exist_ok=True)
-                pdf_paths.append((pdf_path, output_pdf_path, dry_run))
-
-    total_pdfs = len(pdf_paths)
+    # Gather all PDF paths from the corpus catalog
+    catalog = open_catalog(input_folder)
+    output_paths = {}
+    for pdf_path in (catalog.pdfs(redacted=False) if only_new else catalog.pdfs()):
+        relative_path = os.path.relpath(pdf_path, input_folder)
+        output_pdf_path = os.path.join(output_folder, relative_path)
+        output_pdf_dir = os.path.dirname(output_pdf_path)
+        if not dry_run:
+            os.makedirs(output_pdf_dir, exist_ok=True)
+        output_paths[pdf_path] = output_pdf_path
+
+    total_pdfs = len(output_paths)
     print(f"Found {total_pdfs} PDFs to process.")
 
+    # Byte-identical copies are redacted once
+    duplicates = DuplicateIndex(dedup_file)
+    unique_paths = duplicates.dedupe(list(output_paths))
+    duplicates.save()
+    if len(unique_paths) < total_pdfs:
+        print(f"{total_pdfs - len(unique_paths)} PDFs are copies of others and reuse their redaction.")
+    pdf_paths = [(pdf_path, output_paths[pdf_path], dry_run) for pdf_path in unique_paths]
+
     pool_size = cpu_count() - 2 # leave 2 cores free for other tasks
     print(f"Using {pool_size} processes for multiprocessing.")
 
     with Pool(processes=pool_size) as pool:
-        results = list(tqdm(pool.starmap(redact_pdf, pdf_paths), total=total_pdfs))
+        results = list(tqdm(pool.starmap(redact_pdf, pdf_paths), total=len(pdf_paths)))
+    results += map_to_aliases(results, duplicates, output_paths, dry_run)
+    record_in_catalog(catalog, results, dry_run)
+    catalog.close()
 
     # Summary of results
     success_count = sum(1 for result in results if result['status'] == 'success')
@@ -257,13 +338,15 @@ def main():
     parser.add_argument('--output_folder', required=True, help='Path to output redacted PDFs folder.')
     parser.add_argument('--dry_run', action='store_true', help='Run in dry-run mode.')
     parser.add_argument('--log_file', default='reports/sensitive_data_log.txt', help='Path to the log file for dry-run mode.')
+    parser.add_argument('--dedup_file', default='reports/dedup.json', help='Content hashes and duplicate paths of the PDFs.')
+    parser.add_argument('--only_new', action='store_true', help='Skip PDFs the catalog lists as already redacted.')
     args = parser.parse_args()
 
     # Update logging configuration if log_file is provided
     if args.dry_run:
         logging.info("Running in dry-run mode. No PDFs will be modified.")
 
-    process_pdfs(args.input_folder, args.output_folder, args.dry_run, args.log_file)
+    process_pdfs(args.input_folder, args.output_folder, args.dry_run, args.log_file, args.dedup_file, args.only_new)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,19 +1,128 @@
 #!/usr/bin/env python3
 
 import os
+import time
 import argparse
 import ocrmypdf
-from multiprocessing import Pool, cpu_count
+from contextlib import contextmanager
+from multiprocessing import Pool, Condition, Value, cpu_count
 import tempfile
 import shutil
 import traceback
 import json  # Added to handle JSON data
+from dedup import DuplicateIndex, file_digest
+from ocr_journal import OcrJournal, DEFAULT_MAX_ATTEMPTS
+from catalog import open_catalog
+import page_scan
+import ocr_sidecar
 
 # Ensure /usr/local/bin is in the PATH (necessary for macOS and Homebrew)
 os.environ["PATH"] += os.pathsep + "/usr/local/bin"
 
+# Threads shared by all concurrent ocrmypdf calls: a condition and a counter of free threads
+_thread_budget = None
+
+def init_worker(condition, free_threads):
+    global _thread_budget
+    _thread_budget = (condition, free_threads)
+    # ocrmypdf runs one Tesseract per job; keep each of them single-threaded
+    os.environ['OMP_THREAD_LIMIT'] = '1'
+
+@contextmanager
+def reserve_threads(jobs):
+    """Wait until jobs threads of the budget are free and hold them while the block runs"""
+    if _thread_budget is None:
+        yield
+        return
+    condition, free_threads = _thread_budget
+    with condition:
+        while free_threads.value < jobs:
+            condition.wait()
+        free_threads.value -= jobs
+    try:
+        yield
+    finally:
+        with condition:
+            free_threads.value += jobs
+            condition.notify_all()
+
+def ocr_workload(pdf_path, entry):
+    """Number of pages ocrmypdf will OCR for a PDF, from the page map when it is listed"""
+    if entry:
+        if entry.get('ocr_pages') is not None:
+            return len(entry['ocr_pages'])
+        if entry.get('page_count'):
+            return entry['page_count']
+    return page_scan.count_pages(pdf_path)
+
+def schedule(ocr_args, workloads, threads, max_jobs):
+    """
+    Order OCR tasks largest first and give each a share of the thread budget.
+
+    A PDF gets one ocrmypdf job per page to OCR, up to max_jobs, so long
+    scans run on several cores while single pages run side by side.
+
+    Returns:
+        list: The OCR arguments with the number of jobs appended, largest PDF first.
+    """
+    max_jobs = max(1, min(max_jobs, threads))
+    ordered = sorted(zip(ocr_args, workloads), key=lambda item: item[1], reverse=True)
+    return [(*ocr_arg, max(1, min(pages, max_jobs))) for ocr_arg, pages in ordered]
+
 def ocr_pdf(args):
-    input_pdf, output_pdf, language, in_place = args
+    """
+    OCR one PDF once its jobs fit in the thread budget.
+
+    Returns:
+        tuple: (input_pdf, error, seconds, output_sha256); error is None on success.
+    """
+    input_pdf, output_pdf, language, mode, pages, jobs = args
+    with reserve_threads(jobs):
+        start_time = time.time()
+        if mode == 'sidecar':
+            error = run_ocrmypdf_sidecar(input_pdf, output_pdf, language, pages, jobs)
+        else:
+            error = run_ocrmypdf(input_pdf, output_pdf, language, mode == 'in_place', pages, jobs)
+        seconds = time.time() - start_time
+    output_digest = None if error else file_digest(input_pdf if mode == 'in_place' else output_pdf)
+    return input_pdf, error, seconds, output_digest
+
+def run_ocrmypdf_sidecar(input_pdf, sidecar, language, pages, jobs):
+    """
+    OCR one PDF into a text sidecar only.
+
+    No output PDF is written, so the image optimization that dominates a
+    full run is skipped. Pages are separated by form feeds, and pages that
+    already have a text layer hold ocrmypdf's '[OCR skipped on page N]'.
+    """
+    temp_sidecar = f"{sidecar}.tmp"
+    try:
+        ocrmypdf.ocr(
+            input_file=input_pdf,
+            output_file=os.devnull,
+            output_type='none',
+            sidecar=temp_sidecar,
+            language=language,
+            deskew=True,
+            rotate_pages=True,
+            rotate_pages_threshold=15,
+            skip_text=True,
+            pages=pages,
+            jobs=jobs,
+            progress_bar=False,
+        )
+        os.replace(temp_sidecar, sidecar)
+        print(f"Processed (sidecar): {input_pdf} -> {sidecar}")
+        return None
+    except Exception as e:
+        if os.path.exists(temp_sidecar):
+            os.remove(temp_sidecar)
+        print(f"Failed to process {input_pdf}: {e}")
+        traceback.print_exc()
+        return f"{type(e).__name__}: {e}"
+
+def run_ocrmypdf(input_pdf, output_pdf, language, in_place, pages, jobs):
+    """Run ocrmypdf on one PDF; returns None on success or the error message"""
     try:
         if in_place:
             # Create a temporary file in the same directory as the input PDF
@@ -30,17 +139,21 @@ def ocr_pdf(args):
                     rotate_pages=True,
                     rotate_pages_threshold=15,
                     skip_text=True,
+                    pages=pages,
+                    jobs=jobs,
                     progress_bar=False,
                 )
                 # After successful processing, replace the original file
                 shutil.move(temp_output_pdf, input_pdf)
                 print(f"Processed (in-place): {input_pdf}")
+                return None
             except Exception as e:
                 # Remove temporary file if processing failed
                 if os.path.exists(temp_output_pdf):
                     os.remove(temp_output_pdf)
                 print(f"Failed to process {input_pdf}: {e}")
                 traceback.print_exc()
+                return f"{type(e).__name__}: {e}"
         else:
             ocrmypdf.ocr(
                 input_file=input_pdf,
@@ -51,17 +164,47 @@ def ocr_pdf(args):
                 rotate_pages=True,
                 rotate_pages_threshold=15,
                 skip_text=True,
+                pages=pages,
+                jobs=jobs,
                 progress_bar=False,
             )
             print(f"Processed: {input_pdf} -> {output_pdf}")
+            return None
     except Exception as e:
         print(f"Failed to process {input_pdf}: {e}")
         traceback.print_exc()
+        return f"{type(e).__name__}: {e}"
+
+def copy_to_aliases(ocr_args, results, duplicates, output_dir):
+    """Give every duplicate copy of a successfully OCR'd PDF the same output"""
+    copied = 0
+    for (input_pdf, output_pdf, _, mode, *_), success in zip(ocr_args, results):
+        if not success:
+            continue
+        source = input_pdf if mode == 'in_place' else output_pdf
+        for alias in duplicates.aliases_of(input_pdf):
+            if mode == 'in_place':
+                target = alias
+            elif mode == 'sidecar':
+                target = ocr_sidecar.sidecar_path(alias)
+            else:
+                target = os.path.join(output_dir, os.path.basename(alias))
+            if os.path.abspath(target) == os.path.abspath(source):
+                continue
+            # Copy next to the target first so a crash never leaves a half-written PDF
+            temp_target = f"{target}.tmp"
+            shutil.copyfile(source, temp_target)
+            os.replace(temp_target, target)
+            copied += 1
+    return copied
 
 def main():
     parser = argparse.ArgumentParser(description="OCR unselectable PDFs")
     parser.add_argument(
-        '--metadata_file', required=True, help='Path to the JSON file containing unselectable PDF paths'
+        '--metadata_file', help='Path to the JSON file containing unselectable PDF paths'
+    )
+    parser.add_argument(
+        '--input_folder', help='Corpus root; OCR the PDFs the catalog lists without a text layer and not yet OCR\'d'
     )
     parser.add_argument(
         '--output_dir', help='Directory to save the processed PDFs (ignored if --in-place is used)'
@@ -72,61 +215,178 @@ def main():
     parser.add_argument(
         '--in-place', action='store_true', help='Replace the original PDFs in place'
     )
+    parser.add_argument(
+        '--sidecar_only', action='store_true',
+        help=f'Only write the OCR text next to each PDF as <name>.pdf{ocr_sidecar.SIDECAR_SUFFIX}, for the ingester; no PDF is written'
+    )
+    parser.add_argument(
+        '--page_map_file', help='Pages without a text layer per PDF, from ocr-check.py (default: page_map.json next to the metadata file)'
+    )
+    parser.add_argument(
+        '--threads', type=int, default=cpu_count(), help='Total OCR threads across all PDFs (default: number of cores)'
+    )
+    parser.add_argument(
+        '--max_jobs_per_pdf', type=int, default=max(1, cpu_count() // 4),
+        help='Most ocrmypdf jobs a single PDF may use (default: a quarter of the cores)'
+    )
+    parser.add_argument(
+        '--journal_file', help='Record of finished OCR jobs used to resume interrupted runs (default: ocr_journal.jsonl next to the metadata file)'
+    )
+    parser.add_argument(
+        '--max_attempts', type=int, default=DEFAULT_MAX_ATTEMPTS, help='Give up on a PDF after this many failed runs'
+    )
+    parser.add_argument(
+        '--dedup_file', help='Content hashes and duplicate paths of the PDFs (default: dedup.json next to the metadata file)'
+    )
     args = parser.parse_args()
 
     metadata_file = args.metadata_file
     output_dir = args.output_dir
     language = args.language
     in_place = args.in_place
+    mode = 'sidecar' if args.sidecar_only else 'in_place' if in_place else 'pdf'
 
-    # Read the list of PDF paths from the JSON file
-    try:
-        with open(metadata_file, 'r', encoding='utf-8') as f:
-            metadata = json.load(f)
-            pdf_paths = metadata.get('unselectable_pdfs', [])
-    except Exception as e:
-        print(f"Failed to read metadata file {metadata_file}: {e}")
+    catalog = None
+    if args.input_folder:
+        # The catalog tracks which PDFs lack a text layer and which were already OCR'd
+        catalog = open_catalog(args.input_folder)
+        pdf_paths = catalog.pdfs(selectable=False, ocr_done=False)
+        source = f"the catalog for {args.input_folder}"
+        reports_dir = os.path.dirname(catalog.path)
+    elif metadata_file:
+        # Read the list of PDF paths from the JSON file
+        try:
+            with open(metadata_file, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+                pdf_paths = metadata.get('unselectable_pdfs', [])
+        except Exception as e:
+            print(f"Failed to read metadata file {metadata_file}: {e}")
+            return
+        source = metadata_file
+        reports_dir = os.path.dirname(metadata_file)
+    else:
+        print("Error: either --input_folder or --metadata_file is required.")
         return
+    dedup_file = args.dedup_file or os.path.join(reports_dir, 'dedup.json')
+    # Only the pages without a text layer are OCR'd; PDFs missing from the map are OCR'd whole
+    page_map = page_scan.load_page_map(args.page_map_file or os.path.join(reports_dir, 'page_map.json'))
 
     if not pdf_paths:
-        print(f"No unselectable PDFs found in {metadata_file}. Exiting.")
+        print(f"No unselectable PDFs found in {source}. Exiting.")
         return
 
-    if not in_place:
+    if mode == 'pdf':
         if not output_dir:
             print("Error: --output_dir is required unless --in-place is specified.")
             return
         # Ensure output directory exists
         os.makedirs(output_dir, exist_ok=True)
 
-    # Prepare arguments for multiprocessing
-    ocr_args = []
+    existing_paths = []
     for pdf_path in pdf_paths:
         if not os.path.isfile(pdf_path):
             print(f"File not found: {pdf_path}. Skipping.")
             continue
-        if in_place:
+        existing_paths.append(pdf_path)
+
+    # OCR each unique file once; its copies get the result afterwards
+    duplicates = DuplicateIndex(dedup_file)
+    unique_paths = duplicates.dedupe(existing_paths)
+    if len(unique_paths) < len(existing_paths):
+        print(f"{len(existing_paths) - len(unique_paths)} PDFs are copies of others and will not be OCR'd separately.")
+
+    # Prepare arguments for multiprocessing
+    ocr_args = []
+    for pdf_path in unique_paths:
+        if mode == 'in_place':
             output_pdf = None  # Not used in in-place mode
+        elif mode == 'sidecar':
+            output_pdf = ocr_sidecar.sidecar_path(pdf_path)
         else:
             filename = os.path.basename(pdf_path)
             output_pdf = os.path.join(output_dir, filename)
-        ocr_args.append((pdf_path, output_pdf, language, in_place))
+        ocr_args.append((pdf_path, output_pdf, language, mode, page_scan.ocr_page_range(page_map.get(pdf_path))))
 
     if not ocr_args:
         print("No valid PDF files to process. Exiting.")
         return
 
-    # Use multiprocessing to speed up processing
-    pool_size = max(1, cpu_count()-2)  # Ensure at least 1 process
-    print(f"Using {pool_size} processes for OCR.")
+    # Files an earlier, interrupted run already OCR'd are skipped, as are files that kept failing
+    journal = OcrJournal(args.journal_file or os.path.join(reports_dir, 'ocr_journal.jsonl'), args.max_attempts)
+    input_digests = {}
+    finished_args = []
+    given_up = []
+    pending_args = []
+    for ocr_arg in ocr_args:
+        digest = input_digests[ocr_arg[0]] = duplicates.digest(ocr_arg[0])
+        if journal.completed(digest, ocr_arg[1]):
+            finished_args.append(ocr_arg)
+        elif journal.gave_up(digest):
+            given_up.append(ocr_arg[0])
+        else:
+            pending_args.append(ocr_arg)
+    if finished_args:
+        print(f"{len(finished_args)} PDFs were already OCR'd by an earlier run and are skipped.")
+    if given_up:
+        print(f"{len(given_up)} PDFs failed {args.max_attempts} times and are skipped; see {journal.path}.")
+    ocr_args = pending_args
+    partial_pdfs = sum(1 for ocr_arg in ocr_args if ocr_arg[4])
+    if partial_pdfs:
+        print(f"{partial_pdfs} PDFs will only have their pages without a text layer OCR'd.")
+
+    # Largest PDFs first, so a long scan does not start last and finish hours after the rest
+    workloads = [ocr_workload(ocr_arg[0], page_map.get(ocr_arg[0])) for ocr_arg in ocr_args]
+    threads = max(1, args.threads)
+    ocr_args = schedule(ocr_args, workloads, threads, args.max_jobs_per_pdf)
+    total_pages = sum(workloads)
+    print(f"Using {threads} OCR threads for {len(ocr_args)} PDFs ({total_pages} pages).")
 
     # For macOS, ensure 'spawn' is used and code is importable
     import multiprocessing
     multiprocessing.set_start_method('spawn', force=True)
 
-    with Pool(processes=pool_size) as pool:
-        pool.map(ocr_pdf, ocr_args)
+    # Every worker waits for its PDF's jobs to fit in the thread budget, so
+    # the ocrmypdf calls together never run more than --threads Tesseracts
+    condition = Condition()
+    free_threads = Value('i', threads, lock=False)
+    start_time = time.time()
+    outcomes = {}
+    output_paths = {ocr_arg[0]: ocr_arg[1] for ocr_arg in ocr_args}
+    try:
+        with Pool(processes=threads, initializer=init_worker, initargs=(condition, free_threads)) as pool:
+            for input_pdf, error, seconds, output_digest in pool.imap_unordered(ocr_pdf, ocr_args):
+                # Journaled as soon as each PDF finishes, so an interrupted run can resume
+                journal.record(input_pdf, input_digests[input_pdf], output_paths[input_pdf] or input_pdf,
+                               output_digest, 'failed' if error else 'done', seconds, error)
+                outcomes[input_pdf] = error is None
+    finally:
+        journal.close()
+    elapsed = time.time() - start_time
+    print(f"OCR'd {total_pages} pages in {elapsed / 60:.1f} minutes ({total_pages / max(elapsed, 1e-9):.2f} pages/s).")
+
+    # Outputs from earlier runs still need their copies and catalog entries
+    ocr_args = finished_args + ocr_args
+    results = [outcomes.get(ocr_arg[0], True) for ocr_arg in ocr_args]
+
+    copied = copy_to_aliases(ocr_args, results, duplicates, output_dir)
+    if copied:
+        print(f"Copied OCR output to {copied} duplicate PDFs.")
+    duplicates.save()
+
+    if catalog is not None:
+        done = duplicates.expand([ocr_arg[0] for ocr_arg, success in zip(ocr_args, results) if success])
+        if mode == 'in_place':
+            # The originals now carry a text layer, which the index does not hold yet
+            catalog.mark(done, ocr_done=True, selectable=True, indexed=False)
+        elif mode == 'sidecar':
+            # The ingester reads the new sidecar text in place of the empty text layer
+            catalog.mark(done, ocr_done=True, indexed=False)
+        else:
+            catalog.mark(done, ocr_done=True)
+        catalog.close()
 
+    print(f"OCR run summary: {journal.counts['done']} done, {journal.counts['failed']} failed, "
+          f"{len(finished_args)} already done, {len(given_up)} given up.")
     print("OCR processing completed.")
 
 if __name__ == "__main__":
@@ -0,0 +1,176 @@
+import os
+import time
+import zlib
+import sqlite3
+import hashlib
+import logging
+
+from dedup import file_digest, READ_BYTES
+
+try:
+    import pdfminer
+    PDFMINER_EXTRACTOR = f"pdfminer.six-{pdfminer.__version__}"
+except ImportError:
+    PDFMINER_EXTRACTOR = "pdfminer.six"
+
+# Shared by every script and the ingester; TEXT_CACHE_PATH=off disables the cache
+DEFAULT_CACHE_PATH = os.environ.get(
+    'TEXT_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'reports', 'text_cache.sqlite')
+)
+DEFAULT_MAX_MB = int(os.environ.get('TEXT_CACHE_MAX_MB', 4096))
+
+# Eviction is checked every EVICT_EVERY writes, and last_used is only
+# rewritten when older than TOUCH_SECONDS, to keep readers from writing
+EVICT_EVERY = 100
+TOUCH_SECONDS = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS texts (
+    digest TEXT NOT NULL,
+    extractor TEXT NOT NULL,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_used INTEGER NOT NULL,
+    PRIMARY KEY (digest, extractor)
+);
+CREATE INDEX IF NOT EXISTS texts_last_used ON texts (last_used);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    digest TEXT NOT NULL
+);
+"""
+
+
+class TextCache:
+    """
+    Extracted text keyed by file content hash and extractor version.
+
+    Texts are stored zlib-compressed in SQLite, so any number of worker
+    processes can read and write the same cache. When the stored texts grow
+    past max_mb, the least recently used ones are evicted. File hashes are
+    remembered per path, size and mtime, so unchanged files are not re-read.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_mb=DEFAULT_MAX_MB):
+        self.path = path
+        self.max_bytes = max_mb * 1024 * 1024
+        self.writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def file_hash(self, path):
+        """SHA-256 of a file, reusing the stored hash while size and mtime match"""
+        stat = os.stat(path)
+        path = os.path.abspath(path)
+        row = self.conn.execute("SELECT size, mtime, digest FROM files WHERE path = ?", (path,)).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime:
+            return row[2]
+        digest = file_digest(path)
+        self.conn.execute("INSERT OR REPLACE INTO files (path, size, mtime, digest) VALUES (?, ?, ?, ?)",
+                          (path, stat.st_size, stat.st_mtime, digest))
+        return digest
+
+    def get(self, digest, extractor=PDFMINER_EXTRACTOR):
+        row = self.conn.execute("SELECT data, last_used FROM texts WHERE digest = ? AND extractor = ?",
+                                (digest, extractor)).fetchone()
+        if row is None:
+            return None
+        now = int(time.time())
+        if now - row[1] > TOUCH_SECONDS:
+            self.conn.execute("UPDATE texts SET last_used = ? WHERE digest = ? AND extractor = ?",
+                              (now, digest, extractor))
+        return zlib.decompress(row[0]).decode('utf-8')
+
+    def put(self, digest, text, extractor=PDFMINER_EXTRACTOR):
+        data = zlib.compress(text.encode('utf-8'), 6)
+        self.conn.execute("INSERT OR REPLACE INTO texts (digest, extractor, data, size, last_used) "
+                          "VALUES (?, ?, ?, ?, ?)", (digest, extractor, data, len(data), int(time.time())))
+        self.writes += 1
+        if self.writes % EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        """Drop least recently used texts until the cache is back under 90% of its size limit"""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM texts").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = total - int(self.max_bytes * 0.9)
+        freed = 0
+        doomed = []
+        for rowid, size in self.conn.execute("SELECT rowid, size FROM texts ORDER BY last_used"):
+            doomed.append((rowid,))
+            freed += size
+            if freed >= target:
+                break
+        self.conn.executemany("DELETE FROM texts WHERE rowid = ?", doomed)
+        logging.info(f"Evicted {len(doomed)} texts ({freed / 1024 / 1024:.1f} MB) from the text cache")
+
+    def text(self, digest, extract, source, extractor=PDFMINER_EXTRACTOR):
+        """Cached text for digest, or extract(source) stored under it"""
+        text = self.get(digest, extractor)
+        if text is None:
+            text = extract(source)
+            self.put(digest, text, extractor)
+        return text
+
+    def close(self):
+        self.conn.close()
+
+
+# One connection per process, opened on first use
+_cache = None
+_cache_pid = None
+
+
+def get_cache():
+    """This process's cache, or None when TEXT_CACHE_PATH=off or the cache cannot be opened"""
+    global _cache, _cache_pid
+    if _cache_pid != os.getpid():
+        _cache_pid = os.getpid()
+        _cache = None
+        if DEFAULT_CACHE_PATH.lower() != 'off':
+            try:
+                _cache = TextCache()
+            except (sqlite3.Error, OSError) as e:
+                logging.warning(f"Text cache unavailable at {DEFAULT_CACHE_PATH}: {e}")
+    return _cache
+
+
+def cached_file_text(pdf_path, extract, extractor=PDFMINER_EXTRACTOR):
+    """
+    Text of a PDF on disk, extracted at most once per content and extractor.
+
+    Args:
+        pdf_path (str): Path to the PDF.
+        extract (callable): Extractor called with the path on a cache miss.
+            Exceptions propagate and nothing is cached.
+        extractor (str): Extractor name and version the text is stored under.
+
+    Returns:
+        str: The extracted text.
+    """
+    cache = get_cache()
+    if cache is None:
+        return extract(pdf_path)
+    return cache.text(cache.file_hash(pdf_path), extract, pdf_path, extractor)
+
+
+def cached_stream_text(fileobj, extract, extractor=PDFMINER_EXTRACTOR):
+    """Text of a PDF in a seekable file object; extract is called with the rewound object on a miss"""
+    cache = get_cache()
+    if cache is None:
+        return extract(fileobj)
+    h = hashlib.sha256()
+    fileobj.seek(0)
+    for block in iter(lambda: fileobj.read(READ_BYTES), b''):
+        h.update(block)
+    fileobj.seek(0)
+    return cache.text(h.hexdigest(), extract, fileobj, extractor)
@@ -0,0 +1,32 @@
+# spaCy memory grows with the length of each Doc, so long texts are parsed
+# in pieces of at most this many characters
+MAX_CHUNK_CHARS = 100000
+
+# Preferred places to cut, from coarsest to finest
+SEPARATORS = ('\f', '\n\n', '\n', ' ')
+
+
+def split_text(text, max_chars=MAX_CHUNK_CHARS):
+    """
+    Cut a text into chunks of at most max_chars characters.
+
+    Each cut is made at the last page break in the second half of the
+    window, failing that the last paragraph, line or word break, so
+    entities are rarely split. Runs in linear time.
+
+    Yields:
+        str: The chunks, in order; joined they give back the text.
+    """
+    start = 0
+    while len(text) - start > max_chars:
+        end = start + max_chars
+        cut = end
+        for separator in SEPARATORS:
+            position = text.rfind(separator, start + max_chars // 2, end)
+            if position != -1:
+                cut = position + len(separator)
+                break
+        yield text[start:cut]
+        start = cut
+    if start < len(text):
+        yield text[start:]
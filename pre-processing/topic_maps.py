@@ -0,0 +1,115 @@
+import logging
+
+import numpy as np
+from sklearn.manifold import TSNE
+from umap import UMAP
+
+try:
+    from openTSNE import TSNE as OpenTSNE
+    OPENTSNE_AVAILABLE = True
+except ImportError:
+    OPENTSNE_AVAILABLE = False
+
+# Documents t-SNE is fitted on; the rest are placed into the fitted map.
+# openTSNE's FFT-accelerated gradients are linear in the number of points,
+# sklearn's Barnes-Hut ones are not, so it gets a smaller sample.
+OPENTSNE_SAMPLE = 100_000
+SKLEARN_TSNE_SAMPLE = 10_000
+
+# Fitted neighbours a placed document is averaged over, and query rows per block
+PLACE_NEIGHBOURS = 10
+PLACE_BLOCK_ROWS = 256
+
+
+def umap_layout(umap_model, embeddings):
+    """
+    2-D UMAP coordinates of the documents, reusing BERTopic's reduction.
+
+    BERTopic's UMAP is fitted on the same embeddings, so its embedding_ is
+    the layout and nothing is refitted. A UMAP fitted on other documents
+    places these with its transform. Only a topic model that reduces to
+    more than two dimensions needs a separate 2-D UMAP.
+    """
+    points = getattr(umap_model, 'embedding_', None)
+    if points is None or len(points) != len(embeddings):
+        points = umap_model.transform(embeddings)
+    points = np.asarray(points)
+    if points.ndim != 2 or points.shape[1] != 2:
+        logging.info("Topic model reduces to more than 2 dimensions; fitting a 2-D UMAP for the map")
+        points = UMAP(n_components=2, metric='cosine').fit_transform(embeddings)
+    return points
+
+
+def place_points(fitted_embeddings, fitted_points, embeddings, k=PLACE_NEIGHBOURS):
+    """
+    Place documents into an existing 2-D map at the weighted mean of their nearest fitted documents.
+
+    Neighbours are found by cosine similarity, in blocks of rows so the
+    similarity matrix is never held whole.
+    """
+    def unit(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    fitted_embeddings = unit(fitted_embeddings)
+    embeddings = unit(embeddings)
+    k = min(k, len(fitted_embeddings))
+    points = np.zeros((len(embeddings), fitted_points.shape[1]))
+    for start in range(0, len(embeddings), PLACE_BLOCK_ROWS):
+        similarities = embeddings[start:start + PLACE_BLOCK_ROWS] @ fitted_embeddings.T
+        nearest = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        weights = np.maximum(np.take_along_axis(similarities, nearest, axis=1), 1e-6)
+        points[start:start + PLACE_BLOCK_ROWS] = (
+            (weights[:, :, None] * fitted_points[nearest]).sum(axis=1) / weights.sum(axis=1, keepdims=True)
+        )
+    return points
+
+
+def umap_place(umap_model, fitted_embeddings, fitted_points, embeddings):
+    """2-D UMAP coordinates of documents the topic model was not fitted on"""
+    if getattr(umap_model, 'n_components', None) == 2:
+        return np.asarray(umap_model.transform(embeddings))
+    return place_points(fitted_embeddings, fitted_points, embeddings)
+
+
+def tsne_layout(embeddings, seed=42):
+    """
+    2-D t-SNE coordinates of the documents.
+
+    With openTSNE installed the map is fitted with FFT-accelerated
+    gradients on up to OPENTSNE_SAMPLE documents, and openTSNE places the
+    rest into it. Otherwise sklearn's TSNE is fitted on up to
+    SKLEARN_TSNE_SAMPLE documents and the rest are placed by place_points.
+
+    Returns:
+        numpy.ndarray: One (x, y) row per document.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    n = len(embeddings)
+    if n < 2:
+        return np.zeros((n, 2))
+    sample_size = OPENTSNE_SAMPLE if OPENTSNE_AVAILABLE else SKLEARN_TSNE_SAMPLE
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(n, sample_size, replace=False)) if n > sample_size else np.arange(n)
+    rest = np.setdiff1d(np.arange(n), sample)
+    # Both libraries need fewer neighbours than points
+    perplexity = min(30.0, max((len(sample) - 1) / 3, 1.0))
+
+    points = np.zeros((n, 2))
+    if OPENTSNE_AVAILABLE:
+        model = OpenTSNE(perplexity=perplexity, metric='cosine', negative_gradient_method='fft',
+                         n_jobs=-1, random_state=seed).fit(embeddings[sample])
+        points[sample] = np.asarray(model)
+        if len(rest):
+            points[rest] = np.asarray(model.transform(embeddings[rest]))
+        return points
+
+    if n > sample_size:
+        logging.info(f"Fitting t-SNE on {sample_size} of {n} documents; "
+                     "install openTSNE (pip install openTSNE) to fit larger maps")
+    points[sample] = TSNE(n_components=2, perplexity=perplexity, metric='cosine', init='pca',
+                          random_state=seed).fit_transform(embeddings[sample])
+    if len(rest):
+        points[rest] = place_points(embeddings[sample], points[sample], embeddings[rest])
+    return points
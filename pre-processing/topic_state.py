@@ -0,0 +1,108 @@
+import os
+import json
+from datetime import datetime
+
+import numpy as np
+
+# Refit when documents placed since the last fit match the topics this
+# much worse than the fitted ones did (relative drop in mean similarity
+# to the nearest topic centroid)...
+DRIFT_THRESHOLD = 0.1
+
+# ...or when they make up more than this share of the corpus
+MAX_PLACED_SHARE = 0.5
+
+
+def unit_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def topic_centroids(embeddings, topics):
+    """Unit-length mean embedding of each topic, outliers (-1) left out, as (topic ids, centroids)"""
+    topics = np.asarray(topics)
+    ids = np.unique(topics[topics >= 0])
+    if not len(ids):
+        return ids, np.zeros((0, embeddings.shape[1]), dtype=np.float32)
+    embeddings = unit_rows(embeddings)
+    return ids, unit_rows([embeddings[topics == topic].mean(axis=0) for topic in ids])
+
+
+def centroid_fit(embeddings, centroids):
+    """Mean cosine similarity of documents to their nearest topic centroid"""
+    if not len(embeddings) or not len(centroids):
+        return 0.0
+    return float((unit_rows(embeddings) @ centroids.T).max(axis=1).mean())
+
+
+class TopicState:
+    """
+    Topic assignments and map coordinates of every document, from the last run.
+
+    Documents are keyed by the SHA-256 of their text, as in the embedding
+    store. fitted marks the documents the saved topic model was fitted on;
+    the others were assigned topics and placed on the maps afterwards.
+    Topic centroids and their fit to the fitted documents are kept to
+    measure how far the placed documents have drifted from the topics.
+    """
+
+    def __init__(self, digests, topics, umap_points, tsne_points, fitted, centroids, baseline,
+                 store_name, fitted_at=None):
+        self.digests = list(digests)
+        self.topics = np.asarray(topics, dtype=np.int64)
+        self.umap_points = np.asarray(umap_points, dtype=np.float64)
+        self.tsne_points = np.asarray(tsne_points, dtype=np.float64)
+        self.fitted = np.asarray(fitted, dtype=bool)
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.baseline = float(baseline)
+        self.store_name = store_name
+        self.fitted_at = fitted_at or datetime.now().isoformat(timespec='seconds')
+
+    @classmethod
+    def fit(cls, digests, topics, umap_points, tsne_points, embeddings, store_name):
+        """State after a full fit on all documents"""
+        _, centroids = topic_centroids(embeddings, topics)
+        return cls(digests, topics, umap_points, tsne_points, np.ones(len(digests), dtype=bool),
+                   centroids, centroid_fit(embeddings, centroids), store_name)
+
+    @property
+    def model_file(self):
+        """Topic model saved with this fit; named by fit time, so a state never loads another fit's model"""
+        return f"bertopic_{self.fitted_at.replace(':', '').replace('-', '')}.pkl"
+
+    def positions(self, digests):
+        """Row of each digest in this state, -1 for documents it does not hold"""
+        rows = {digest: row for row, digest in enumerate(self.digests)}
+        return np.array([rows.get(digest, -1) for digest in digests], dtype=np.int64)
+
+    def drift(self, placed_embeddings):
+        """Relative drop in centroid fit of placed documents against the fitted ones; 0 if they fit as well"""
+        if not len(placed_embeddings) or self.baseline <= 0:
+            return 0.0
+        return max(0.0, (self.baseline - centroid_fit(placed_embeddings, self.centroids)) / self.baseline)
+
+    def save(self, directory):
+        """Write the state to state.npz, under a temporary name first"""
+        os.makedirs(directory, exist_ok=True)
+        meta = {'store_name': self.store_name, 'fitted_at': self.fitted_at,
+                'updated_at': datetime.now().isoformat(timespec='seconds')}
+        path = os.path.join(directory, 'state.npz')
+        with open(f"{path}.tmp", 'wb') as f:
+            np.savez_compressed(
+                f, digests=np.array(self.digests, dtype='U64'), topics=self.topics,
+                umap_points=self.umap_points, tsne_points=self.tsne_points, fitted=self.fitted,
+                centroids=self.centroids, baseline=np.array(self.baseline), meta=np.array(json.dumps(meta))
+            )
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, directory):
+        """The saved state, or None if there is none"""
+        path = os.path.join(directory, 'state.npz')
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as f:
+            meta = json.loads(str(f['meta']))
+            return cls(f['digests'].tolist(), f['topics'], f['umap_points'], f['tsne_points'], f['fitted'],
+                       f['centroids'], float(f['baseline']), meta['store_name'], meta['fitted_at'])
@@ -10,19 +10,27 @@ import pickle
 from pathlib import Path
 from multiprocessing import Pool, cpu_count
 from pdfminer.high_level import extract_text
+import text_cache
+from catalog import open_catalog
+from text_chunks import split_text
 
-# Load spaCy model
+# Load spaCy model; long texts are parsed in chunks, so the default max_length is kept
 nlp = spacy.load("en_core_web_sm")
-nlp.max_length = 10000000
+
+# Text chunks per nlp.pipe batch
+PIPE_BATCH_SIZE = 8
 
 def find_pdf_files(directory):
-    """Recursively find all PDF files in the directory"""
-    return list(Path(directory).rglob("*.pdf"))
+    """Find all PDF files in the directory, as listed by the corpus catalog"""
+    catalog = open_catalog(directory)
+    pdf_files = [Path(path) for path in catalog.pdfs()]
+    catalog.close()
+    return pdf_files
 
 def extract_pdf_text(pdf_path):
     """Extract text from a PDF file"""
     try:
-        text = extract_text(pdf_path)
+        text = text_cache.cached_file_text(str(pdf_path), extract_text)
         return text.strip() if text else ""
     except Exception as e:
         print(f"Error extracting text from {pdf_path}: {str(e)}")
@@ -63,8 +71,10 @@ def process_pdf_batch(pdf_paths):
         if text:
             texts.append(text)
     
-    # Process all texts in batch using spaCy's pipe
-    for doc in nlp.pipe(texts, batch_size=len(texts)):
+    # Stream the texts through spaCy's pipe in bounded chunks; the counts are
+    # sums over words, so they do not depend on where a text is cut
+    chunks = (chunk for text in texts for chunk in split_text(text))
+    for doc in nlp.pipe(chunks, batch_size=PIPE_BATCH_SIZE):
         words, entities, relations = process_document(doc)
         word_freq.update(words)
         entity_freq.update(entities)